@@ -0,0 +1,75 @@
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework.response import Response
+
+
+def _version_key(namespace):
+    return f'{namespace}:version'
+
+
+def _modified_key(namespace):
+    return f'{namespace}:modified'
+
+
+def get_version(namespace):
+    """Current version of ``namespace`` and the time it was last bumped."""
+    keys = (_version_key(namespace), _modified_key(namespace))
+    found = cache.get_many(keys)
+    if len(found) < 2:
+        now = int(time.time())
+        # add() is a no-op when the key exists, so concurrent first readers agree.
+        cache.add(keys[0], 1, timeout=None)
+        cache.add(keys[1], now, timeout=None)
+        found = cache.get_many(keys)
+    return found.get(keys[0], 1), found.get(keys[1], int(time.time()))
+
+
+def bump_version(namespace):
+    """Invalidate every page cached under ``namespace`` and return the new version."""
+    try:
+        version = cache.incr(_version_key(namespace))
+    except ValueError:
+        version = 2
+        cache.set(_version_key(namespace), version, timeout=None)
+    cache.set(_modified_key(namespace), int(time.time()), timeout=None)
+    return version
+
+
+def cached_page(namespace, params, build, timeout=300):
+    """Read-through cache for a page keyed by namespace version and request params.
+
+    ``build`` is called on a miss and must return JSON-serialisable data.
+    Returns ``(data, etag, last_modified)``. The ETag is a hash of the payload
+    and Last-Modified is when that payload was built, so the validators change
+    whenever the content does, whether or not the namespace was bumped.
+    """
+    version, _ = get_version(namespace)
+    digest = hashlib.md5(repr(sorted(params.items())).encode()).hexdigest()[:16]
+    key = f'{namespace}:v{version}:{digest}'
+    entry = cache.get(key)
+    if entry is None:
+        data = build()
+        payload = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+        entry = {'data': data, 'etag': hashlib.sha1(payload.encode()).hexdigest(), 'modified': int(time.time())}
+        cache.set(key, entry, timeout)
+    return entry['data'], entry['etag'], entry['modified']
+
+
+def conditional_response(request, data, etag, last_modified, max_age=60):
+    """Return a 304 when the client's validators still match, else the full body."""
+    etag = quote_etag(etag)
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        not_modified = etag in [t.strip() for t in if_none_match.split(',')] or if_none_match.strip() == '*'
+    else:
+        since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        not_modified = since is not None and last_modified <= since
+    response = Response(status=304) if not_modified else Response(data)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = f'public, max-age={max_age}'
+    return response
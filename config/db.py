@@ -0,0 +1,32 @@
+from django.db import connection
+
+
+def _upsert_sql(table, columns, conflict_columns, row_count, increment, replace):
+    qn = connection.ops.quote_name
+    table = qn(table)
+    row = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    sql = f'INSERT INTO {table} ({", ".join(qn(c) for c in columns)}) VALUES {", ".join([row] * row_count)}'
+    if connection.vendor == 'mysql':
+        updates = [f'{qn(c)} = {qn(c)} + VALUES({qn(c)})' for c in increment]
+        updates += [f'{qn(c)} = VALUES({qn(c)})' for c in replace]
+        return f'{sql} ON DUPLICATE KEY UPDATE {", ".join(updates)}'
+    # SQLite (3.24+) and PostgreSQL share the ON CONFLICT form.
+    updates = [f'{qn(c)} = {table}.{qn(c)} + excluded.{qn(c)}' for c in increment]
+    updates += [f'{qn(c)} = excluded.{qn(c)}' for c in replace]
+    return f'{sql} ON CONFLICT ({", ".join(qn(c) for c in conflict_columns)}) DO UPDATE SET {", ".join(updates)}'
+
+
+def bulk_upsert(table, columns, conflict_columns, rows, increment=(), replace=(), batch_size=500):
+    """Insert ``rows`` (tuples in ``columns`` order), merging into existing keys.
+
+    Columns in ``increment`` are added to the stored value, columns in
+    ``replace`` overwrite it. Runs one multi-row statement per batch on the
+    caller's connection; wrap it in a transaction for all-or-nothing.
+    """
+    rows = list(rows)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            sql = _upsert_sql(table, columns, conflict_columns, len(batch), increment, replace)
+            cursor.execute(sql, [value for row in batch for value in row])
+    return len(rows)
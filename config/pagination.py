@@ -0,0 +1,100 @@
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def parse_limit(request, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        limit = int(request.query_params.get('limit', default))
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, maximum))
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return the list of key values stored in ``token`` or None if it is unusable."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def _coerce(model, keys, values):
+    """Convert cursor ``values`` to each key's field type, or None if any of them doesn't fit.
+
+    Cursors come back from the client, so a tampered value must not reach the
+    query as something the field cannot compare against.
+    """
+    if len(values) != len(keys):
+        return None
+    coerced = []
+    for key, value in zip(keys, values):
+        if value is None or isinstance(value, (list, dict)):
+            return None
+        try:
+            field = model._meta.get_field(key)
+        except FieldDoesNotExist:
+            coerced.append(value)
+            continue
+        try:
+            value = field.to_python(value)
+            field.run_validators(value)
+        except (ValidationError, TypeError, ValueError, ArithmeticError):
+            return None
+        coerced.append(value)
+    return coerced
+
+
+def _after(keys, values, descending):
+    # (a, b) > (x, y)  ==  a > x OR (a = x AND b > y), which the DB can
+    # answer as a range scan on a composite index over the same columns.
+    op = 'lt' if descending else 'gt'
+    condition = Q()
+    for i, key in enumerate(keys):
+        step = Q(**{f'{key}__{op}': values[i]})
+        for prev_key, prev_value in zip(keys[:i], values[:i]):
+            step &= Q(**{prev_key: prev_value})
+        condition |= step
+    return condition
+
+
+def _key_of(row, keys):
+    if isinstance(row, dict):
+        return [row[k] for k in keys]
+    return [getattr(row, k) for k in keys]
+
+
+def keyset_page(qs, keys, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=False):
+    """Fetch one page of ``qs`` ordered by ``keys`` starting after ``cursor``.
+
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    The last key must be unique (usually the primary key) so pages never overlap.
+    A cursor that does not decode to values of the key types starts from the first page.
+    """
+    values = decode_cursor(cursor)
+    if values is not None:
+        values = _coerce(qs.model, keys, values)
+    if values is not None:
+        qs = qs.filter(_after(keys, values, descending))
+    prefix = '-' if descending else ''
+    rows = list(qs.order_by(*[prefix + k for k in keys])[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(_key_of(rows[-1], keys))
+    return rows, next_cursor
@@ -76,6 +76,30 @@ DATABASES = {
     }
 }
 
+# Page caches, their version counters, shop settings and seller permissions
+# are read on nearly every request, so they belong in a shared in-memory store:
+# set REDIS_URL (or CACHE_BACKEND/CACHE_LOCATION for memcached) in production.
+# Version keys are stored without a timeout and must never be evicted, so give
+# Redis a maxmemory-policy of volatile-lru. Without either setting each process
+# gets its own LocMemCache, which is only fit for a single dev server.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+            'LOCATION': os.environ.get('CACHE_LOCATION', 'shop-backend'),
+            # Django culls a third of the keys once MAX_ENTRIES (default 300) is
+            # reached, version counters included; keep the cap well above the working set.
+            'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 100000))},
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
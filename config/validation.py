@@ -0,0 +1,23 @@
+# Upper bounds of the MySQL column types request values end up in: primary
+# keys are BIGINT, counters and quantities INT.
+MAX_ID = 2 ** 63 - 1
+MAX_INT = 2 ** 31 - 1
+
+
+def positive_int(value, field, maximum=MAX_ID):
+    """``value`` as an int in [1, maximum]; raises ValueError naming ``field`` otherwise.
+
+    Booleans and non-integral floats are refused rather than coerced, so
+    ``true`` or ``1.5`` in a JSON body cannot pass for an id.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f'{field} must be a positive integer')
+    try:
+        number = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f'{field} must be a positive integer')
+    if isinstance(value, float) and number != value:
+        raise ValueError(f'{field} must be a positive integer')
+    if not 0 < number <= maximum:
+        raise ValueError(f'{field} must be a positive integer')
+    return number
@@ -48,9 +48,13 @@ CREATE TABLE shops (
 CREATE INDEX idx_shops_owner_id ON shops(owner_id);
 -- Index on shop_slug is created automatically by the UNIQUE constraint.
 -- Index on status for efficient filtering of shops by their status (e.g., finding all pending shops).
-CREATE INDEX idx_shops_status ON shops(status);
+-- created_at and shop_id let the admin board page through one status in index order.
+CREATE INDEX idx_shops_status ON shops(status, created_at, shop_id);
 -- Full-text index for searching shop names and descriptions. Crucial for user-facing search functionality.
 CREATE FULLTEXT INDEX ft_shops_name_description ON shops(shop_name, description);
+-- Public directory: approved shops in name order, optionally narrowed by location.
+CREATE INDEX idx_shops_status_name ON shops(status, shop_name, shop_id);
+CREATE INDEX idx_shops_status_location ON shops(status, country, state, city);
 
 
 -- Table: shop_categories
@@ -85,6 +89,9 @@ CREATE TABLE shop_category_assignments (
     UNIQUE KEY uk_shop_category (shop_id, category_id)
 );
 
+-- Reverse lookup for "shops in category X" (the unique key leads with shop_id).
+CREATE INDEX idx_shop_category_assignments_category ON shop_category_assignments(category_id, shop_id);
+
 
 -- Table: shop_policies
 -- Stores various policy documents for a shop.
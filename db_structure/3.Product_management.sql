@@ -34,6 +34,29 @@ CREATE INDEX idx_categories_parent_category_id ON categories(parent_category_id)
 CREATE INDEX idx_categories_is_active ON categories(is_active);
 
 
+-- Table: category_closure
+-- Materialized closure of the category tree: one row per (ancestor, descendant) pair,
+-- including each category paired with itself at depth 0. Lets "everything under X"
+-- be a single indexed join instead of one query per tree level.
+CREATE TABLE category_closure (
+    closure_id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    ancestor_id BIGINT UNSIGNED NOT NULL,
+    descendant_id BIGINT UNSIGNED NOT NULL,
+    depth INT UNSIGNED NOT NULL,
+
+    UNIQUE KEY uk_category_closure_pair (ancestor_id, descendant_id),
+    CONSTRAINT fk_category_closure_ancestor
+        FOREIGN KEY (ancestor_id) REFERENCES categories(category_id)
+        ON DELETE CASCADE,
+    CONSTRAINT fk_category_closure_descendant
+        FOREIGN KEY (descendant_id) REFERENCES categories(category_id)
+        ON DELETE CASCADE
+);
+
+-- Index for walking up from a category to its ancestors (breadcrumbs, moves).
+CREATE INDEX idx_category_closure_descendant ON category_closure(descendant_id, depth);
+
+
 -- Table: products
 -- The main table for storing core product information.
 CREATE TABLE products (
@@ -48,7 +71,10 @@ CREATE TABLE products (
     -- Stock Keeping Unit, should be unique per shop.
     sku VARCHAR(100),
     brand VARCHAR(100),
-    status ENUM('draft', 'active', 'inactive', 'archived') NOT NULL DEFAULT 'draft',
+    -- pending..modification are the moderation states the admin board and the
+    -- seller import use; only 'approved' products are visible in the catalog.
+    -- Existing databases: ALTER TABLE products MODIFY status ENUM(<same list>) NOT NULL DEFAULT 'draft';
+    status ENUM('draft', 'pending', 'approved', 'rejected', 'flagged', 'modification', 'active', 'inactive', 'archived') NOT NULL DEFAULT 'draft',
     featured BOOLEAN NOT NULL DEFAULT FALSE,
     created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
@@ -71,7 +97,10 @@ CREATE TABLE products (
 -- Indexes for filtering products by shop, category, and status.
 CREATE INDEX idx_products_shop_id ON products(shop_id);
 CREATE INDEX idx_products_category_id ON products(category_id);
-CREATE INDEX idx_products_status ON products(status);
+-- Status leads so the moderation board can keyset-page each status by (updated_at, product_id).
+CREATE INDEX idx_products_status ON products(status, updated_at, product_id);
+-- Lets incremental jobs (shop statistics) find products changed since their last run.
+CREATE INDEX idx_products_updated_at ON products(updated_at);
 -- Full-text index for powerful product search.
 CREATE FULLTEXT INDEX ft_products_name_desc ON products(product_name, description, short_description);
 
@@ -185,6 +214,23 @@ CREATE TABLE product_inventory (
 );
 
 
+-- Table: stock_reservations
+-- One row per successful reserve call. Commit and release name the reservation
+-- instead of raw variant ids, so only the holder can act on its stock, and the
+-- held -> committed/released transition makes a retried request a no-op.
+CREATE TABLE stock_reservations (
+    reservation_id CHAR(32) PRIMARY KEY,
+    user_id BIGINT UNSIGNED NOT NULL,
+    -- [[variant_id, quantity], ...] in variant-id order.
+    lines_json JSON NOT NULL,
+    status ENUM('held', 'committed', 'released') NOT NULL DEFAULT 'held',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    closed_at TIMESTAMP NULL
+);
+
+CREATE INDEX idx_stock_reservations_user ON stock_reservations(user_id, status);
+
+
 -- Table: product_reviews_summary
 -- Denormalized table to hold aggregated review data for fast retrieval on product pages.
 CREATE TABLE product_reviews_summary (
@@ -202,3 +248,33 @@ CREATE TABLE product_reviews_summary (
         FOREIGN KEY (product_id) REFERENCES products(product_id)
         ON DELETE CASCADE
 );
+
+
+-- Table: product_listings
+-- One denormalized row per product with everything a catalog list page sorts
+-- or filters on, so price sorting and in-stock filtering are index range scans
+-- instead of MIN/MAX aggregates over product_variants at query time.
+-- Maintained by the application whenever products, variants, inventory or images change.
+CREATE TABLE product_listings (
+    product_id BIGINT UNSIGNED PRIMARY KEY,
+    shop_id BIGINT UNSIGNED NOT NULL,
+    category_id BIGINT UNSIGNED NOT NULL,
+    status VARCHAR(12) NOT NULL,
+    product_name VARCHAR(255) NOT NULL,
+    product_slug VARCHAR(255) NOT NULL,
+    min_price DECIMAL(10, 2),
+    max_price DECIMAL(10, 2),
+    default_variant_id BIGINT UNSIGNED,
+    in_stock BOOLEAN NOT NULL DEFAULT FALSE,
+    primary_image_url VARCHAR(2048),
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT fk_product_listings_product
+        FOREIGN KEY (product_id) REFERENCES products(product_id)
+        ON DELETE CASCADE
+);
+
+-- Indexes for product_listings: each list sort is a range scan for a status.
+CREATE INDEX idx_product_listings_price ON product_listings(status, min_price, product_id);
+CREATE INDEX idx_product_listings_stock_price ON product_listings(status, in_stock, min_price, product_id);
+CREATE INDEX idx_product_listings_category ON product_listings(category_id, status, product_id);
@@ -36,10 +36,12 @@ CREATE TABLE orders (
 
 -- Indexes for orders
 -- Index for finding all orders by a specific customer.
-CREATE INDEX idx_orders_customer_id ON orders(customer_id);
+CREATE INDEX idx_orders_customer_id ON orders(customer_id, order_date);
 -- Index on status for efficient querying of orders based on their current state (e.g., all 'processing' orders).
-CREATE INDEX idx_orders_status ON orders(status);
+CREATE INDEX idx_orders_status ON orders(status, order_date);
 -- Index on order_date for time-based reporting and analysis.
+-- With the implicit primary key suffix it also serves the (order_date, order_id) keyset order list;
+-- the customer and status indexes above carry order_date for the same reason.
 CREATE INDEX idx_orders_order_date ON orders(order_date);
 
 
@@ -79,7 +81,10 @@ CREATE TABLE order_items (
 -- Indexes for order_items
 CREATE INDEX idx_order_items_order_id ON order_items(order_id);
 CREATE INDEX idx_order_items_product_id ON order_items(product_id);
-CREATE INDEX idx_order_items_shop_id ON order_items(shop_id);
+-- status second so a shop's open items are one range scan (seller dashboard).
+CREATE INDEX idx_order_items_shop_id ON order_items(shop_id, status);
+-- Daily shop rollups read one day of items at a time.
+CREATE INDEX idx_order_items_created_at ON order_items(created_at);
 
 
 -- Table: order_addresses
@@ -92,6 +92,8 @@ CREATE TABLE commissions (
 -- Indexes for commissions
 CREATE INDEX idx_commissions_shop_id_status ON commissions(shop_id, status);
 CREATE INDEX idx_commissions_order_id ON commissions(order_id);
+-- Daily shop rollups read one day of commissions at a time.
+CREATE INDEX idx_commissions_calculated_at ON commissions(calculated_at);
 
 
 -- Table: payouts
@@ -20,6 +20,13 @@ CREATE TABLE reviews (
     -- A crucial flag to indicate if the reviewer actually purchased the item.
     is_verified_purchase BOOLEAN NOT NULL DEFAULT FALSE,
     status ENUM('pending', 'approved', 'rejected') NOT NULL DEFAULT 'pending',
+    -- Denormalized from review_votes so "most helpful" sorting needs no per-request COUNT.
+    helpful_count INT UNSIGNED NOT NULL DEFAULT 0,
+    unhelpful_count INT UNSIGNED NOT NULL DEFAULT 0,
+    helpful_score INT NOT NULL DEFAULT 0, -- helpful_count - unhelpful_count
+    -- Moderation queue lease: which moderator holds this pending review, and until when.
+    leased_by VARCHAR(255),
+    leased_until TIMESTAMP NULL,
     created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
 
@@ -42,9 +49,13 @@ CREATE TABLE reviews (
 );
 
 -- Indexes for reviews
-CREATE INDEX idx_reviews_product_id_status ON reviews(product_id, status);
-CREATE INDEX idx_reviews_shop_id_status ON reviews(shop_id, status);
+-- The trailing sort column lets review pages be read in index order (review_id is implied by InnoDB).
+CREATE INDEX idx_reviews_product_id_status ON reviews(product_id, status, created_at);
+CREATE INDEX idx_reviews_product_id_status_helpful ON reviews(product_id, status, helpful_score);
+CREATE INDEX idx_reviews_shop_id_status ON reviews(shop_id, status, created_at);
+CREATE INDEX idx_reviews_shop_id_status_helpful ON reviews(shop_id, status, helpful_score);
 CREATE INDEX idx_reviews_customer_id ON reviews(customer_id);
+CREATE INDEX idx_reviews_status_created_at ON reviews(status, created_at);
 
 
 -- Table: review_images
@@ -162,6 +173,9 @@ CREATE TABLE rating_summaries (
     UNIQUE KEY uk_rating_summary_shop (shop_id)
 );
 
+-- Lets incremental jobs (shop statistics) pick up summaries changed since their last run.
+CREATE INDEX idx_rating_summaries_last_updated_at ON rating_summaries(last_updated_at);
+
 
 -- Table: review_moderation
 -- Creates an audit trail for all moderation actions on reviews.
@@ -246,3 +246,55 @@ BEGIN
 END$$
 
 DELIMITER ;
+
+
+-- Table: job_watermarks
+-- Progress markers for incremental batch jobs, so each run resumes from
+-- where the previous one stopped instead of rescanning history.
+CREATE TABLE job_watermarks (
+    job_name VARCHAR(100) PRIMARY KEY,
+    position BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+
+-- Table: product_copurchase_counts
+-- Sparse, symmetric co-purchase matrix stored once per unordered pair
+-- (product_a_id < product_b_id). Updated incrementally from new orders.
+CREATE TABLE product_copurchase_counts (
+    pair_id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    product_a_id BIGINT UNSIGNED NOT NULL,
+    product_b_id BIGINT UNSIGNED NOT NULL,
+    order_count INT UNSIGNED NOT NULL DEFAULT 0,
+
+    UNIQUE KEY uk_copurchase_pair (product_a_id, product_b_id),
+    CONSTRAINT fk_copurchase_product_a
+        FOREIGN KEY (product_a_id) REFERENCES products(product_id)
+        ON DELETE CASCADE,
+    CONSTRAINT fk_copurchase_product_b
+        FOREIGN KEY (product_b_id) REFERENCES products(product_id)
+        ON DELETE CASCADE
+);
+
+-- Reverse lookup so a product's neighbours can be read from either side of the pair.
+CREATE INDEX idx_copurchase_product_b ON product_copurchase_counts(product_b_id);
+
+
+-- Table: product_recommendations
+-- Precomputed top-K "frequently bought together" neighbours per product.
+CREATE TABLE product_recommendations (
+    recommendation_id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    product_id BIGINT UNSIGNED NOT NULL,
+    related_product_id BIGINT UNSIGNED NOT NULL,
+    score INT UNSIGNED NOT NULL,
+    `rank` SMALLINT UNSIGNED NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    UNIQUE KEY uk_recommendation_rank (product_id, `rank`),
+    CONSTRAINT fk_recommendations_product
+        FOREIGN KEY (product_id) REFERENCES products(product_id)
+        ON DELETE CASCADE,
+    CONSTRAINT fk_recommendations_related
+        FOREIGN KEY (related_product_id) REFERENCES products(product_id)
+        ON DELETE CASCADE
+);
@@ -26,9 +26,9 @@ class OrderAddresses(models.Model):
 class OrderItems(models.Model):
     item_id = models.BigAutoField(primary_key=True)
     order = models.ForeignKey('Orders', models.DO_NOTHING)
-    product = models.ForeignKey('Products', models.DO_NOTHING)
-    variant = models.ForeignKey('ProductVariants', models.DO_NOTHING)
-    shop = models.ForeignKey('Shops', models.DO_NOTHING)
+    product = models.ForeignKey('products.Products', models.DO_NOTHING)
+    variant = models.ForeignKey('products.ProductVariants', models.DO_NOTHING)
+    shop = models.ForeignKey('shop.Shops', models.DO_NOTHING)
     quantity = models.PositiveIntegerField()
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     total_price = models.DecimalField(max_digits=12, decimal_places=2)
@@ -106,7 +106,7 @@ class OrderTracking(models.Model):
 
 class Orders(models.Model):
     order_id = models.BigAutoField(primary_key=True)
-    customer = models.ForeignKey('UserProfiles', models.DO_NOTHING, to_field='keycloak_user_id')
+    customer = models.ForeignKey('users.UserProfiles', models.DO_NOTHING, to_field='keycloak_user_id')
     order_number = models.CharField(unique=True, max_length=50)
     status = models.CharField(max_length=10)
     subtotal = models.DecimalField(max_digits=12, decimal_places=2)
@@ -132,8 +132,8 @@ class OrdersOrder(models.Model):
     status = models.CharField(max_length=50)
     created_at = models.DateTimeField()
     updated_at = models.DateTimeField()
-    product = models.ForeignKey('ProductsProduct', models.DO_NOTHING)
-    user = models.ForeignKey('UsersUser', models.DO_NOTHING)
+    product = models.ForeignKey('products.ProductsProduct', models.DO_NOTHING)
+    user = models.ForeignKey('users.UsersUser', models.DO_NOTHING)
 
     class Meta:
         managed = False
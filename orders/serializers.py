@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Order
+from .models import OrdersOrder
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -9,23 +9,23 @@ class OrderSerializer(serializers.ModelSerializer):
     date = serializers.SerializerMethodField()
 
     class Meta:
-        model = Order
+        model = OrdersOrder
         fields = [
             'id', 'status', 'quantity',
             'customer', 'product_name', 'shop', 'date'
         ]
 
-    def get_customer(self, obj: Order):
+    def get_customer(self, obj: OrdersOrder):
         return obj.user.get_full_name() or obj.user.username
 
-    def get_product_name(self, obj: Order):
+    def get_product_name(self, obj: OrdersOrder):
         return getattr(obj.product, 'name', '')
 
-    def get_shop(self, obj: Order):
+    def get_shop(self, obj: OrdersOrder):
         try:
             return obj.product.shop.name
         except Exception:
             return ''
 
-    def get_date(self, obj: Order):
+    def get_date(self, obj: OrdersOrder):
         return (obj.created_at.date().isoformat() if obj.created_at else '')
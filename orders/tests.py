@@ -0,0 +1,138 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from products.models import Categories, Products, ProductVariants
+from shop.models import Shops
+from users.models import UserProfiles, UsersUser
+from .models import OrderItems, Orders
+
+# The order models are unmanaged, so the test runner does not create their tables.
+ORDER_MODELS = (UserProfiles, Shops, Categories, Products, ProductVariants, Orders, OrderItems)
+
+
+class OrderTablesMixin:
+    models = ORDER_MODELS
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for model in cls.models:
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.models):
+                editor.delete_model(model)
+
+    @classmethod
+    def create_orders(cls):
+        # bulk_create keeps the catalog signals out of the fixtures.
+        now = timezone.now()
+        UserProfiles.objects.bulk_create([
+            UserProfiles(keycloak_user_id=uid, email=f'{uid}@example.com', status='active', created_at=now, updated_at=now)
+            for uid in ('owner-1', 'customer-1', 'customer-2')
+        ])
+        cls.shops = Shops.objects.bulk_create([
+            Shops(owner_id='owner-1', shop_name=f'Shop {i}', shop_slug=f'shop-{i}', status='approved',
+                  commission_rate=Decimal('5.00'), minimum_payout_amount=Decimal('10.00'), created_at=now, updated_at=now)
+            for i in range(2)
+        ])
+        category = Categories.objects.bulk_create([Categories(
+            category_name='Things', category_slug='things', sort_order=0, is_active=1, created_at=now,
+        )])[0]
+        cls.products = Products.objects.bulk_create([
+            Products(shop_id=shop.pk, category_id=category.pk, product_name=f'Item {i}', product_slug=f'item-{i}',
+                     status='approved', featured=0, created_at=now, updated_at=now)
+            for i, shop in enumerate(cls.shops)
+        ])
+        cls.variants = ProductVariants.objects.bulk_create([
+            ProductVariants(product_id=p.pk, sku=f'sku-{p.pk}', price=Decimal('10.00'), is_default=1, created_at=now)
+            for p in cls.products
+        ])
+        cls.now = now
+
+    @classmethod
+    def add_order(cls, customer, day_offset, items, status='pending', item_status='pending'):
+        """``items`` is a list of product indexes; returns the order."""
+        placed = cls.now - timedelta(days=day_offset)
+        order = Orders.objects.create(
+            customer_id=customer, order_number=f'N{Orders.objects.count() + 1}', status=status,
+            subtotal=Decimal('10.00') * len(items), tax_amount=0, shipping_amount=0, discount_amount=0,
+            total_amount=Decimal('10.00') * len(items), currency='USD', order_date=placed,
+        )
+        OrderItems.objects.bulk_create([
+            OrderItems(order_id=order.pk, product_id=cls.products[i].pk, variant_id=cls.variants[i].pk,
+                       shop_id=cls.products[i].shop_id, quantity=1, unit_price=Decimal('10.00'),
+                       total_price=Decimal('10.00'), commission_rate=Decimal('5.00'),
+                       commission_amount=Decimal('0.50'), status=item_status, created_at=placed)
+            for i in items
+        ])
+        return order
+
+
+@override_settings(ROOT_URLCONF='orders.urls')
+class OrderListTests(OrderTablesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_orders()
+        cls.orders = [
+            cls.add_order('customer-1', 3, [0]),
+            cls.add_order('customer-2', 2, [0, 1]),
+            cls.add_order('customer-1', 1, [1], status='shipped'),
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(UsersUser(username='admin', is_staff=1))
+
+    def get(self, **params):
+        response = self.client.get(reverse('order-list'), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_newest_first_with_page_items(self):
+        body = self.get()
+        self.assertEqual([o['order_id'] for o in body['orders']], [o.pk for o in reversed(self.orders)])
+        middle = body['orders'][1]
+        self.assertEqual((middle['item_count'], middle['shop_ids']), (2, sorted(s.pk for s in self.shops)))
+
+    def test_filters(self):
+        self.assertEqual([o['order_id'] for o in self.get(customer='customer-1')['orders']],
+                         [self.orders[2].pk, self.orders[0].pk])
+        self.assertEqual([o['order_id'] for o in self.get(shop=self.shops[0].pk)['orders']],
+                         [self.orders[1].pk, self.orders[0].pk])
+        self.assertEqual([o['order_id'] for o in self.get(status='shipped')['orders']], [self.orders[2].pk])
+
+    def test_cursor_walks_every_order_once(self):
+        seen, cursor = [], None
+        while True:
+            body = self.get(limit=1, **({'cursor': cursor} if cursor else {}))
+            seen.extend(o['order_id'] for o in body['orders'])
+            cursor = body['next']
+            if not cursor:
+                break
+        self.assertEqual(seen, [o.pk for o in reversed(self.orders)])
+
+    def test_bad_filter_is_rejected(self):
+        self.assertEqual(self.client.get(reverse('order-list'), {'date_from': 'soon'}).status_code, 400)
+
+    def test_customers_cannot_list_everyone(self):
+        self.client.force_authenticate(UsersUser(username='customer-1', is_staff=0))
+        self.assertEqual(self.client.get(reverse('order-list')).status_code, 403)
+
+    def test_update_status(self):
+        url = reverse('order-update-status')
+        response = self.client.patch(url, {'id': self.orders[0].pk, 'status': 'shipped'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Orders.objects.get(pk=self.orders[0].pk).status, 'shipped')
+        self.assertEqual(self.client.patch(url, {'id': self.orders[0].pk, 'status': 'lost'}, format='json').status_code, 400)
@@ -1,15 +1,73 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Order
-from .serializers import OrderSerializer
+from datetime import datetime, time, timedelta
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import OrderItems, Orders
 from rest_framework.permissions import IsAdminUser
+from config.pagination import keyset_page, parse_limit
+
+ORDER_LIST_FIELDS = (
+    'order_id', 'order_number', 'customer_id', 'status', 'total_amount', 'currency', 'order_date',
+)
+ORDER_LIST_ORDER = ('order_date', 'order_id')
+# orders.status ENUM in db_structure/4.order_management.sql.
+ORDER_STATUSES = ('pending', 'processing', 'shipped', 'delivered', 'cancelled', 'refunded', 'failed')
+
+
+def _parse_bound(raw, end=False):
+    # Accepts a date or a datetime; a bare end date includes that whole day.
+    value = parse_datetime(raw)
+    if value is None:
+        day = parse_date(raw)
+        if day is None:
+            raise ValueError
+        value = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    if timezone.is_naive(value) and timezone.is_aware(timezone.now()):
+        value = timezone.make_aware(value)
+    return value
+
+
+def _filter_orders(qs, params):
+    if params.get('status'):
+        qs = qs.filter(status=params['status'])
+    if params.get('customer'):
+        qs = qs.filter(customer_id=params['customer'])
+    if params.get('date_from'):
+        qs = qs.filter(order_date__gte=_parse_bound(params['date_from']))
+    if params.get('date_to'):
+        qs = qs.filter(order_date__lt=_parse_bound(params['date_to'], end=True))
+    if params.get('shop'):
+        # EXISTS keeps one row per order even when several items come from the shop.
+        qs = qs.filter(Exists(OrderItems.objects.filter(order=OuterRef('pk'), shop_id=int(params['shop']))))
+    return qs
 
 
 @api_view(['GET'])
+@permission_classes([IsAdminUser])
 def order_list(request):
-    qs = Order.objects.select_related('user', 'product', 'product__shop').all()
-    return Response({'orders': OrderSerializer(qs, many=True).data})
+    # Newest first, keyset-paged over (order_date, order_id), so a deep page
+    # costs the same index range scan as the first one.
+    try:
+        qs = _filter_orders(Orders.objects.all(), request.query_params)
+    except ValueError:
+        return Response({'detail': 'invalid date or shop filter'}, status=status.HTTP_400_BAD_REQUEST)
+    rows, next_cursor = keyset_page(qs.values(*ORDER_LIST_FIELDS), ORDER_LIST_ORDER,
+                                    request.query_params.get('cursor'), parse_limit(request), descending=True)
+    # Item counts and shops for the whole page in one query.
+    items = {}
+    for order_id, shop_id in (OrderItems.objects.filter(order_id__in=[r['order_id'] for r in rows])
+                              .values_list('order_id', 'shop_id')):
+        entry = items.setdefault(order_id, {'item_count': 0, 'shop_ids': set()})
+        entry['item_count'] += 1
+        entry['shop_ids'].add(shop_id)
+    for row in rows:
+        entry = items.get(row['order_id'], {'item_count': 0, 'shop_ids': set()})
+        row['item_count'] = entry['item_count']
+        row['shop_ids'] = sorted(entry['shop_ids'])
+    return Response({'orders': rows, 'next': next_cursor})
 
 
 @api_view(['PATCH'])
@@ -19,10 +77,12 @@ def update_order_status(request):
     status_val = request.data.get('status')
     if not order_id or not status_val:
         return Response({'detail': 'id and status required'}, status=status.HTTP_400_BAD_REQUEST)
+    if status_val not in ORDER_STATUSES:
+        return Response({'detail': 'invalid status'}, status=status.HTTP_400_BAD_REQUEST)
     try:
-        o = Order.objects.get(pk=order_id)
-    except Order.DoesNotExist:
+        o = Orders.objects.get(pk=int(order_id))
+    except (TypeError, ValueError, Orders.DoesNotExist):
         return Response({'detail': 'not found'}, status=404)
     o.status = status_val
-    o.save(update_fields=['status', 'updated_at'])
+    o.save(update_fields=['status'])
     return Response({'ok': True})
@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.db import models
 
 class Payment(models.Model):
-    user = models.ForeignKey("User", on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=50)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -18,7 +19,7 @@ class Payout(models.Model):
         (METHOD_CARD, 'Card'),
     ]
 
-    seller = models.ForeignKey("User", on_delete=models.CASCADE, related_name='payouts')
+    seller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='payouts')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     method = models.CharField(max_length=10, choices=METHOD_CHOICES)
 
@@ -47,7 +48,7 @@ class Payout(models.Model):
 
 class WalletTransactions(models.Model):
     wallet_transaction_id = models.BigAutoField(primary_key=True)
-    user = models.ForeignKey("UserProfiles", models.DO_NOTHING, to_field='keycloak_user_id')
+    user = models.ForeignKey("users.UserProfiles", models.DO_NOTHING, to_field='keycloak_user_id')
     transaction_type = models.CharField(max_length=13)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     balance_after = models.DecimalField(max_digits=12, decimal_places=2)
@@ -57,3 +58,21 @@ class WalletTransactions(models.Model):
     class Meta:
         managed = False
         db_table = 'wallet_transactions'
+
+
+class Commissions(models.Model):
+    commission_id = models.BigAutoField(primary_key=True)
+    order = models.ForeignKey('orders.Orders', models.DO_NOTHING)
+    shop = models.ForeignKey('shop.Shops', models.DO_NOTHING)
+    item = models.ForeignKey('orders.OrderItems', models.DO_NOTHING)
+    commission_rate = models.DecimalField(max_digits=5, decimal_places=2)
+    gross_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    commission_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    platform_fee = models.DecimalField(max_digits=10, decimal_places=2)
+    net_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    status = models.CharField(max_length=8)
+    calculated_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'commissions'
@@ -0,0 +1,95 @@
+import atexit
+import threading
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from config.db import bulk_upsert
+from .models import ProductAnalytics
+
+COUNTERS = ('views', 'clicks', 'add_to_cart', 'purchases')
+COLUMNS = ('product_id', 'date') + COUNTERS + ('revenue', 'created_at')
+FLUSH_INTERVAL = getattr(settings, 'PRODUCT_ANALYTICS_FLUSH_INTERVAL', 10)
+# Flush early once this many (product, day) rows are pending, to bound memory.
+MAX_PENDING = 5000
+BATCH_SIZE = 500
+
+
+class CounterBuffer:
+    """Aggregate analytics increments in memory and upsert them in batches.
+
+    A popular product then costs one row write per flush interval instead of
+    one per request, and the hot row is never locked by request threads.
+    """
+
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.interval = interval
+        self._pending = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def incr(self, product_id, counter, amount=1, revenue=None):
+        if counter not in COUNTERS:
+            raise ValueError(f'unknown counter {counter}')
+        key = (product_id, timezone.now().date())
+        with self._lock:
+            row = self._pending[key]
+            row[counter] += amount
+            if revenue is not None:
+                row['revenue'] += Decimal(revenue)
+            pending = len(self._pending)
+            self._ensure_timer()
+        if pending >= MAX_PENDING:
+            self.flush()
+
+    def _ensure_timer(self):
+        if self._timer is None and self.interval:
+            self._timer = threading.Timer(self.interval, self._tick)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _tick(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            # The timer thread has its own DB connection; don't leave it open.
+            connection.close()
+
+    def flush(self):
+        """Write every pending increment now; returns the number of rows upserted."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+        if not pending:
+            return 0
+        now = timezone.now()
+        # Sorted keys give every worker the same lock order on the unique index.
+        rows = [
+            (product_id, day) + tuple(c[name] for name in COUNTERS) + (c.get('revenue', Decimal('0')), now)
+            for (product_id, day), c in sorted(pending.items())
+        ]
+        try:
+            with transaction.atomic():
+                bulk_upsert(
+                    ProductAnalytics._meta.db_table, COLUMNS, ('product_id', 'date'), rows,
+                    increment=COUNTERS + ('revenue',), batch_size=BATCH_SIZE,
+                )
+        except Exception:
+            # Put the counts back so a transient DB error doesn't lose them.
+            with self._lock:
+                for key, counts in pending.items():
+                    for name, value in counts.items():
+                        self._pending[key][name] += value
+            raise
+        return len(rows)
+
+
+buffer = CounterBuffer()
+record = buffer.incr
+flush = buffer.flush
+# Worker shutdown (gunicorn/uwsgi graceful stop, manage.py exit) drains the buffer.
+atexit.register(flush)
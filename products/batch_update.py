@@ -0,0 +1,132 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, Q, Value, When
+
+from config.validation import positive_int
+from . import detail, inventory, listings
+from .models import ProductVariants
+
+CHUNK_SIZE = 500
+MAX_ITEMS = 10000
+MAX_PRICE = Decimal('99999999.99')
+SKU_MAX_LENGTH = ProductVariants._meta.get_field('sku').max_length
+
+
+def _quantity(value):
+    if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+        raise ValueError('invalid quantity')
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('invalid quantity')
+    if not 0 <= quantity <= inventory.MAX_QUANTITY:
+        raise ValueError('quantity out of range')
+    return quantity
+
+
+def _price(value):
+    if isinstance(value, (bool, dict, list)):
+        raise ValueError('invalid price')
+    try:
+        price = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError('invalid price')
+    if not price.is_finite() or not 0 <= price <= MAX_PRICE:
+        raise ValueError('invalid price')
+    return price.quantize(Decimal('0.01'))
+
+
+def _parse(index, item):
+    """Validate every field of ``item`` up front, so nothing is applied from a half-valid item."""
+    if not isinstance(item, dict):
+        raise ValueError('expected an object')
+    variant_id, sku = item.get('variant_id'), item.get('sku')
+    if variant_id in (None, '') and not sku:
+        raise ValueError('sku or variant_id required')
+    if sku is not None and (not isinstance(sku, str) or len(sku) > SKU_MAX_LENGTH):
+        raise ValueError('invalid sku')
+    quantity, price = item.get('quantity'), item.get('price')
+    if quantity is None and price is None:
+        raise ValueError('quantity or price required')
+    return {
+        'index': index,
+        'variant_id': positive_int(variant_id, 'variant_id') if variant_id not in (None, '') else None,
+        'sku': sku or None,
+        'quantity': _quantity(quantity) if quantity is not None else None,
+        'price': _price(price) if price is not None else None,
+    }
+
+
+def _resolve(shop_id, parsed):
+    """Map every requested sku / variant_id to a variant of ``shop_id`` in one query."""
+    skus = {p['sku'] for p in parsed if p['variant_id'] is None}
+    ids = {p['variant_id'] for p in parsed if p['variant_id'] is not None}
+    rows = (ProductVariants.objects
+            .filter(product__shop_id=shop_id)
+            .filter(Q(sku__in=skus) | Q(variant_id__in=ids))
+            .values_list('variant_id', 'sku', 'product_id'))
+    by_sku, known = {}, {}
+    for variant_id, sku, product_id in rows:
+        known[variant_id] = product_id
+        # SKUs are only unique per product, so the same SKU can name two variants.
+        by_sku.setdefault(sku, []).append(variant_id)
+    return by_sku, known
+
+
+def _set_prices(prices):
+    items = sorted(prices.items())
+    for start in range(0, len(items), CHUNK_SIZE):
+        chunk = dict(items[start:start + CHUNK_SIZE])
+        target = Case(*[When(variant_id=vid, then=Value(p)) for vid, p in chunk.items()],
+                      output_field=DecimalField(max_digits=10, decimal_places=2))
+        ProductVariants.objects.filter(variant_id__in=chunk).update(price=target)
+
+
+def apply_batch(shop_id, items):
+    """Apply ``[{sku|variant_id, quantity, price}]`` for one shop; returns per-item results."""
+    results, parsed = [], []
+    for index, item in enumerate(items):
+        try:
+            parsed.append(_parse(index, item))
+        except ValueError as exc:
+            results.append({'index': index, 'status': 'invalid', 'error': str(exc)})
+
+    by_sku, known = _resolve(shop_id, parsed)
+    quantities, prices, resolved = {}, {}, []
+    for p in parsed:
+        if p['variant_id'] is not None:
+            matches = [p['variant_id']] if p['variant_id'] in known else []
+        else:
+            matches = by_sku.get(p['sku'], [])
+        if len(matches) != 1:
+            error = 'not_found' if not matches else 'ambiguous_sku'
+            results.append({'index': p['index'], 'sku': p['sku'], 'status': error})
+            continue
+        variant_id = matches[0]
+        # Later entries for the same variant win, as if the calls were made one by one.
+        if p['quantity'] is not None:
+            quantities[variant_id] = p['quantity']
+        if p['price'] is not None:
+            prices[variant_id] = p['price']
+        resolved.append((p, variant_id))
+
+    # All or nothing: a failure part-way must not leave stock set and prices unset.
+    with transaction.atomic():
+        refused = inventory.bulk_set_stock(quantities, chunk_size=CHUNK_SIZE) if quantities else set()
+        # A variant whose stock is refused keeps its old price too; the item is applied whole or not at all.
+        prices = {vid: price for vid, price in prices.items() if vid not in refused}
+        if prices:
+            _set_prices(prices)
+            # UPDATE skips post_save, so refresh the derived rows explicitly.
+            touched = {known[vid] for vid in prices}
+            transaction.on_commit(lambda: detail.invalidate_many(touched))
+            listings.refresh(touched)
+
+    for p, variant_id in resolved:
+        results.append({
+            'index': p['index'], 'sku': p['sku'], 'variant_id': variant_id,
+            'status': 'below_reserved' if variant_id in refused else 'ok',
+        })
+    results.sort(key=lambda r: r['index'])
+    return results
@@ -0,0 +1,16 @@
+from config.caching import bump_version
+
+# Cache namespace for every anonymous catalog page; bumping it retires them all at once.
+CATALOG_NAMESPACE = 'products:catalog'
+# Listing pages (price, stock, image) also change whenever a product_listings row
+# does, which is far more often than moderation; they get their own namespace.
+LISTINGS_NAMESPACE = 'products:listings'
+
+
+def invalidate_catalog():
+    bump_version(CATALOG_NAMESPACE)
+    bump_version(LISTINGS_NAMESPACE)
+
+
+def invalidate_listings():
+    bump_version(LISTINGS_NAMESPACE)
@@ -0,0 +1,109 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from config.caching import get_version
+from .catalog import CATALOG_NAMESPACE, invalidate_catalog
+from .models import Categories, CategoryClosure
+
+COUNTS_TIMEOUT = 300
+
+
+def subtree_ids(category_id):
+    """Subquery of every category id under ``category_id`` (itself included)."""
+    return CategoryClosure.objects.filter(ancestor_id=category_id).values('descendant_id')
+
+
+def ancestor_ids(category_id):
+    """Root-first path to ``category_id``, e.g. for breadcrumbs."""
+    links = CategoryClosure.objects.filter(descendant_id=category_id).order_by('-depth')
+    return list(links.values_list('ancestor_id', flat=True))
+
+
+def validate_parent(category):
+    if category.pk is None or category.parent_category_id is None:
+        return
+    if CategoryClosure.objects.filter(ancestor_id=category.pk, descendant_id=category.parent_category_id).exists():
+        raise ValueError('a category cannot be moved under its own subtree')
+
+
+def _insert_node(category_id, parent_id):
+    rows = [CategoryClosure(ancestor_id=category_id, descendant_id=category_id, depth=0)]
+    if parent_id is not None:
+        above = CategoryClosure.objects.filter(descendant_id=parent_id).values_list('ancestor_id', 'depth')
+        rows += [CategoryClosure(ancestor_id=a, descendant_id=category_id, depth=d + 1) for a, d in above]
+    CategoryClosure.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+@transaction.atomic
+def move_subtree(category_id, new_parent_id):
+    subtree = list(CategoryClosure.objects.filter(ancestor_id=category_id).values_list('descendant_id', 'depth'))
+    members = [d for d, _ in subtree]
+    if new_parent_id in members:
+        raise ValueError('a category cannot be moved under its own subtree')
+    # Cut every link that enters the subtree from outside, then graft it under the new parent.
+    CategoryClosure.objects.filter(descendant_id__in=members).exclude(ancestor_id__in=members).delete()
+    if new_parent_id is not None:
+        above = list(CategoryClosure.objects.filter(descendant_id=new_parent_id).values_list('ancestor_id', 'depth'))
+        CategoryClosure.objects.bulk_create(
+            [CategoryClosure(ancestor_id=a, descendant_id=d, depth=ad + dd + 1) for a, ad in above for d, dd in subtree],
+            batch_size=1000,
+        )
+
+
+def sync_node(category):
+    """Bring the closure rows for ``category`` in line with its parent_category."""
+    parent_id = category.parent_category_id
+    links = CategoryClosure.objects.filter(descendant_id=category.pk, depth__lte=1)
+    current = dict(links.values_list('depth', 'ancestor_id'))
+    if 0 not in current:
+        _insert_node(category.pk, parent_id)
+    elif current.get(1) != parent_id:
+        move_subtree(category.pk, parent_id)
+    else:
+        return
+    invalidate_catalog()
+
+
+def detach_node(category_id):
+    """Drop a category from the tree; its children become roots, as ON DELETE SET NULL does."""
+    with transaction.atomic():
+        children = CategoryClosure.objects.filter(ancestor_id=category_id, depth=1)
+        for child_id in list(children.values_list('descendant_id', flat=True)):
+            move_subtree(child_id, None)
+        CategoryClosure.objects.filter(descendant_id=category_id).delete()
+        CategoryClosure.objects.filter(ancestor_id=category_id).delete()
+    invalidate_catalog()
+
+
+@transaction.atomic
+def rebuild():
+    """Recompute the whole closure from categories.parent_category_id in one pass."""
+    parents = dict(Categories.objects.values_list('category_id', 'parent_category_id'))
+    rows = []
+    for category_id in parents:
+        node, depth, seen = category_id, 0, set()
+        while node is not None and node not in seen:
+            seen.add(node)
+            rows.append(CategoryClosure(ancestor_id=node, descendant_id=category_id, depth=depth))
+            node, depth = parents.get(node), depth + 1
+    CategoryClosure.objects.all().delete()
+    CategoryClosure.objects.bulk_create(rows, batch_size=2000)
+    invalidate_catalog()
+    return len(rows)
+
+
+def subtree_product_counts():
+    """{category_id: approved products in its subtree}, cached per catalog version."""
+    version, _ = get_version(CATALOG_NAMESPACE)
+    key = f'products:category-counts:v{version}'
+    counts = cache.get(key)
+    if counts is None:
+        rows = (CategoryClosure.objects
+                .filter(descendant__products__status='approved')
+                .values('ancestor_id')
+                .annotate(n=Count('descendant__products__product_id'))
+                .order_by())
+        counts = {r['ancestor_id']: r['n'] for r in rows}
+        cache.set(key, counts, COUNTS_TIMEOUT)
+    return counts
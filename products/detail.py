@@ -0,0 +1,111 @@
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from .models import ProductAttributeValues, ProductImages, ProductInventory, Products
+
+DETAIL_TIMEOUT = 600
+
+
+def _str(value):
+    return None if value is None else str(value)
+
+
+def serialize_product_detail(product):
+    """Flat document for the product page, built from already-prefetched relations.
+
+    Plain dicts instead of nested ModelSerializers: no per-field introspection
+    and no chance of a lazy relation lookup firing a query per row.
+    """
+    summary = getattr(product, 'productreviewssummary', None)
+    return {
+        'product_id': product.product_id,
+        'product_name': product.product_name,
+        'product_slug': product.product_slug,
+        'description': product.description,
+        'short_description': product.short_description,
+        'sku': product.sku,
+        'brand': product.brand,
+        'status': product.status,
+        'featured': bool(product.featured),
+        'shop': {'shop_id': product.shop.shop_id, 'shop_name': product.shop.shop_name, 'shop_slug': product.shop.shop_slug},
+        'category': {
+            'category_id': product.category.category_id,
+            'category_name': product.category.category_name,
+            'category_slug': product.category.category_slug,
+        },
+        'variants': [
+            {
+                'variant_id': v.variant_id,
+                'variant_name': v.variant_name,
+                'sku': v.sku,
+                'price': _str(v.price),
+                'compare_price': _str(v.compare_price),
+                'is_default': bool(v.is_default),
+            }
+            for v in product.productvariants_set.all()
+        ],
+        'images': [
+            {
+                'image_id': i.image_id,
+                'variant_id': i.variant_id,
+                'image_url': i.image_url,
+                'alt_text': i.alt_text,
+                'is_primary': bool(i.is_primary),
+            }
+            for i in product.productimages_set.all()
+        ],
+        'attributes': [
+            {'attribute_id': a.attribute_id, 'name': a.attribute.attribute_name, 'value': a.attribute_value}
+            for a in product.productattributevalues_set.all()
+        ],
+        'reviews': {
+            'average_rating': _str(summary.average_rating) if summary else '0.00',
+            'total_reviews': summary.total_reviews if summary else 0,
+            'distribution': (summary.rating_distribution_json or {}) if summary else {},
+        },
+    }
+
+
+def _key(product_id):
+    return f'products:detail:{product_id}'
+
+
+def build_document(product_id):
+    """Assemble the product page in four queries, however many variants or images it has."""
+    product = (Products.objects
+               .select_related('shop', 'category', 'productreviewssummary')
+               .prefetch_related(
+                   'productvariants_set',
+                   Prefetch('productimages_set', queryset=ProductImages.objects.order_by('sort_order', 'image_id')),
+                   Prefetch('productattributevalues_set', queryset=ProductAttributeValues.objects.select_related('attribute')),
+               )
+               .filter(pk=product_id, status='approved')
+               .first())
+    return serialize_product_detail(product) if product else None
+
+
+def get_document(product_id):
+    doc = cache.get(_key(product_id))
+    if doc is None:
+        doc = build_document(product_id)
+        if doc is None:
+            return None
+        cache.set(_key(product_id), doc, DETAIL_TIMEOUT)
+    # Stock moves on every checkout, so it is read live (one indexed query)
+    # instead of invalidating the cached document on each reservation.
+    variant_ids = [v['variant_id'] for v in doc['variants']]
+    stock = {
+        vid: available - reserved
+        for vid, available, reserved in ProductInventory.objects.filter(variant_id__in=variant_ids)
+        .values_list('variant_id', 'quantity_available', 'quantity_reserved')
+    }
+    doc = dict(doc, variants=[dict(v, in_stock=max(stock.get(v['variant_id'], 0), 0)) for v in doc['variants']])
+    return doc
+
+
+def invalidate(product_id):
+    cache.delete(_key(product_id))
+
+
+def invalidate_many(product_ids):
+    cache.delete_many([_key(pid) for pid in product_ids])
@@ -0,0 +1,227 @@
+import threading
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from config.caching import bump_version, get_version
+from .models import ProductAttributeValues, Products
+
+FACETS_NAMESPACE = 'products:facets'
+# How long a change-log entry survives; a process further behind than this rebuilds from scratch.
+CHANGE_LOG_TIMEOUT = 3600
+# A process more versions behind than this rebuilds instead of replaying the log.
+MAX_CATCH_UP = 1000
+# Values held by at most max(SPARSE_MIN, slots / SPARSE_RATIO) products are
+# stored as slot sets: a set entry costs ~64 bytes, a bitmap 1/8 byte per slot.
+SPARSE_MIN = 64
+SPARSE_RATIO = 512
+
+
+def _iter_slots(mask):
+    bits = bin(mask)[:1:-1]
+    i = bits.find('1')
+    while i != -1:
+        yield i
+        i = bits.find('1', i + 1)
+
+
+def _to_bitmap(slots, width):
+    buf = bytearray(width)
+    for slot in slots:
+        buf[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(buf, 'little')
+
+
+class FacetIndex:
+    """(attribute_id, value) -> posting over dense product slots.
+
+    Common values are bitmaps (Python ints), so a multi-attribute filter is a
+    handful of AND/OR operations and each facet count is one popcount. A
+    bitmap costs one bit per slot whoever holds the value, so rare values are
+    kept as plain sets of slots instead and only widened once they fill up.
+    """
+
+    def __init__(self):
+        self.slots = {}
+        self.product_ids = []
+        self.postings = {}
+        self.values = defaultdict(dict)
+        self.approved = 0
+
+    def _slot(self, product_id):
+        slot = self.slots.get(product_id)
+        if slot is None:
+            slot = self.slots[product_id] = len(self.product_ids)
+            self.product_ids.append(product_id)
+        return slot
+
+    def _width(self):
+        return (len(self.product_ids) + 7) // 8
+
+    def _sparse_limit(self):
+        return max(SPARSE_MIN, len(self.product_ids) // SPARSE_RATIO)
+
+    def _add(self, key, slot):
+        posting = self.postings.get(key)
+        if posting is None:
+            self.postings[key] = {slot}
+        elif isinstance(posting, set):
+            posting.add(slot)
+            if len(posting) > self._sparse_limit():
+                self.postings[key] = _to_bitmap(posting, self._width())
+        else:
+            self.postings[key] = posting | (1 << slot)
+
+    def _discard(self, key, slot):
+        posting = self.postings.get(key)
+        if posting is None:
+            return
+        if isinstance(posting, set):
+            posting.discard(slot)
+            if not posting:
+                del self.postings[key]
+            return
+        posting &= ~(1 << slot)
+        n = posting.bit_count()
+        if not n:
+            del self.postings[key]
+        elif n <= self._sparse_limit() // 2:
+            self.postings[key] = set(_iter_slots(posting))
+        else:
+            self.postings[key] = posting
+
+    def bitmap(self, attribute_id, value):
+        posting = self.postings.get((attribute_id, value), 0)
+        return _to_bitmap(posting, self._width()) if isinstance(posting, set) else posting
+
+    def set_value(self, product_id, attribute_id, value):
+        slot = self._slot(product_id)
+        old = self.values[product_id].get(attribute_id)
+        if old is not None:
+            self._discard((attribute_id, old), slot)
+        self.values[product_id][attribute_id] = value
+        self._add((attribute_id, value), slot)
+
+    def clear_product(self, product_id):
+        if product_id not in self.slots:
+            return
+        slot = self.slots[product_id]
+        for attribute_id, value in self.values.pop(product_id, {}).items():
+            self._discard((attribute_id, value), slot)
+        self.approved &= ~(1 << slot)
+
+    def set_approved(self, product_id, approved):
+        bit = 1 << self._slot(product_id)
+        self.approved = (self.approved | bit) if approved else (self.approved & ~bit)
+
+    def mask_for(self, product_ids):
+        mask = 0
+        for pid in product_ids:
+            slot = self.slots.get(pid)
+            if slot is not None:
+                mask |= 1 << slot
+        return mask
+
+    def query(self, selected, candidates=None, facet_attributes=None):
+        """Filter by ``selected`` ({attribute_id: {values}}) and count every facet.
+
+        Values of one attribute are OR-ed, attributes are AND-ed. Counts for an
+        attribute ignore that attribute's own selection, so picking "red" still
+        shows how many "blue" items there are. Returns ``(mask, counts)``.
+        """
+        base = self.approved if candidates is None else self.approved & candidates
+        by_attribute = defaultdict(list)
+        for (attribute_id, value), posting in self.postings.items():
+            if facet_attributes is None or attribute_id in facet_attributes:
+                by_attribute[attribute_id].append((value, posting))
+
+        masks = {}
+        for attribute_id, values in selected.items():
+            mask = 0
+            for value in values:
+                mask |= self.bitmap(attribute_id, value)
+            masks[attribute_id] = mask
+
+        result = base
+        for mask in masks.values():
+            result &= mask
+
+        counts = {}
+        for attribute_id, values in by_attribute.items():
+            scope = base
+            for other, mask in masks.items():
+                if other != attribute_id:
+                    scope &= mask
+            # Sparse postings are counted by probing the scope's bytes slot by slot.
+            scope_bytes = None
+            found = {}
+            for value, posting in values:
+                if isinstance(posting, set):
+                    if scope_bytes is None:
+                        scope_bytes = scope.to_bytes(self._width(), 'little')
+                    n = sum(scope_bytes[slot >> 3] >> (slot & 7) & 1 for slot in posting)
+                else:
+                    n = (posting & scope).bit_count()
+                if n:
+                    found[value] = n
+            counts[attribute_id] = found
+        return result, counts
+
+    def product_ids_in(self, mask):
+        return [self.product_ids[slot] for slot in _iter_slots(mask)]
+
+    def refresh(self, product_ids):
+        """Reload attribute values and approval for ``product_ids`` in two queries."""
+        product_ids = list(product_ids)
+        for pid in product_ids:
+            self.clear_product(pid)
+        approved = set(Products.objects.filter(pk__in=product_ids, status='approved').values_list('pk', flat=True))
+        for pid in product_ids:
+            self.set_approved(pid, pid in approved)
+        rows = ProductAttributeValues.objects.filter(product_id__in=product_ids)
+        for pid, attribute_id, value in rows.values_list('product_id', 'attribute_id', 'attribute_value'):
+            self.set_value(pid, attribute_id, value)
+
+    @classmethod
+    def build(cls):
+        index = cls()
+        approved = Products.objects.filter(status='approved').order_by('pk').values_list('pk', flat=True)
+        for pid in approved.iterator(chunk_size=5000):
+            index.set_approved(pid, True)
+        rows = ProductAttributeValues.objects.order_by('product_id').values_list('product_id', 'attribute_id', 'attribute_value')
+        for pid, attribute_id, value in rows.iterator(chunk_size=5000):
+            index.set_value(pid, attribute_id, value)
+        return index
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def record_change(product_ids):
+    """Log changed products under the next facet version so every process can catch up."""
+    # A reader that sees the new version before this entry lands simply rebuilds.
+    version = bump_version(FACETS_NAMESPACE)
+    cache.set(f'{FACETS_NAMESPACE}:changes:{version}', list(product_ids), CHANGE_LOG_TIMEOUT)
+
+
+def get_index():
+    """Process-local facet index, patched from the change log rather than rebuilt."""
+    global _index, _index_version
+    version, _ = get_version(FACETS_NAMESPACE)
+    with _index_lock:
+        if _index is None or not _index_version <= version <= _index_version + MAX_CATCH_UP:
+            # First use, a version that went backwards (the shared cache was
+            # flushed or evicted the counter) or too long a gap to replay.
+            _index = FacetIndex.build()
+        elif _index_version != version:
+            keys = [f'{FACETS_NAMESPACE}:changes:{v}' for v in range(_index_version + 1, version + 1)]
+            logged = cache.get_many(keys)
+            if len(logged) == len(keys):
+                _index.refresh({pid for ids in logged.values() for pid in ids})
+            else:
+                # Part of the gap has expired from the log.
+                _index = FacetIndex.build()
+        _index_version = version
+        return _index
@@ -0,0 +1,252 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import listings
+from .models import Categories, ProductAttributes, ProductAttributeValues, ProductImages, Products, ProductVariants
+
+BATCH_SIZE = 500
+# Keep the error report bounded too; the count is still exact.
+MAX_REPORTED_ERRORS = 1000
+ATTRIBUTE_PREFIX = 'attr:'
+# Largest value the DECIMAL(10, 2) price columns hold.
+MAX_PRICE = Decimal('99999999.99')
+
+
+class RowError(Exception):
+    pass
+
+
+def _lines(stream):
+    """Decode ``stream`` one line at a time; bytes that are not UTF-8 become lone surrogates.
+
+    Django's request and BytesIO both iterate by line, so nothing beyond the
+    current line is buffered and no TextIOWrapper (which wants a full raw
+    file object) is needed.
+    """
+    first = True
+    for raw in stream:
+        line = raw.decode('utf-8', errors='surrogateescape')
+        if first:
+            line, first = line.lstrip('\ufeff'), False
+        yield line
+
+
+def _undecodable(text):
+    return any('\udc80' <= ch <= '\udcff' for ch in text)
+
+
+def iter_csv(stream):
+    reader = csv.DictReader(_lines(stream))
+    for row in reader:
+        if any(_undecodable(k or '') or (isinstance(v, str) and _undecodable(v)) for k, v in row.items()):
+            yield RowError('invalid UTF-8')
+            continue
+        attributes = {k[len(ATTRIBUTE_PREFIX):]: v for k, v in row.items() if k and k.startswith(ATTRIBUTE_PREFIX) and v}
+        images = [u for u in (row.get('image_urls') or '').split('|') if u]
+        yield dict(row, attributes=attributes, image_urls=images)
+
+
+def iter_jsonl(stream):
+    for line in _lines(stream):
+        line = line.strip()
+        if not line:
+            continue
+        if _undecodable(line):
+            yield RowError('invalid UTF-8')
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield RowError('invalid JSON')
+            continue
+        yield row if isinstance(row, dict) else RowError('expected an object')
+
+
+PARSERS = {'csv': iter_csv, 'jsonl': iter_jsonl}
+
+
+def _text(value, field, max_length, required=False):
+    if isinstance(value, (dict, list, bool)):
+        raise RowError(f'invalid {field}')
+    value = '' if value is None else str(value).strip()
+    if not value:
+        if required:
+            raise RowError(f'{field} required')
+        return None
+    if len(value) > max_length:
+        raise RowError(f'{field} longer than {max_length} characters')
+    return value
+
+
+def _decimal(value, field, required=False):
+    if value in (None, ''):
+        if required:
+            raise RowError(f'{field} required')
+        return None
+    if isinstance(value, (dict, list, bool)):
+        raise RowError(f'invalid {field}')
+    try:
+        amount = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise RowError(f'invalid {field}')
+    if not amount.is_finite() or not 0 <= amount <= MAX_PRICE:
+        raise RowError(f'invalid {field}')
+    return amount.quantize(Decimal('0.01'))
+
+
+class CatalogImporter:
+    """Stream rows into products, variants, images and attribute values in batches.
+
+    Each input row is one product with its default variant. Only the current
+    batch is held in memory, so a 100k-row file costs the same RAM as a small one.
+    """
+
+    def __init__(self, shop_id, batch_size=BATCH_SIZE):
+        self.shop_id = shop_id
+        self.batch_size = batch_size
+        self.created = 0
+        self.error_count = 0
+        self.errors = []
+        # Both lookups are small reference tables; load them once up front.
+        self.category_ids = set(Categories.objects.values_list('category_id', flat=True))
+        self.attribute_ids = dict(ProductAttributes.objects.values_list('attribute_name', 'attribute_id'))
+
+    def _error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': line, 'error': message})
+
+    def _clean(self, row):
+        if isinstance(row, RowError):
+            raise row
+        name = _text(row.get('product_name') or row.get('name'), 'product_name', 255, required=True)
+        try:
+            category_id = int(row.get('category_id') or row.get('category'))
+        except (TypeError, ValueError):
+            raise RowError('category_id required')
+        if category_id not in self.category_ids:
+            raise RowError('unknown category')
+        raw_attributes = row.get('attributes') or {}
+        if not isinstance(raw_attributes, dict):
+            raise RowError('attributes must be an object')
+        attributes = {}
+        for attr_name, value in raw_attributes.items():
+            if attr_name not in self.attribute_ids:
+                raise RowError(f'unknown attribute {attr_name}')
+            attributes[self.attribute_ids[attr_name]] = _text(value, f'attribute {attr_name}', 255, required=True)
+        images = row.get('image_urls') or []
+        if not isinstance(images, list):
+            raise RowError('image_urls must be a list')
+        images = [_text(url, 'image_url', 2048, required=True) for url in images]
+        slug = _text(row.get('product_slug'), 'product_slug', 255) or slugify(name)[:255]
+        if not slug:
+            raise RowError('product_slug required')
+        return {
+            'product_name': name,
+            'product_slug': slug,
+            'category_id': category_id,
+            'sku': _text(row.get('sku'), 'sku', 100),
+            'brand': _text(row.get('brand'), 'brand', 100),
+            'description': _text(row.get('description'), 'description', 65535),
+            'short_description': _text(row.get('short_description'), 'short_description', 512),
+            'price': _decimal(row.get('price'), 'price', required=True),
+            'compare_price': _decimal(row.get('compare_price'), 'compare_price'),
+            'variant_name': _text(row.get('variant_name'), 'variant_name', 255),
+            'images': images,
+            'attributes': attributes,
+        }
+
+    def run(self, rows):
+        numbered = enumerate(rows, start=1)
+        while True:
+            chunk = list(islice(numbered, self.batch_size))
+            if not chunk:
+                break
+            self._import_batch(chunk)
+        return {'created': self.created, 'error_count': self.error_count, 'errors': self.errors}
+
+    def _import_batch(self, chunk):
+        cleaned, slugs, skus = {}, set(), set()
+        for line, row in chunk:
+            try:
+                item = self._clean(row)
+            except RowError as exc:
+                self._error(line, str(exc))
+                continue
+            if item['product_slug'] in slugs:
+                self._error(line, 'duplicate product_slug in batch')
+                continue
+            if item['sku'] is not None and item['sku'] in skus:
+                self._error(line, 'duplicate sku in batch')
+                continue
+            slugs.add(item['product_slug'])
+            if item['sku'] is not None:
+                skus.add(item['sku'])
+            cleaned[line] = item
+        if not cleaned:
+            return
+
+        # Earlier batches are already committed, so these checks also catch repeats across batches.
+        existing = Products.objects.filter(shop_id=self.shop_id)
+        taken_slugs = set(existing.filter(product_slug__in=slugs).values_list('product_slug', flat=True))
+        taken_skus = set(existing.filter(sku__in=skus).values_list('sku', flat=True)) if skus else set()
+        for line, c in list(cleaned.items()):
+            if c['product_slug'] in taken_slugs:
+                self._error(line, 'product_slug already exists')
+                del cleaned[line]
+            elif c['sku'] in taken_skus:
+                self._error(line, 'sku already exists')
+                del cleaned[line]
+        if not cleaned:
+            return
+
+        try:
+            self._insert(cleaned)
+        except IntegrityError:
+            # A concurrent writer took a slug or SKU between the check and the insert.
+            for line in cleaned:
+                self._error(line, 'conflicts with an existing product')
+            return
+        self.created += len(cleaned)
+
+    def _insert(self, cleaned):
+        now = timezone.now()
+        with transaction.atomic():
+            Products.objects.bulk_create([
+                Products(
+                    shop_id=self.shop_id, category_id=c['category_id'], product_name=c['product_name'],
+                    product_slug=c['product_slug'], description=c['description'],
+                    short_description=c['short_description'], sku=c['sku'], brand=c['brand'],
+                    status='pending', featured=0, created_at=now, updated_at=now,
+                )
+                for c in cleaned.values()
+            ])
+            # bulk_create does not return primary keys on MySQL; map them back by natural key.
+            ids = dict(Products.objects.filter(shop_id=self.shop_id, product_slug__in=[c['product_slug'] for c in cleaned.values()])
+                       .values_list('product_slug', 'product_id'))
+            variants, images, values = [], [], []
+            for c in cleaned.values():
+                product_id = ids[c['product_slug']]
+                variants.append(ProductVariants(
+                    product_id=product_id, variant_name=c['variant_name'], sku=c['sku'], price=c['price'],
+                    compare_price=c['compare_price'], is_default=1, created_at=now,
+                ))
+                images.extend(
+                    ProductImages(product_id=product_id, image_url=url, sort_order=i, is_primary=int(i == 0), created_at=now)
+                    for i, url in enumerate(c['images'])
+                )
+                values.extend(
+                    ProductAttributeValues(product_id=product_id, attribute_id=a, attribute_value=v, created_at=now)
+                    for a, v in c['attributes'].items()
+                )
+            ProductVariants.objects.bulk_create(variants)
+            ProductImages.objects.bulk_create(images)
+            ProductAttributeValues.objects.bulk_create(values)
+            # bulk_create skips post_save, so build the listing rows here.
+            listings.refresh(ids.values())
@@ -0,0 +1,167 @@
+import uuid
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from config.validation import MAX_INT, positive_int
+from . import listings
+from .models import ProductInventory, StockReservations
+
+# product_inventory quantities are INT columns.
+MAX_QUANTITY = MAX_INT
+
+
+class InsufficientStock(Exception):
+    def __init__(self, variant_id, quantity):
+        super().__init__(f'variant {variant_id}: cannot apply {quantity}')
+        self.variant_id = variant_id
+        self.quantity = quantity
+
+
+class UnknownReservation(Exception):
+    """No open reservation with that id belongs to the caller."""
+
+
+def normalize_lines(lines):
+    """Merge ``[(variant_id, quantity), ...]`` into a variant-id-ordered list.
+
+    Every transaction touches inventory rows in the same (ascending) order, so
+    two carts sharing variants queue on row locks instead of deadlocking.
+    """
+    totals = Counter()
+    for variant_id, quantity in lines:
+        totals[positive_int(variant_id, 'variant_id')] += positive_int(quantity, 'quantity', MAX_QUANTITY)
+    if any(quantity > MAX_QUANTITY for quantity in totals.values()):
+        raise ValueError('quantity must be a positive integer')
+    return sorted(totals.items())
+
+
+def _apply(lines, condition, **changes):
+    now = timezone.now()
+    with transaction.atomic():
+        for variant_id, quantity in normalize_lines(lines):
+            # A single conditional UPDATE checks and writes under the row lock,
+            # so there is no read-then-write window for another checkout.
+            updated = (ProductInventory.objects
+                       .filter(variant_id=variant_id, **condition(quantity))
+                       .update(last_updated_at=now, **{k: f(quantity) for k, f in changes.items()}))
+            if not updated:
+                # Raising rolls back the lines already applied in this transaction.
+                raise InsufficientStock(variant_id, quantity)
+        listings.refresh_stock_on_commit(variant_id for variant_id, _ in normalize_lines(lines))
+
+
+def reserve(lines, user_id):
+    """Hold stock for a cart: all lines succeed or none do.
+
+    Returns the reservation id; commit and release take that id rather than
+    variant ids, so only the holder can act on the stock it reserved, once.
+    """
+    lines = normalize_lines(lines)
+    reservation_id = uuid.uuid4().hex
+    with transaction.atomic():
+        _apply(
+            lines,
+            lambda n: {'quantity_available__gte': F('quantity_reserved') + n},
+            quantity_reserved=lambda n: F('quantity_reserved') + n,
+        )
+        StockReservations.objects.create(
+            reservation_id=reservation_id, user_id=user_id, lines_json=[list(line) for line in lines],
+            status='held', created_at=timezone.now(),
+        )
+    return reservation_id
+
+
+def _close(reservation_id, user_id, new_status, **changes):
+    with transaction.atomic():
+        held = StockReservations.objects.filter(pk=reservation_id, status='held')
+        if user_id is not None:
+            held = held.filter(user_id=user_id)
+        # The conditional UPDATE claims the reservation under its row lock, so a
+        # retried or concurrent request cannot apply the same lines twice.
+        if not held.update(status=new_status, closed_at=timezone.now()):
+            raise UnknownReservation(reservation_id)
+        lines = StockReservations.objects.values_list('lines_json', flat=True).get(pk=reservation_id)
+        _apply([tuple(line) for line in lines], lambda n: {'quantity_reserved__gte': n}, **changes)
+
+
+def commit(reservation_id, user_id=None):
+    """Turn held stock into a sale once the order is paid; ``user_id=None`` skips the holder check."""
+    _close(
+        reservation_id, user_id, 'committed',
+        quantity_reserved=lambda n: F('quantity_reserved') - n,
+        quantity_available=lambda n: F('quantity_available') - n,
+    )
+
+
+def release(reservation_id, user_id=None):
+    """Give held stock back, e.g. on cart expiry or payment failure."""
+    _close(reservation_id, user_id, 'released', quantity_reserved=lambda n: F('quantity_reserved') - n)
+
+
+def _set_existing(variant_id, quantity, now):
+    return (ProductInventory.objects
+            .filter(variant_id=variant_id, quantity_reserved__lte=quantity)
+            .update(quantity_available=quantity, last_updated_at=now))
+
+
+def set_stock(variant_id, quantity):
+    """Set on-hand stock, refusing to drop below what is already reserved."""
+    if not 0 <= quantity <= MAX_QUANTITY:
+        raise ValueError(f'quantity must be between 0 and {MAX_QUANTITY}')
+    now = timezone.now()
+    if not _set_existing(variant_id, quantity, now):
+        if ProductInventory.objects.filter(variant_id=variant_id).exists():
+            raise InsufficientStock(variant_id, quantity)
+        try:
+            with transaction.atomic():
+                ProductInventory.objects.create(
+                    variant_id=variant_id, quantity_available=quantity, quantity_reserved=0, last_updated_at=now,
+                )
+        except IntegrityError:
+            # Only a duplicate key means another writer created the row first;
+            # anything else (an unknown variant, say) is the caller's to handle.
+            if not ProductInventory.objects.filter(variant_id=variant_id).exists():
+                raise
+            # Go back through the guarded UPDATE once; the row cannot vanish again.
+            if not _set_existing(variant_id, quantity, now):
+                raise InsufficientStock(variant_id, quantity)
+    listings.refresh_stock_on_commit([variant_id])
+
+
+def bulk_set_stock(quantities, chunk_size=500):
+    """Set on-hand stock for many variants with set-based UPDATEs.
+
+    ``quantities`` maps variant_id -> new quantity. Returns the set of variant
+    ids that were refused because the new quantity is below what is reserved.
+    """
+    refused = set()
+    items = sorted(quantities.items())
+    now = timezone.now()
+    for start in range(0, len(items), chunk_size):
+        chunk = dict(items[start:start + chunk_size])
+        reserved = dict(ProductInventory.objects.filter(variant_id__in=chunk).values_list('variant_id', 'quantity_reserved'))
+        ok = {vid: q for vid, q in chunk.items() if vid in reserved and reserved[vid] <= q}
+        refused.update(vid for vid in chunk if vid in reserved and vid not in ok)
+        if ok:
+            target = Case(*[When(variant_id=vid, then=Value(q)) for vid, q in ok.items()], output_field=IntegerField())
+            # The reservation guard is repeated in the UPDATE so a checkout that
+            # lands between the read and the write still cannot be oversold.
+            updated = (ProductInventory.objects
+                       .filter(variant_id__in=ok, quantity_reserved__lte=target)
+                       .update(quantity_available=target, last_updated_at=now))
+            if updated != len(ok):
+                lost = ProductInventory.objects.filter(variant_id__in=ok, quantity_reserved__gt=target)
+                refused.update(lost.values_list('variant_id', flat=True))
+        for vid, q in chunk.items():
+            if vid in reserved:
+                continue
+            # New rows are rare; set_stock handles a concurrent insert of the same variant.
+            try:
+                set_stock(vid, q)
+            except InsufficientStock:
+                refused.add(vid)
+    listings.refresh_stock_on_commit(vid for vid in quantities if vid not in refused)
+    return refused
@@ -0,0 +1,133 @@
+from django.db import transaction
+from django.db.models import F, Max, Min
+from django.utils import timezone
+
+from config.db import bulk_upsert
+from config.pagination import keyset_page
+from .catalog import invalidate_listings
+from .models import ProductImages, ProductInventory, ProductListings, Products, ProductVariants
+
+COLUMNS = (
+    'product_id', 'shop_id', 'category_id', 'status', 'product_name', 'product_slug',
+    'min_price', 'max_price', 'default_variant_id', 'in_stock', 'primary_image_url', 'updated_at',
+)
+LISTING_FIELDS = COLUMNS[:-1]
+# sort name -> (keyset keys, descending)
+SORTS = {
+    'newest': (('product_id',), True),
+    'price_asc': (('min_price', 'product_id'), False),
+    'price_desc': (('min_price', 'product_id'), True),
+}
+BATCH_SIZE = 500
+
+
+def _first_per_product(rows):
+    first = {}
+    for product_id, value in rows:
+        first.setdefault(product_id, value)
+    return first
+
+
+def _in_stock(product_ids):
+    rows = (ProductInventory.objects
+            .filter(variant__product_id__in=product_ids, quantity_available__gt=F('quantity_reserved'))
+            .values_list('variant__product_id', flat=True)
+            .distinct())
+    return set(rows)
+
+
+def refresh(product_ids):
+    """Recompute listing rows for ``product_ids`` with a fixed number of set-based queries per batch."""
+    product_ids = sorted(set(product_ids))
+    now = timezone.now()
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        batch = product_ids[start:start + BATCH_SIZE]
+        base = Products.objects.filter(pk__in=batch).values_list(
+            'product_id', 'shop_id', 'category_id', 'status', 'product_name', 'product_slug',
+        )
+        variants = ProductVariants.objects.filter(product_id__in=batch)
+        prices = {
+            r['product_id']: (r['lo'], r['hi'])
+            for r in variants.values('product_id').annotate(lo=Min('price'), hi=Max('price')).order_by()
+        }
+        defaults = _first_per_product(
+            variants.order_by('product_id', '-is_default', 'variant_id').values_list('product_id', 'variant_id')
+        )
+        images = _first_per_product(
+            ProductImages.objects.filter(product_id__in=batch)
+            .order_by('product_id', '-is_primary', 'sort_order', 'image_id')
+            .values_list('product_id', 'image_url')
+        )
+        stocked = _in_stock(batch)
+        rows = [
+            row + prices.get(row[0], (None, None)) + (defaults.get(row[0]), row[0] in stocked, images.get(row[0]), now)
+            for row in base
+        ]
+        stored = {r[0]: r for r in ProductListings.objects.filter(product_id__in=batch).values_list(*LISTING_FIELDS)}
+        # Most saves (an edit to a field no listing shows) leave the rows as
+        # they were; only real changes are written and retire cached pages.
+        changed = [row for row in rows if stored.get(row[0]) != row[:-1]]
+        gone = set(stored) - {row[0] for row in rows}
+        if not changed and not gone:
+            continue
+        with transaction.atomic():
+            if changed:
+                bulk_upsert(ProductListings._meta.db_table, COLUMNS, ('product_id',), changed, replace=COLUMNS[1:])
+            if gone:
+                ProductListings.objects.filter(product_id__in=gone).delete()
+            # Retire cached list pages once the new rows are visible to other readers.
+            transaction.on_commit(invalidate_listings)
+
+
+def refresh_stock(product_ids):
+    """Cheap path for inventory changes: only the in_stock flag can move."""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    stocked = _in_stock(product_ids)
+    now = timezone.now()
+    flipped = ProductListings.objects.filter(product_id__in=stocked, in_stock=False).update(in_stock=True, updated_at=now)
+    flipped += ProductListings.objects.filter(product_id__in=product_ids - stocked, in_stock=True).update(in_stock=False, updated_at=now)
+    # Most checkouts leave the flag as it was; only a real flip retires the cached pages.
+    if flipped:
+        transaction.on_commit(invalidate_listings)
+
+
+def refresh_stock_for_variants(variant_ids):
+    product_ids = ProductVariants.objects.filter(pk__in=list(variant_ids)).values_list('product_id', flat=True)
+    refresh_stock(set(product_ids))
+
+
+def refresh_stock_on_commit(variant_ids):
+    variant_ids = list(variant_ids)
+    transaction.on_commit(lambda: refresh_stock_for_variants(variant_ids))
+
+
+def rebuild(batch_size=5000):
+    total = 0
+    ids = Products.objects.order_by('pk').values_list('pk', flat=True)
+    batch = []
+    for pid in ids.iterator(chunk_size=batch_size):
+        batch.append(pid)
+        if len(batch) >= batch_size:
+            refresh(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        refresh(batch)
+        total += len(batch)
+    return total
+
+
+def listing_page(qs, sort, cursor, limit, params):
+    """Keyset page of listing rows; ``params`` may carry in_stock / min_price / max_price."""
+    keys, descending = SORTS[sort]
+    if params.get('in_stock'):
+        qs = qs.filter(in_stock=True)
+    if params.get('min_price') is not None:
+        qs = qs.filter(min_price__gte=params['min_price'])
+    if params.get('max_price') is not None:
+        qs = qs.filter(min_price__lte=params['max_price'])
+    if 'min_price' in keys:
+        qs = qs.filter(min_price__isnull=False)
+    return keyset_page(qs.values(*LISTING_FIELDS), keys, cursor, limit, descending=descending)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from products import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Fold new orders into the co-purchase matrix and refresh "frequently bought together" lists'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='discard the matrix and rescan every order')
+        parser.add_argument('--top-k', type=int, default=recommendations.TOP_K)
+
+    def handle(self, *args, **options):
+        orders, products = recommendations.update(full=options['full'], k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {orders} orders, refreshed {products} products'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importer import BATCH_SIZE, PARSERS, CatalogImporter
+from shop.models import Shops
+
+
+class Command(BaseCommand):
+    help = 'Bulk import products for a shop from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('shop_id', type=int)
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(PARSERS), help='defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if not Shops.objects.filter(pk=options['shop_id']).exists():
+            raise CommandError('Shop not found')
+        fmt = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+        if fmt not in PARSERS:
+            raise CommandError('Use --format csv or --format jsonl')
+        importer = CatalogImporter(options['shop_id'], batch_size=options['batch_size'])
+        with open(options['path'], 'rb') as fh:
+            report = importer.run(PARSERS[fmt](fh))
+        for error in report['errors']:
+            self.stdout.write(self.style.WARNING(f"row {error['row']}: {error['error']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['created']} products ({report['error_count']} rows rejected)"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products import categories
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the category_closure table from categories.parent_category_id'
+
+    def handle(self, *args, **options):
+        count = categories.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt category tree ({count} closure rows)'))
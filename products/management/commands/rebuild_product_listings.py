@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products import listings
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized product_listings rows for every product'
+
+    def handle(self, *args, **options):
+        count = listings.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} product listings'))
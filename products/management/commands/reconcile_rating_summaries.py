@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from products import ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute product and shop rating summaries from approved reviews to repair drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help='ids per chunk')
+        parser.add_argument('--products-only', action='store_true')
+
+    def handle(self, *args, **options):
+        fields = ('product_id',) if options['products_only'] else ('product_id', 'shop_id')
+        for field in fields:
+            count = ratings.reconcile(field, chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f'Reconciled {count} rating summaries by {field}'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products import reviews
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized helpful/unhelpful counters on reviews from review_votes'
+
+    def handle(self, *args, **options):
+        count = reviews.recount_votes()
+        self.stdout.write(self.style.SUCCESS(f'Recounted votes for {count} reviews'))
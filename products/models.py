@@ -24,7 +24,7 @@ class CustomReports(models.Model):
     report_name = models.CharField(max_length=255)
     report_type = models.CharField(max_length=100)
     filters_json = models.JSONField()
-    created_by = models.ForeignKey('UserProfiles', models.DO_NOTHING, db_column='created_by', to_field='keycloak_user_id')
+    created_by = models.ForeignKey('users.UserProfiles', models.DO_NOTHING, db_column='created_by', to_field='keycloak_user_id')
     created_at = models.DateTimeField()
     last_run_at = models.DateTimeField(blank=True, null=True)
 
@@ -53,7 +53,7 @@ class ReportsReport(models.Model):
     status = models.CharField(max_length=50)
     created_at = models.DateTimeField()
     updated_at = models.DateTimeField()
-    user = models.ForeignKey('UsersUser', models.DO_NOTHING)
+    user = models.ForeignKey('users.UsersUser', models.DO_NOTHING)
 
     class Meta:
         managed = False
@@ -75,7 +75,7 @@ class ReviewImages(models.Model):
 class ReviewModeration(models.Model):
     moderation_id = models.BigAutoField(primary_key=True)
     review = models.ForeignKey('Reviews', models.DO_NOTHING)
-    moderator = models.ForeignKey('UserProfiles', models.DO_NOTHING, to_field='keycloak_user_id')
+    moderator = models.ForeignKey('users.UserProfiles', models.DO_NOTHING, to_field='keycloak_user_id')
     action = models.CharField(max_length=7)
     reason = models.TextField(blank=True, null=True)
     moderated_at = models.DateTimeField()
@@ -88,7 +88,7 @@ class ReviewModeration(models.Model):
 class ReviewResponses(models.Model):
     response_id = models.BigAutoField(primary_key=True)
     review = models.OneToOneField('Reviews', models.DO_NOTHING)
-    responder = models.ForeignKey('UserProfiles', models.DO_NOTHING, to_field='keycloak_user_id')
+    responder = models.ForeignKey('users.UserProfiles', models.DO_NOTHING, to_field='keycloak_user_id')
     response_text = models.TextField()
     created_at = models.DateTimeField()
     updated_at = models.DateTimeField()
@@ -101,7 +101,7 @@ class ReviewResponses(models.Model):
 class ReviewVotes(models.Model):
     vote_id = models.BigAutoField(primary_key=True)
     review = models.ForeignKey('Reviews', models.DO_NOTHING)
-    user = models.ForeignKey('UserProfiles', models.DO_NOTHING, to_field='keycloak_user_id')
+    user = models.ForeignKey('users.UserProfiles', models.DO_NOTHING, to_field='keycloak_user_id')
     vote_type = models.CharField(max_length=11)
     created_at = models.DateTimeField()
 
@@ -114,14 +114,19 @@ class ReviewVotes(models.Model):
 class Reviews(models.Model):
     review_id = models.BigAutoField(primary_key=True)
     product = models.ForeignKey("Products", models.DO_NOTHING)
-    order_item = models.OneToOneField("OrderItems", models.DO_NOTHING)
-    customer = models.ForeignKey('UserProfiles', models.DO_NOTHING, to_field='keycloak_user_id')
-    shop = models.ForeignKey('Shops', models.DO_NOTHING)
+    order_item = models.OneToOneField('orders.OrderItems', models.DO_NOTHING)
+    customer = models.ForeignKey('users.UserProfiles', models.DO_NOTHING, to_field='keycloak_user_id')
+    shop = models.ForeignKey('shop.Shops', models.DO_NOTHING)
     rating = models.PositiveIntegerField()
     title = models.CharField(max_length=255, blank=True, null=True)
     review_text = models.TextField(blank=True, null=True)
     is_verified_purchase = models.IntegerField()
     status = models.CharField(max_length=8)
+    helpful_count = models.PositiveIntegerField(default=0)
+    unhelpful_count = models.PositiveIntegerField(default=0)
+    helpful_score = models.IntegerField(default=0)
+    leased_by = models.CharField(max_length=255, blank=True, null=True)
+    leased_until = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField()
     updated_at = models.DateTimeField()
 
@@ -201,6 +206,19 @@ class ProductInventory(models.Model):
         db_table = 'product_inventory'
 
 
+class StockReservations(models.Model):
+    reservation_id = models.CharField(primary_key=True, max_length=32)
+    user_id = models.PositiveBigIntegerField()
+    lines_json = models.JSONField()
+    status = models.CharField(max_length=9)
+    created_at = models.DateTimeField()
+    closed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        managed = False
+        db_table = 'stock_reservations'
+
+
 class ProductReviewsSummary(models.Model):
     summary_id = models.BigAutoField(primary_key=True)
     product = models.OneToOneField('Products', models.DO_NOTHING)
@@ -252,7 +270,7 @@ class Categories(models.Model):
 
 class Products(models.Model):
     product_id = models.BigAutoField(primary_key=True)
-    shop = models.ForeignKey('Shops', models.DO_NOTHING)
+    shop = models.ForeignKey('shop.Shops', models.DO_NOTHING)
     category = models.ForeignKey(Categories, models.DO_NOTHING)
     product_name = models.CharField(max_length=255)
     product_slug = models.CharField(max_length=255)
@@ -260,7 +278,7 @@ class Products(models.Model):
     short_description = models.CharField(max_length=512, blank=True, null=True)
     sku = models.CharField(max_length=100, blank=True, null=True)
     brand = models.CharField(max_length=100, blank=True, null=True)
-    status = models.CharField(max_length=8)
+    status = models.CharField(max_length=12)
     featured = models.IntegerField()
     created_at = models.DateTimeField()
     updated_at = models.DateTimeField()
@@ -279,7 +297,7 @@ class ProductsProduct(models.Model):
     status = models.CharField(max_length=50)
     created_at = models.DateTimeField()
     updated_at = models.DateTimeField()
-    shop = models.ForeignKey('ShopShop', models.DO_NOTHING)
+    shop = models.ForeignKey('shop.ShopShop', models.DO_NOTHING)
     category = models.CharField(max_length=100)
 
     class Meta:
@@ -287,18 +305,58 @@ class ProductsProduct(models.Model):
         db_table = 'products_product'
 
 
-class Categories(models.Model):
-    category_id = models.BigAutoField(primary_key=True)
-    parent_category = models.ForeignKey('self', models.DO_NOTHING, blank=True, null=True)
-    category_name = models.CharField(max_length=255)
-    category_slug = models.CharField(unique=True, max_length=255)
-    description = models.TextField(blank=True, null=True)
-    image_url = models.CharField(max_length=2048, blank=True, null=True)
-    commission_rate_override = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True)
-    sort_order = models.IntegerField()
-    is_active = models.IntegerField()
-    created_at = models.DateTimeField()
+class CategoryClosure(models.Model):
+    closure_id = models.BigAutoField(primary_key=True)
+    ancestor = models.ForeignKey('Categories', models.DO_NOTHING, related_name='descendant_links')
+    descendant = models.ForeignKey('Categories', models.DO_NOTHING, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        managed = False
+        db_table = 'category_closure'
+        unique_together = (('ancestor', 'descendant'),)
+
+
+class ProductCopurchaseCounts(models.Model):
+    pair_id = models.BigAutoField(primary_key=True)
+    product_a = models.ForeignKey('Products', models.DO_NOTHING, related_name='+')
+    product_b = models.ForeignKey('Products', models.DO_NOTHING, related_name='+')
+    order_count = models.PositiveIntegerField()
+
+    class Meta:
+        managed = False
+        db_table = 'product_copurchase_counts'
+        unique_together = (('product_a', 'product_b'),)
+
+
+class ProductRecommendations(models.Model):
+    recommendation_id = models.BigAutoField(primary_key=True)
+    product = models.ForeignKey('Products', models.DO_NOTHING, related_name='recommendations')
+    related_product = models.ForeignKey('Products', models.DO_NOTHING, related_name='+')
+    score = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'product_recommendations'
+        unique_together = (('product', 'rank'),)
+
+
+class ProductListings(models.Model):
+    product = models.OneToOneField('Products', models.DO_NOTHING, primary_key=True, related_name='listing')
+    shop_id = models.PositiveBigIntegerField()
+    category_id = models.PositiveBigIntegerField()
+    status = models.CharField(max_length=12)
+    product_name = models.CharField(max_length=255)
+    product_slug = models.CharField(max_length=255)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    default_variant_id = models.PositiveBigIntegerField(blank=True, null=True)
+    in_stock = models.BooleanField()
+    primary_image_url = models.CharField(max_length=2048, blank=True, null=True)
+    updated_at = models.DateTimeField()
 
     class Meta:
         managed = False
-        db_table = 'categories'
\ No newline at end of file
+        db_table = 'product_listings'
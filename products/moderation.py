@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, CharField, Q, Value, When
+from django.utils import timezone
+
+from . import ratings
+from .models import ReviewModeration, Reviews
+
+LEASE_SECONDS = getattr(settings, 'REVIEW_MODERATION_LEASE_SECONDS', 600)
+MAX_BATCH = 200
+# moderation action -> resulting review status
+ACTIONS = {'approve': 'approved', 'reject': 'rejected'}
+LEASE_FIELDS = ('review_id', 'product_id', 'shop_id', 'customer_id', 'rating', 'title', 'review_text', 'created_at')
+
+
+def _available(now):
+    return Q(status='pending') & (Q(leased_until__isnull=True) | Q(leased_until__lt=now))
+
+
+def lease(moderator_id, size=50):
+    """Hand ``moderator_id`` up to ``size`` pending reviews nobody else holds.
+
+    SKIP LOCKED lets concurrent moderators grab disjoint rows without waiting
+    on each other; the lease columns keep the rows reserved after the
+    transaction ends, until the decision arrives or the lease expires.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(Reviews.objects.select_for_update(skip_locked=True)
+                   .filter(_available(now)).order_by('created_at', 'review_id')
+                   .values_list('review_id', flat=True)[:min(size, MAX_BATCH)])
+        if not ids:
+            return []
+        Reviews.objects.filter(pk__in=ids).update(
+            leased_by=moderator_id, leased_until=now + timedelta(seconds=LEASE_SECONDS),
+        )
+    return list(Reviews.objects.filter(pk__in=ids).order_by('created_at', 'review_id').values(*LEASE_FIELDS))
+
+
+def release(moderator_id, review_ids=None):
+    qs = Reviews.objects.filter(leased_by=moderator_id, status='pending')
+    if review_ids is not None:
+        qs = qs.filter(pk__in=list(review_ids))
+    return qs.update(leased_by=None, leased_until=None)
+
+
+def decide(moderator_id, decisions):
+    """Apply ``[{review_id, action, reason}]`` for reviews leased to ``moderator_id``.
+
+    Returns ``(applied_ids, skipped_ids)``; reviews whose lease expired or moved
+    to someone else are skipped rather than overwritten.
+    """
+    wanted = {}
+    for d in decisions:
+        wanted[int(d['review_id'])] = (d['action'], d.get('reason') or None)
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(Reviews.objects.select_for_update()
+                    .filter(pk__in=wanted, leased_by=moderator_id, leased_until__gte=now, status='pending')
+                    .order_by('review_id')
+                    .values_list('review_id', 'product_id', 'shop_id', 'rating'))
+        ids = [row[0] for row in rows]
+        if ids:
+            new_status = Case(
+                *[When(review_id=rid, then=Value(ACTIONS[wanted[rid][0]])) for rid in ids],
+                output_field=CharField(),
+            )
+            Reviews.objects.filter(pk__in=ids).update(
+                status=new_status, leased_by=None, leased_until=None, updated_at=now,
+            )
+            ReviewModeration.objects.bulk_create([
+                ReviewModeration(review_id=rid, moderator_id=moderator_id, action=wanted[rid][0],
+                                 reason=wanted[rid][1], moderated_at=now)
+                for rid in ids
+            ])
+            # The UPDATE bypasses the Reviews signals, so apply the batch's summary delta here, once.
+            ratings.apply_deltas([
+                (product_id, shop_id, rating, +1)
+                for rid, product_id, shop_id, rating in rows if wanted[rid][0] == 'approve'
+            ])
+    return ids, sorted(set(wanted) - set(ids))
@@ -0,0 +1,164 @@
+import json
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min
+from django.utils import timezone
+
+from config.db import bulk_upsert
+from . import detail
+from .models import ProductReviewsSummary, RatingSummaries, Reviews
+
+RATINGS = (1, 2, 3, 4, 5)
+COUNT_FIELDS = tuple(f'rating_{r}_count' for r in RATINGS)
+COUNTED_STATUS = 'approved'
+
+
+def contribution(status, rating):
+    """The (rating, +1) a review adds to its summaries, or None if it doesn't count."""
+    if status == COUNTED_STATUS and rating in RATINGS:
+        return rating
+    return None
+
+
+def _average(counts):
+    total = sum(counts)
+    if not total:
+        return Decimal('0.00')
+    weighted = sum(r * n for r, n in zip(RATINGS, counts))
+    return (Decimal(weighted) / total).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def _distribution(counts):
+    return {str(r): n for r, n in zip(RATINGS, counts)}
+
+
+def _apply_target(field, target_id, buckets, now):
+    """Add ``buckets`` ({rating: delta}) to one rating_summaries row; returns the new counts."""
+    rows = RatingSummaries.objects.filter(**{field: target_id})
+    changes = {f'rating_{r}_count': F(f'rating_{r}_count') + d for r, d in buckets.items() if d}
+    if not changes:
+        return None
+    total_delta = sum(buckets.values())
+    if rows.update(total_reviews=F('total_reviews') + total_delta, last_updated_at=now, **changes):
+        # The UPDATE holds the row lock until commit, so this read sees our own write.
+        counts = rows.values_list(*COUNT_FIELDS).first()
+        rows.update(average_rating=_average(counts))
+        return counts
+    counts = tuple(max(buckets.get(r, 0), 0) for r in RATINGS)
+    try:
+        with transaction.atomic():
+            RatingSummaries.objects.create(
+                **{field: target_id}, total_reviews=sum(counts), average_rating=_average(counts),
+                last_updated_at=now, **dict(zip(COUNT_FIELDS, counts)),
+            )
+    except IntegrityError:
+        # Another writer created the row first; fall back to the increment path.
+        return _apply_target(field, target_id, buckets, now)
+    return counts
+
+
+def apply_deltas(deltas):
+    """Apply ``[(product_id, shop_id, rating, +1|-1), ...]`` to the rating summaries.
+
+    Each affected product or shop costs a constant number of single-row
+    statements, independent of how many reviews it already has.
+    """
+    by_product, by_shop = defaultdict(lambda: defaultdict(int)), defaultdict(lambda: defaultdict(int))
+    for product_id, shop_id, rating, sign in deltas:
+        by_product[product_id][rating] += sign
+        by_shop[shop_id][rating] += sign
+    now = timezone.now()
+    with transaction.atomic():
+        # Fixed lock order across writers.
+        for product_id in sorted(by_product):
+            counts = _apply_target('product_id', product_id, by_product[product_id], now)
+            if counts is not None:
+                _write_product_summary(product_id, counts, now)
+        for shop_id in sorted(by_shop):
+            _apply_target('shop_id', shop_id, by_shop[shop_id], now)
+        # The summary upsert bypasses post_save, so drop the cached detail documents here.
+        product_ids = list(by_product)
+        transaction.on_commit(lambda: detail.invalidate_many(product_ids))
+
+
+def _write_product_summary(product_id, counts, now):
+    bulk_upsert(
+        ProductReviewsSummary._meta.db_table,
+        ('product_id', 'average_rating', 'total_reviews', 'rating_distribution_json', 'last_updated_at'),
+        ('product_id',),
+        [(product_id, _average(counts), sum(counts), json.dumps(_distribution(counts)), now)],
+        replace=('average_rating', 'total_reviews', 'rating_distribution_json', 'last_updated_at'),
+    )
+
+
+def review_changed(review, before, after):
+    """Deltas for one review going from ``before`` to ``after`` ((status, rating) or None)."""
+    old = contribution(*before) if before else None
+    new = contribution(*after) if after else None
+    if old == new:
+        return []
+    deltas = []
+    if old is not None:
+        deltas.append((review.product_id, review.shop_id, old, -1))
+    if new is not None:
+        deltas.append((review.product_id, review.shop_id, new, +1))
+    return deltas
+
+
+# --- Reconciliation -------------------------------------------------------
+
+def _reconcile_range(field, low, high):
+    """Recompute summaries for ``field`` ids in [low, high] from reviews; returns rows written."""
+    with transaction.atomic():
+        # Lock the existing summaries first, so apply_deltas cannot add a delta
+        # between the recount and the overwrite; the recount below then sees
+        # every review whose delta already landed. Targets that still have a
+        # summary but no approved reviews are reset to zero.
+        counts = defaultdict(lambda: [0] * len(RATINGS))
+        existing = (RatingSummaries.objects.select_for_update()
+                    .filter(**{f'{field}__gte': low, f'{field}__lte': high}).order_by(field))
+        for target_id in existing.values_list(field, flat=True):
+            counts[target_id]
+        rows = (Reviews.objects
+                .filter(status=COUNTED_STATUS, **{f'{field}__gte': low, f'{field}__lte': high})
+                .values(field, 'rating').annotate(n=Count('review_id')).order_by())
+        for row in rows:
+            if row['rating'] in RATINGS:
+                counts[row[field]][row['rating'] - 1] = row['n']
+        now = timezone.now()
+        bulk_upsert(
+            RatingSummaries._meta.db_table,
+            (field, 'average_rating', 'total_reviews') + COUNT_FIELDS + ('last_updated_at',),
+            (field,),
+            [(tid, _average(c), sum(c)) + tuple(c) + (now,) for tid, c in counts.items()],
+            replace=('average_rating', 'total_reviews') + COUNT_FIELDS + ('last_updated_at',),
+        )
+        if field == 'product_id':
+            bulk_upsert(
+                ProductReviewsSummary._meta.db_table,
+                ('product_id', 'average_rating', 'total_reviews', 'rating_distribution_json', 'last_updated_at'),
+                ('product_id',),
+                [(tid, _average(c), sum(c), json.dumps(_distribution(c)), now) for tid, c in counts.items()],
+                replace=('average_rating', 'total_reviews', 'rating_distribution_json', 'last_updated_at'),
+            )
+            product_ids = list(counts)
+            transaction.on_commit(lambda: detail.invalidate_many(product_ids))
+    return len(counts)
+
+
+def reconcile(field='product_id', chunk_size=10000):
+    """Rebuild summaries from scratch one id-range chunk at a time; returns rows written.
+
+    Chunks run serially: each holds its summary rows locked only for its own
+    short transaction, so live review writes interleave between chunks
+    instead of contending with parallel writers.
+    """
+    bounds = Reviews.objects.aggregate(lo=Min(field), hi=Max(field))
+    if bounds['lo'] is None:
+        return 0
+    return sum(
+        _reconcile_range(field, low, min(low + chunk_size - 1, bounds['hi']))
+        for low in range(bounds['lo'], bounds['hi'] + 1, chunk_size)
+    )
@@ -0,0 +1,175 @@
+import heapq
+from array import array
+from collections import defaultdict
+from itertools import combinations, groupby
+
+from django.db import transaction
+from django.utils import timezone
+
+from config.db import bulk_upsert
+from orders.models import OrderItems
+from reports.jobs import get_watermark, set_watermark, settled_order_id
+from .models import ProductCopurchaseCounts, ProductRecommendations
+
+JOB_NAME = 'product_copurchase'
+TOP_K = 10
+# Orders with more distinct products than this add O(n^2) pairs for little signal.
+MAX_ITEMS_PER_ORDER = 50
+# Pair occurrences buffered (8 bytes each) before they are merged into the table.
+FLUSH_PAIRS = 1000000
+EXCLUDED_ITEM_STATUSES = ('cancelled', 'refunded')
+
+
+def _order_baskets(after_order_id, up_to_order_id):
+    """Yield the distinct product ids of each order, streaming order_items in order_id order."""
+    items = (OrderItems.objects
+             .filter(order_id__gt=after_order_id, order_id__lte=up_to_order_id)
+             .exclude(status__in=EXCLUDED_ITEM_STATUSES)
+             .order_by('order_id')
+             .values_list('order_id', 'product_id')
+             .iterator(chunk_size=5000))
+    for order_id, rows in groupby(items, key=lambda r: r[0]):
+        yield order_id, sorted({product_id for _, product_id in rows})
+
+
+class PairBuffer:
+    """Co-purchase pairs of one flush as packed int64 keys rather than a Counter of tuples.
+
+    Product ids are mapped to dense per-run indexes, so a pair (a < b) packs
+    into one ``array('q')`` slot; counts come from sorting the keys at flush
+    time, which costs one pass instead of a dict entry per distinct pair.
+    """
+
+    def __init__(self):
+        self.index = {}
+        self.products = []
+        self.keys = array('q')
+        self.touched = set()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _dense(self, product_id):
+        i = self.index.get(product_id)
+        if i is None:
+            i = self.index[product_id] = len(self.products)
+            self.products.append(product_id)
+        return i
+
+    def add(self, basket):
+        """Record every pair of ``basket`` (distinct product ids in ascending order)."""
+        dense = [self._dense(pid) for pid in basket]
+        self.touched.update(dense)
+        self.keys.extend((a << 32) | b for a, b in combinations(dense, 2))
+
+    def counts(self):
+        """``[(product_a_id, product_b_id, n), ...]`` sorted by pair, so writers lock rows in one order."""
+        products = self.products
+        return sorted(
+            (products[key >> 32], products[key & 0xFFFFFFFF], sum(1 for _ in run))
+            for key, run in groupby(sorted(self.keys))
+        )
+
+    def touched_products(self):
+        return {self.products[i] for i in self.touched}
+
+    def clear(self):
+        self.keys = array('q')
+        self.touched = set()
+
+
+def _merge(buffer, watermark, k):
+    """Fold ``buffer`` in; returns the product ids whose top-K lists were rebuilt."""
+    touched = buffer.touched_products()
+    # Counts, the top-K lists they feed and the watermark move together, so a
+    # run that dies part-way neither double-counts nor leaves stale lists.
+    with transaction.atomic():
+        _upsert_pairs(buffer.counts())
+        _store_top_k(touched, k)
+        set_watermark(JOB_NAME, watermark)
+    return touched
+
+
+def _upsert_pairs(counts):
+    bulk_upsert(
+        ProductCopurchaseCounts._meta.db_table,
+        ('product_a_id', 'product_b_id', 'order_count'),
+        ('product_a_id', 'product_b_id'),
+        counts,
+        increment=('order_count',),
+    )
+
+
+def _top_neighbours(product_ids, k):
+    neighbours = defaultdict(list)
+    pairs = ProductCopurchaseCounts.objects.values_list('product_a_id', 'product_b_id', 'order_count')
+    for a, b, n in pairs.filter(product_a_id__in=product_ids).iterator(chunk_size=5000):
+        neighbours[a].append((n, b))
+    for a, b, n in pairs.filter(product_b_id__in=product_ids).iterator(chunk_size=5000):
+        neighbours[b].append((n, a))
+    return {pid: heapq.nlargest(k, neighbours[pid], key=lambda x: (x[0], -x[1])) for pid in product_ids}
+
+
+def _store_top_k(product_ids, k, batch_size=500):
+    product_ids = sorted(product_ids)
+    now = timezone.now()
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+        top = _top_neighbours(batch, k)
+        with transaction.atomic():
+            ProductRecommendations.objects.filter(product_id__in=batch).delete()
+            ProductRecommendations.objects.bulk_create([
+                ProductRecommendations(product_id=pid, related_product_id=other, score=n, rank=rank, updated_at=now)
+                for pid in batch
+                for rank, (n, other) in enumerate(top[pid], start=1)
+            ])
+
+
+def update(full=False, k=TOP_K):
+    """Fold orders placed since the watermark into the co-purchase matrix.
+
+    Pair counts live in a sparse (a < b) table that is only ever incremented,
+    so a run costs O(new orders); top-K lists are recomputed, with each flush,
+    only for products that appeared in its orders. Returns
+    ``(orders_seen, products_refreshed)``.
+    """
+    if full:
+        with transaction.atomic():
+            ProductCopurchaseCounts.objects.all().delete()
+            ProductRecommendations.objects.all().delete()
+            set_watermark(JOB_NAME, 0)
+    start = get_watermark(JOB_NAME)
+    # Fix the upper bound first, behind any checkout still in flight, so later
+    # or slower orders wait for the next run instead of falling under the watermark.
+    end = settled_order_id()
+    if end <= start:
+        return 0, 0
+
+    buffer, refreshed, orders = PairBuffer(), set(), 0
+    for order_id, basket in _order_baskets(start, end):
+        orders += 1
+        if len(basket) < 2 or len(basket) > MAX_ITEMS_PER_ORDER:
+            continue
+        buffer.add(basket)
+        if len(buffer) >= FLUSH_PAIRS:
+            refreshed |= _merge(buffer, order_id, k)
+            buffer.clear()
+    refreshed |= _merge(buffer, end, k)
+    return orders, len(refreshed)
+
+
+def for_product(product_id):
+    """Precomputed neighbours of ``product_id``: one indexed read on (product_id, rank)."""
+    rows = (ProductRecommendations.objects
+            .filter(product_id=product_id, related_product__status='approved')
+            .order_by('rank')
+            .values('related_product_id', 'related_product__product_name', 'related_product__product_slug', 'score'))
+    return [
+        {
+            'product_id': r['related_product_id'],
+            'product_name': r['related_product__product_name'],
+            'product_slug': r['related_product__product_slug'],
+            'score': r['score'],
+        }
+        for r in rows
+    ]
@@ -0,0 +1,103 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from config.pagination import keyset_page
+from .models import ReviewImages, ReviewResponses, Reviews, ReviewVotes
+
+VOTE_TYPES = ('helpful', 'not_helpful')
+VISIBLE_STATUS = 'approved'
+REVIEW_FIELDS = (
+    'review_id', 'product_id', 'shop_id', 'customer_id', 'rating', 'title', 'review_text',
+    'is_verified_purchase', 'helpful_count', 'unhelpful_count', 'helpful_score', 'created_at',
+)
+# sort name -> keyset keys, always newest / highest first
+SORTS = {
+    'newest': ('created_at', 'review_id'),
+    'helpful': ('helpful_score', 'review_id'),
+}
+
+
+def _counter_changes(old, new):
+    """F() updates moving one vote from ``old`` to ``new`` (either may be None)."""
+    delta = {'helpful': 0, 'not_helpful': 0}
+    if old:
+        delta[old] -= 1
+    if new:
+        delta[new] += 1
+    changes = {}
+    if delta['helpful']:
+        changes['helpful_count'] = F('helpful_count') + delta['helpful']
+    if delta['not_helpful']:
+        changes['unhelpful_count'] = F('unhelpful_count') + delta['not_helpful']
+    if changes:
+        changes['helpful_score'] = F('helpful_score') + delta['helpful'] - delta['not_helpful']
+    return changes
+
+
+def cast_vote(review_id, user_id, vote_type):
+    """Record ``user_id``'s vote (or None to withdraw it) and keep the review counters in step."""
+    if vote_type is not None and vote_type not in VOTE_TYPES:
+        raise ValueError('vote_type')
+    with transaction.atomic():
+        existing = (ReviewVotes.objects.select_for_update()
+                    .filter(review_id=review_id, user_id=user_id).first())
+        old = existing.vote_type if existing else None
+        if old == vote_type:
+            return
+        if existing is None:
+            try:
+                with transaction.atomic():
+                    ReviewVotes.objects.create(review_id=review_id, user_id=user_id,
+                                               vote_type=vote_type, created_at=timezone.now())
+            except IntegrityError:
+                # A concurrent request from the same user won the insert; treat this one as a change.
+                return cast_vote(review_id, user_id, vote_type)
+        elif vote_type is None:
+            existing.delete()
+        else:
+            existing.vote_type = vote_type
+            existing.save(update_fields=['vote_type'])
+        Reviews.objects.filter(pk=review_id).update(**_counter_changes(old, vote_type))
+
+
+def review_page(product_id=None, shop_id=None, sort='newest', cursor=None, limit=20):
+    """Keyset page of approved reviews with their images and shop response attached.
+
+    The filter is an equality match on (product_id|shop_id, status), so the
+    page is a range scan on that index; images and responses for the whole
+    page come from one query each.
+    """
+    qs = Reviews.objects.filter(status=VISIBLE_STATUS)
+    qs = qs.filter(product_id=product_id) if product_id is not None else qs.filter(shop_id=shop_id)
+    rows, next_cursor = keyset_page(qs.values(*REVIEW_FIELDS), SORTS[sort], cursor, limit, descending=True)
+    ids = [row['review_id'] for row in rows]
+    images, responses = {}, {}
+    if ids:
+        for image in (ReviewImages.objects.filter(review_id__in=ids)
+                      .order_by('image_id').values('review_id', 'image_url', 'alt_text')):
+            images.setdefault(image.pop('review_id'), []).append(image)
+        for response in (ReviewResponses.objects.filter(review_id__in=ids)
+                         .values('review_id', 'responder_id', 'response_text', 'created_at', 'updated_at')):
+            responses[response.pop('review_id')] = response
+    for row in rows:
+        row['images'] = images.get(row['review_id'], [])
+        row['response'] = responses.get(row['review_id'])
+    return rows, next_cursor
+
+
+def recount_votes(review_ids=None):
+    """Rebuild the denormalized vote counters from review_votes; returns reviews updated."""
+    qs = Reviews.objects.all()
+    if review_ids is not None:
+        qs = qs.filter(pk__in=list(review_ids))
+    counts = qs.annotate(
+        h=Count('reviewvotes', filter=Q(reviewvotes__vote_type='helpful')),
+        u=Count('reviewvotes', filter=Q(reviewvotes__vote_type='not_helpful')),
+    ).values_list('review_id', 'h', 'u')
+    updated = 0
+    for review_id, helpful, unhelpful in counts.iterator():
+        updated += Reviews.objects.filter(pk=review_id).update(
+            helpful_count=helpful, unhelpful_count=unhelpful, helpful_score=helpful - unhelpful,
+        )
+    return updated
@@ -0,0 +1,210 @@
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Exists, OuterRef
+from django.db.models.expressions import RawSQL
+
+from config.caching import bump_version, get_version
+from .categories import subtree_ids
+from .models import Products, ProductVariants
+
+# Bumped, with a change-log entry, whenever a product's text or approval changes.
+SEARCH_NAMESPACE = 'products:search'
+# How long a change-log entry survives; a process further behind than this rebuilds.
+CHANGE_LOG_TIMEOUT = 3600
+# A process more versions behind than this rebuilds instead of replaying the log.
+MAX_CATCH_UP = 1000
+
+# Mirrors InnoDB's default innodb_ft_min_token_size so both backends agree on what is searchable.
+MIN_TOKEN_LENGTH = 3
+# Per-field weights for the in-process index (name matches rank above body matches).
+FIELD_WEIGHTS = (('product_name', 3.0), ('short_description', 2.0), ('description', 1.0))
+# A save that leaves all of these alone cannot change search results.
+INDEXED_FIELDS = ('status',) + tuple(name for name, _ in FIELD_WEIGHTS)
+# Upper bound on ranked candidates re-checked against DB filters on the fallback path.
+MAX_CANDIDATES = 5000
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+FULLTEXT_MATCH = 'MATCH (product_name, description, short_description) AGAINST (%s IN NATURAL LANGUAGE MODE)'
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) >= MIN_TOKEN_LENGTH]
+
+
+class InvertedIndex:
+    """Token -> {product_id: weight} postings over approved products, ranked by tf-idf."""
+
+    def __init__(self, field_weights=FIELD_WEIGHTS):
+        self.field_weights = field_weights
+        self.postings = defaultdict(dict)
+        # product_id -> its tokens, so a product can be taken out again.
+        self.tokens = {}
+
+    @property
+    def size(self):
+        return len(self.tokens)
+
+    def add(self, product_id, fields):
+        self.remove(product_id)
+        weights = defaultdict(float)
+        for name, weight in self.field_weights:
+            for token in tokenize(fields.get(name)):
+                weights[token] += weight
+        for token, w in weights.items():
+            self.postings[token][product_id] = w
+        self.tokens[product_id] = tuple(weights)
+
+    def remove(self, product_id):
+        for token in self.tokens.pop(product_id, ()):
+            postings = self.postings[token]
+            postings.pop(product_id, None)
+            if not postings:
+                del self.postings[token]
+
+    def search(self, query):
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + self.size / len(postings))
+            for product_id, w in postings.items():
+                scores[product_id] += (1 + math.log(w)) * idf
+        return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+
+    def refresh(self, product_ids):
+        """Re-read ``product_ids`` in one query; products no longer approved drop out."""
+        product_ids = set(product_ids)
+        fields = ('product_id',) + tuple(name for name, _ in FIELD_WEIGHTS)
+        for row in Products.objects.filter(pk__in=product_ids, status='approved').values(*fields):
+            self.add(row['product_id'], row)
+            product_ids.discard(row['product_id'])
+        for pid in product_ids:
+            self.remove(pid)
+
+    @classmethod
+    def build(cls):
+        index = cls()
+        fields = ('product_id',) + tuple(name for name, _ in FIELD_WEIGHTS)
+        rows = Products.objects.filter(status='approved').values(*fields)
+        for row in rows.iterator(chunk_size=2000):
+            index.add(row['product_id'], row)
+        return index
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+_rebuilding = False
+
+
+def record_change(product_ids):
+    """Log changed products under the next search version so every process can catch up."""
+    # A reader that sees the new version before this entry lands simply rebuilds.
+    version = bump_version(SEARCH_NAMESPACE)
+    cache.set(f'{SEARCH_NAMESPACE}:changes:{version}', list(product_ids), CHANGE_LOG_TIMEOUT)
+
+
+def _rebuild(version):
+    global _index, _index_version, _rebuilding
+    try:
+        index = InvertedIndex.build()
+        with _index_lock:
+            _index, _index_version = index, version
+    finally:
+        _rebuilding = False
+        connection.close()
+
+
+def get_index():
+    """Process-local index, patched from the change log rather than rebuilt.
+
+    Only a cold process builds on the request path. When the log cannot
+    cover the gap, the current index keeps serving while a background
+    thread rebuilds it.
+    """
+    global _index, _index_version, _rebuilding
+    version, _ = get_version(SEARCH_NAMESPACE)
+    with _index_lock:
+        if _index is None:
+            _index, _index_version = InvertedIndex.build(), version
+        elif _index_version != version:
+            logged = {}
+            if _index_version < version <= _index_version + MAX_CATCH_UP:
+                keys = [f'{SEARCH_NAMESPACE}:changes:{v}' for v in range(_index_version + 1, version + 1)]
+                logged = cache.get_many(keys)
+            if logged and len(logged) == version - _index_version:
+                _index.refresh({pid for ids in logged.values() for pid in ids})
+                _index_version = version
+            elif not _rebuilding:
+                _rebuilding = True
+                threading.Thread(target=_rebuild, args=(version,), daemon=True).start()
+        return _index
+
+
+def apply_filters(qs, filters):
+    if filters.get('shop') is not None:
+        qs = qs.filter(shop_id=filters['shop'])
+    if filters.get('category') is not None:
+        qs = qs.filter(category_id__in=subtree_ids(filters['category']))
+    if filters.get('brand'):
+        qs = qs.filter(brand=filters['brand'])
+    min_price, max_price = filters.get('min_price'), filters.get('max_price')
+    if min_price is not None or max_price is not None:
+        variants = ProductVariants.objects.filter(product=OuterRef('pk'))
+        if min_price is not None:
+            variants = variants.filter(price__gte=min_price)
+        if max_price is not None:
+            variants = variants.filter(price__lte=max_price)
+        qs = qs.filter(Exists(variants))
+    return qs
+
+
+def _fulltext(qs, query):
+    # extra() keeps the MATCH bare in WHERE so the FULLTEXT index serves it;
+    # a filter on the annotated score would compare it with 0 instead.
+    return (qs.extra(where=[FULLTEXT_MATCH], params=[query])
+              .annotate(score=RawSQL(FULLTEXT_MATCH, (query,))))
+
+
+def matching_ids(query, filters):
+    """Best-first ids of approved products matching ``query`` (at most MAX_CANDIDATES)."""
+    base = apply_filters(Products.objects.filter(status='approved'), filters)
+    if connection.vendor == 'mysql':
+        qs = _fulltext(base, query).order_by('-score', '-product_id')
+        return list(qs.values_list('product_id', flat=True)[:MAX_CANDIDATES])
+    ranked = [pid for pid, _ in get_index().search(query)[:MAX_CANDIDATES]]
+    if any(v not in (None, '') for v in filters.values()):
+        allowed = set(base.filter(pk__in=ranked).values_list('pk', flat=True))
+        ranked = [pid for pid in ranked if pid in allowed]
+    return ranked
+
+
+def search_products(query, filters, fields, limit, offset=0):
+    """Return ``(rows, total)`` for approved products matching ``query``, best first."""
+    base = apply_filters(Products.objects.filter(status='approved'), filters)
+    if connection.vendor == 'mysql':
+        matched = _fulltext(base, query)
+        qs = matched.order_by('-score', '-product_id')
+        return list(qs.values(*fields, 'score')[offset:offset + limit]), matched.values('pk').count()
+
+    ranked = get_index().search(query)[:MAX_CANDIDATES]
+    if any(v not in (None, '') for v in filters.values()):
+        allowed = set(base.filter(pk__in=[pid for pid, _ in ranked]).values_list('pk', flat=True))
+        ranked = [(pid, score) for pid, score in ranked if pid in allowed]
+    page = ranked[offset:offset + limit]
+    page_qs = Products.objects.filter(status='approved', pk__in=[pid for pid, _ in page])
+    rows = {r['product_id']: r for r in page_qs.values(*fields)}
+    results = []
+    for pid, score in page:
+        # A product can leave the approved set between index rebuilds.
+        if pid in rows:
+            results.append(dict(rows[pid], score=round(score, 4)))
+    return results, len(ranked)
@@ -0,0 +1,113 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import categories, detail, facets, listings, ratings, search
+from .models import (
+    Categories, ProductAttributeValues, ProductImages, ProductInventory, ProductReviewsSummary, Products,
+    ProductVariants, Reviews,
+)
+
+
+@receiver(pre_save, sender=Categories)
+def category_pre_save(sender, instance, **kwargs):
+    # Reject cycles before the row is written, so the closure never has to undo one.
+    categories.validate_parent(instance)
+
+
+@receiver(post_save, sender=Categories)
+def category_saved(sender, instance, **kwargs):
+    categories.sync_node(instance)
+
+
+@receiver(pre_delete, sender=Categories)
+def category_deleting(sender, instance, **kwargs):
+    categories.detach_node(instance.pk)
+
+
+@receiver(post_save, sender=Products)
+@receiver(post_delete, sender=Products)
+@receiver(post_save, sender=ProductAttributeValues)
+@receiver(post_delete, sender=ProductAttributeValues)
+def facet_source_changed(sender, instance, **kwargs):
+    # Approvals arrive here too, so every process patches just this product's
+    # bits; logging after commit keeps them from re-reading the old row.
+    product_id = instance.pk if sender is Products else instance.product_id
+    transaction.on_commit(lambda: facets.record_change([product_id]))
+
+
+@receiver(post_save, sender=Products)
+@receiver(post_delete, sender=Products)
+def product_changed(sender, instance, **kwargs):
+    detail.invalidate(instance.pk)
+
+
+@receiver(pre_save, sender=Products)
+def product_pre_save(sender, instance, **kwargs):
+    # Remember the indexed text before this save, so search only replays real edits.
+    before = None
+    if instance.pk:
+        before = Products.objects.filter(pk=instance.pk).values_list(*search.INDEXED_FIELDS).first()
+    instance._search_before = before
+
+
+@receiver(post_save, sender=Products)
+@receiver(post_delete, sender=Products)
+def search_source_changed(sender, instance, **kwargs):
+    after = tuple(getattr(instance, field) for field in search.INDEXED_FIELDS)
+    if kwargs.get('signal') is post_save and getattr(instance, '_search_before', None) == after:
+        return
+    product_id = instance.pk
+    transaction.on_commit(lambda: search.record_change([product_id]))
+
+
+@receiver(post_save, sender=ProductVariants)
+@receiver(post_delete, sender=ProductVariants)
+@receiver(post_save, sender=ProductImages)
+@receiver(post_delete, sender=ProductImages)
+@receiver(post_save, sender=ProductAttributeValues)
+@receiver(post_delete, sender=ProductAttributeValues)
+@receiver(post_save, sender=ProductReviewsSummary)
+@receiver(post_delete, sender=ProductReviewsSummary)
+def product_part_changed(sender, instance, **kwargs):
+    detail.invalidate(instance.product_id)
+
+
+@receiver(post_save, sender=Products)
+@receiver(post_delete, sender=Products)
+@receiver(post_save, sender=ProductVariants)
+@receiver(post_delete, sender=ProductVariants)
+@receiver(post_save, sender=ProductImages)
+@receiver(post_delete, sender=ProductImages)
+def listing_source_changed(sender, instance, **kwargs):
+    product_id = instance.pk if sender is Products else instance.product_id
+    listings.refresh([product_id])
+
+
+@receiver(post_save, sender=ProductInventory)
+@receiver(post_delete, sender=ProductInventory)
+def inventory_changed(sender, instance, **kwargs):
+    listings.refresh_stock_for_variants([instance.variant_id])
+
+
+@receiver(pre_save, sender=Reviews)
+def review_pre_save(sender, instance, **kwargs):
+    # Remember what the row counted for before this save, so post_save can apply the difference.
+    before = None
+    if instance.pk:
+        before = Reviews.objects.filter(pk=instance.pk).values_list('status', 'rating').first()
+    instance._rating_before = before
+
+
+@receiver(post_save, sender=Reviews)
+def review_saved(sender, instance, **kwargs):
+    deltas = ratings.review_changed(instance, getattr(instance, '_rating_before', None), (instance.status, instance.rating))
+    if deltas:
+        ratings.apply_deltas(deltas)
+
+
+@receiver(post_delete, sender=Reviews)
+def review_deleted(sender, instance, **kwargs):
+    deltas = ratings.review_changed(instance, (instance.status, instance.rating), None)
+    if deltas:
+        ratings.apply_deltas(deltas)
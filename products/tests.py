@@ -0,0 +1,872 @@
+import io
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.test import APIClient, APIRequestFactory
+
+from config.caching import cached_page, conditional_response, get_version
+from config.pagination import encode_cursor, keyset_page
+from orders.models import OrderItems
+from orders.tests import ORDER_MODELS, OrderTablesMixin
+from reports.models import JobWatermarks
+from shop.models import Shops
+from users.models import UserProfiles, UsersUser
+from . import (
+    analytics, batch_update, categories, detail, facets, importer, inventory, listings, ratings, recommendations, reviews,
+    search,
+)
+from .catalog import LISTINGS_NAMESPACE
+from .models import (
+    Categories, CategoryClosure, ProductAnalytics, ProductAttributes, ProductAttributeValues, ProductCopurchaseCounts, ProductImages, ProductInventory,
+    ProductListings, ProductRecommendations, ProductReviewsSummary, Products, ProductVariants, RatingSummaries,
+    ReviewImages, ReviewResponses, Reviews, ReviewVotes, StockReservations,
+)
+
+# The catalog models are unmanaged, so the test runner does not create their tables.
+CATALOG_MODELS = (
+    UserProfiles, Shops, Categories, Products, ProductVariants, ProductImages,
+    ProductAttributes, ProductAttributeValues, ProductReviewsSummary, ProductInventory, ProductListings,
+    StockReservations,
+)
+
+
+class CatalogTablesMixin:
+    models = CATALOG_MODELS
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for model in cls.models:
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.models):
+                editor.delete_model(model)
+
+    @classmethod
+    def create_catalog(cls):
+        # bulk_create keeps the catalog signals (listings, facets, caches) out of the fixtures.
+        now = timezone.now()
+        UserProfiles.objects.bulk_create([UserProfiles(
+            keycloak_user_id='owner-1', email='owner@example.com', status='active', created_at=now, updated_at=now,
+        )])
+        cls.shop = Shops.objects.bulk_create([Shops(
+            owner_id='owner-1', shop_name='Shop', shop_slug='shop', status='approved',
+            commission_rate=Decimal('5.00'), minimum_payout_amount=Decimal('10.00'), created_at=now, updated_at=now,
+        )])[0]
+        cls.category = Categories.objects.bulk_create([Categories(
+            category_name='Things', category_slug='things', sort_order=0, is_active=1, created_at=now,
+        )])[0]
+        cls.product = Products.objects.bulk_create([Products(
+            shop_id=cls.shop.pk, category_id=cls.category.pk, product_name='Lamp', product_slug='lamp',
+            status='approved', featured=0, created_at=now, updated_at=now,
+        )])[0]
+        cls.now = now
+
+    def add_variants(self, count, quantity=10):
+        variants = ProductVariants.objects.bulk_create([
+            ProductVariants(product_id=self.product.pk, variant_name=f'v{i}', sku=f'lamp-{i}',
+                            price=Decimal('9.99'), is_default=int(i == 0), created_at=self.now)
+            for i in range(count)
+        ])
+        ProductInventory.objects.bulk_create([
+            ProductInventory(variant_id=v.pk, quantity_available=quantity, quantity_reserved=0, last_updated_at=self.now)
+            for v in variants
+        ])
+        return variants
+
+
+class CatalogTestCase(CatalogTablesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalog()
+
+
+# Count only catalog queries, not the database cache's own.
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ProductDetailQueryTests(CatalogTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def _populate(self, size):
+        variants = self.add_variants(size)
+        ProductImages.objects.bulk_create([
+            ProductImages(product_id=self.product.pk, variant_id=v.pk, image_url=f'/img/{v.pk}.jpg',
+                          sort_order=i, is_primary=int(i == 0), created_at=self.now)
+            for i, v in enumerate(variants)
+        ])
+        attributes = ProductAttributes.objects.bulk_create([
+            ProductAttributes(attribute_name=f'attr-{i}', attribute_type='text', is_required=0, created_at=self.now)
+            for i in range(size)
+        ])
+        ProductAttributeValues.objects.bulk_create([
+            ProductAttributeValues(product_id=self.product.pk, attribute_id=a.pk, attribute_value='x', created_at=self.now)
+            for a in attributes
+        ])
+        ProductReviewsSummary.objects.bulk_create([ProductReviewsSummary(
+            product_id=self.product.pk, average_rating=Decimal('4.50'), total_reviews=2,
+            rating_distribution_json={'4': 1, '5': 1}, last_updated_at=self.now,
+        )])
+
+    def test_build_document_query_count_is_constant(self):
+        self._populate(25)
+        # product + shop + category + summary, variants, images, attribute values + attributes
+        with self.assertNumQueries(4):
+            doc = detail.build_document(self.product.pk)
+        self.assertEqual(len(doc['variants']), 25)
+        self.assertEqual(len(doc['images']), 25)
+        self.assertEqual(len(doc['attributes']), 25)
+        self.assertEqual(doc['reviews']['total_reviews'], 2)
+
+    def test_cached_document_only_reads_live_stock(self):
+        self._populate(5)
+        detail.get_document(self.product.pk)
+        with self.assertNumQueries(1):
+            doc = detail.get_document(self.product.pk)
+        self.assertEqual([v['in_stock'] for v in doc['variants']], [10] * 5)
+
+    def test_unapproved_product_has_no_document(self):
+        Products.objects.filter(pk=self.product.pk).update(status='draft')
+        self.assertIsNone(detail.build_document(self.product.pk))
+
+
+
+# products.urls is loaded on its own; the project URLconf also pulls in apps
+# outside this one.
+@override_settings(ROOT_URLCONF='products.urls',
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ProductUrlTests(CatalogTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(UsersUser(username='owner-1', is_staff=0))
+
+    def test_owner_endpoints_resolve_and_serve(self):
+        response = self.client.get(reverse('my-products'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['product_id'] for p in response.json()], [self.product.pk])
+
+        response = self.client.post(reverse('submit-product'), {
+            'shop': self.shop.pk, 'name': 'Desk Lamp', 'price': '19.90', 'category': self.category.pk,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        created = Products.objects.get(pk=response.json()['product_id'])
+        self.assertEqual((created.product_slug, created.status), ('desk-lamp', 'pending'))
+        self.assertEqual(ProductVariants.objects.get(product=created, is_default=1).price, Decimal('19.90'))
+
+        self.assertEqual(self.client.patch(reverse('product-request-edit', args=[self.product.pk])).status_code, 200)
+
+    def test_public_catalog_resolves(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(reverse('product-groups-public')).status_code, 200)
+
+class KeysetCursorTests(CatalogTestCase):
+
+    def setUp(self):
+        self.add_variants(5)
+        self.qs = ProductVariants.objects.filter(product_id=self.product.pk).values('variant_id', 'price')
+
+    def test_pages_follow_cursor(self):
+        first, cursor = keyset_page(self.qs, ('variant_id',), limit=3)
+        second, cursor = keyset_page(self.qs, ('variant_id',), cursor, limit=3)
+        self.assertEqual(len(first) + len(second), 5)
+        self.assertIsNone(cursor)
+        self.assertLess(first[-1]['variant_id'], second[0]['variant_id'])
+
+    def test_tampered_cursor_starts_from_first_page(self):
+        first, _ = keyset_page(self.qs, ('variant_id',), limit=2)
+        for values in (['abc'], [None], [{'x': 1}], ['1', 2], [2 ** 80]):
+            rows, _ = keyset_page(self.qs, ('variant_id',), encode_cursor(values), limit=2)
+            self.assertEqual(rows, first, values)
+        rows, _ = keyset_page(self.qs, ('price', 'variant_id'), encode_cursor(['NaN', 1]), limit=2)
+        self.assertEqual(len(rows), 2)
+        rows, _ = keyset_page(self.qs, ('variant_id',), 'not-base64!', limit=2)
+        self.assertEqual(rows, first)
+
+
+@override_settings(ROOT_URLCONF='products.urls',
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CategoryTreeTests(CatalogTablesMixin, TestCase):
+    models = CATALOG_MODELS + (CategoryClosure,)
+
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        UserProfiles.objects.bulk_create([UserProfiles(
+            keycloak_user_id='owner-1', email='owner@example.com', status='active', created_at=now, updated_at=now,
+        )])
+        shop = Shops.objects.bulk_create([Shops(
+            owner_id='owner-1', shop_name='Shop', shop_slug='shop', status='approved',
+            commission_rate=Decimal('5.00'), minimum_payout_amount=Decimal('10.00'), created_at=now, updated_at=now,
+        )])[0]
+        # create() fires the closure signals, as an admin edit would.
+        self.electronics = self.category('Electronics', None)
+        self.phones = self.category('Phones', self.electronics)
+        self.cases = self.category('Cases', self.phones)
+        self.garden = self.category('Garden', None)
+        Products.objects.bulk_create([
+            Products(shop_id=shop.pk, category_id=category.pk, product_name=name, product_slug=name.lower(),
+                     status=product_status, featured=0, created_at=now, updated_at=now)
+            for name, category, product_status in (
+                ('Phone', self.phones, 'approved'), ('Case', self.cases, 'approved'),
+                ('Draft case', self.cases, 'pending'), ('Rake', self.garden, 'approved'),
+            )
+        ])
+
+    def category(self, name, parent):
+        return Categories.objects.create(
+            category_name=name, category_slug=name.lower(), parent_category=parent, sort_order=0, is_active=1,
+            created_at=timezone.now(),
+        )
+
+    def closure(self):
+        return set(CategoryClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def test_subtree_and_path(self):
+        e, p, c = self.electronics.pk, self.phones.pk, self.cases.pk
+        self.assertEqual(set(categories.subtree_ids(e).values_list('descendant_id', flat=True)), {e, p, c})
+        self.assertEqual(categories.ancestor_ids(c), [e, p, c])
+
+    def test_counts_follow_a_move(self):
+        e, p, c, g = self.electronics.pk, self.phones.pk, self.cases.pk, self.garden.pk
+        self.assertEqual(categories.subtree_product_counts(), {e: 2, p: 2, c: 1, g: 1})
+        self.phones.parent_category = self.garden
+        self.phones.save()
+        self.assertEqual(categories.ancestor_ids(c), [g, p, c])
+        self.assertEqual(categories.subtree_product_counts(), {p: 2, c: 1, g: 3})
+
+    def test_cycle_is_refused(self):
+        self.electronics.parent_category = self.cases
+        with self.assertRaises(ValueError):
+            self.electronics.save()
+
+    def test_rebuild_matches_incremental_closure(self):
+        self.phones.parent_category = self.garden
+        self.phones.save()
+        incremental = self.closure()
+        categories.rebuild()
+        self.assertEqual(self.closure(), incremental)
+
+    def test_tree_endpoint_is_one_query_with_warm_counts(self):
+        categories.subtree_product_counts()
+        with self.assertNumQueries(1):
+            body = APIClient().get(reverse('category-tree'), {'root': self.phones.pk}).json()
+        self.assertEqual([(r['category_name'], r['product_count']) for r in body['categories']],
+                         [('Phones', 2), ('Cases', 1)])
+
+
+class AnalyticsBufferTests(CatalogTablesMixin, TestCase):
+    models = CATALOG_MODELS + (ProductAnalytics,)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalog()
+
+    def setUp(self):
+        # interval=0: no timer thread, the test decides when to flush.
+        self.buffer = analytics.CounterBuffer(interval=0)
+
+    def counts(self):
+        return ProductAnalytics.objects.values_list('views', 'purchases', 'revenue').get(product_id=self.product.pk)
+
+    def test_increments_meet_in_one_row_per_flush(self):
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.buffer.incr(self.product.pk, 'views')
+            self.buffer.incr(self.product.pk, 'purchases', revenue='19.90')
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.counts(), (3, 1, Decimal('19.90')))
+        self.buffer.incr(self.product.pk, 'views', amount=2)
+        self.buffer.flush()
+        self.assertEqual(self.counts(), (5, 1, Decimal('19.90')))
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_failed_flush_keeps_the_counts(self):
+        self.buffer.incr(self.product.pk, 'views')
+        with mock.patch.object(analytics, 'bulk_upsert', side_effect=DatabaseError('gone away')):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        self.buffer.incr(self.product.pk, 'views')
+        self.buffer.flush()
+        self.assertEqual(self.counts()[0], 2)
+
+    def test_unknown_counter(self):
+        with self.assertRaises(ValueError):
+            self.buffer.incr(self.product.pk, 'likes')
+
+
+class CatalogImportTests(CatalogTestCase):
+
+    def _run(self, parser, body, batch_size=importer.BATCH_SIZE):
+        return importer.CatalogImporter(self.shop.pk, batch_size=batch_size).run(parser(io.BytesIO(body)))
+
+    def _jsonl(self, *rows):
+        return b''.join((r if isinstance(r, bytes) else json.dumps(r).encode()) + b'\n' for r in rows)
+
+    def test_bad_rows_are_reported_not_raised(self):
+        base = {'category_id': self.category.pk, 'price': '5.00'}
+        body = self._jsonl(
+            dict(base, name='Good', sku='g-1', image_urls=['/a.jpg']),
+            dict(base, name='Dup sku', sku='g-1'),
+            dict(base, name='Lamp'),
+            dict(base, name='Bad price', price='NaN'),
+            dict(base, name='Bad attrs', attributes=['x']),
+            dict(base, name='Bad images', image_urls='/a.jpg'),
+            b'{"name": "\xff\xfe"}',
+            b'not json',
+        )
+        report = self._run(importer.iter_jsonl, body)
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(sorted(e['row'] for e in report['errors']), [2, 3, 4, 5, 6, 7, 8])
+        product = Products.objects.get(product_slug='good')
+        self.assertEqual(product.status, 'pending')
+        self.assertTrue(ProductListings.objects.filter(product_id=product.pk).exists())
+
+    def test_sku_taken_by_an_earlier_batch(self):
+        body = (f'name,category_id,price,sku\nOne,{self.category.pk},1.00,s-1\n'
+                f'Two,{self.category.pk},1.00,s-1\nThree,{self.category.pk},1.00,s-3\n').encode()
+        report = self._run(importer.iter_csv, body, batch_size=1)
+        self.assertEqual(report['created'], 2)
+        self.assertEqual(report['errors'], [{'row': 2, 'error': 'sku already exists'}])
+
+    def test_invalid_utf8_in_csv(self):
+        body = f'name,category_id,price\nCaf\xe9,{self.category.pk},1.00\n'.encode('latin-1')
+        report = self._run(importer.iter_csv, body)
+        self.assertEqual(report['errors'], [{'row': 1, 'error': 'invalid UTF-8'}])
+
+
+class InventoryTests(CatalogTestCase):
+
+    def setUp(self):
+        self.variants = self.add_variants(2, quantity=5)
+
+    def test_reservation_is_single_use_and_owned(self):
+        a, b = (v.pk for v in self.variants)
+        token = inventory.reserve([(b, 1), (a, 2)], user_id=7)
+        with self.assertRaises(inventory.UnknownReservation):
+            inventory.commit(token, user_id=8)
+        inventory.commit(token, user_id=7)
+        with self.assertRaises(inventory.UnknownReservation):
+            inventory.release(token, user_id=7)
+        stock = dict(ProductInventory.objects.values_list('variant_id', 'quantity_available'))
+        self.assertEqual(stock, {a: 3, b: 4})
+        self.assertFalse(ProductInventory.objects.exclude(quantity_reserved=0).exists())
+
+    def test_failed_line_rolls_back_the_cart(self):
+        a, b = (v.pk for v in self.variants)
+        with self.assertRaises(inventory.InsufficientStock):
+            inventory.reserve([(a, 1), (b, 6)], user_id=7)
+        self.assertFalse(ProductInventory.objects.exclude(quantity_reserved=0).exists())
+        self.assertFalse(StockReservations.objects.exists())
+
+    def test_invalid_lines(self):
+        for lines in ([('abc', 1)], [(1, 0)], [(True, 1)], [(1.5, 1)], [(2 ** 70, 1)], [(1, 2 ** 40)]):
+            with self.assertRaises(ValueError):
+                inventory.normalize_lines(lines)
+
+    def test_set_stock_creates_missing_row(self):
+        extra = ProductVariants.objects.bulk_create([ProductVariants(
+            product_id=self.product.pk, sku='extra', price=Decimal('1.00'), is_default=0, created_at=self.now,
+        )])[0]
+        inventory.set_stock(extra.pk, 3)
+        inventory.set_stock(extra.pk, 4)
+        self.assertEqual(ProductInventory.objects.get(variant_id=extra.pk).quantity_available, 4)
+
+    def test_set_stock_retries_a_lost_insert_once(self):
+        extra = ProductVariants.objects.bulk_create([ProductVariants(
+            product_id=self.product.pk, sku='extra', price=Decimal('1.00'), is_default=0, created_at=self.now,
+        )])[0]
+
+        @contextmanager
+        def loses_the_race():
+            try:
+                with transaction.atomic():
+                    yield
+            except IntegrityError:
+                # The concurrent writer's row (with a reservation) is what our insert collided with.
+                ProductInventory.objects.bulk_create([ProductInventory(
+                    variant_id=extra.pk, quantity_available=9, quantity_reserved=2, last_updated_at=self.now,
+                )])
+                raise
+
+        with mock.patch.object(ProductInventory.objects, 'create', side_effect=IntegrityError('duplicate key')) as attempt, \
+                mock.patch.object(inventory, 'transaction', mock.Mock(atomic=loses_the_race)):
+            inventory.set_stock(extra.pk, 3)
+        self.assertEqual(attempt.call_count, 1)
+        self.assertEqual(ProductInventory.objects.get(variant_id=extra.pk).quantity_available, 3)
+
+    def test_set_stock_reraises_other_integrity_errors(self):
+        with mock.patch.object(ProductInventory.objects, 'create', side_effect=IntegrityError('foreign key')) as attempt:
+            with self.assertRaises(IntegrityError):
+                inventory.set_stock(10 ** 6, 3)
+        self.assertEqual(attempt.call_count, 1)
+
+
+
+class BatchUpdateTests(CatalogTestCase):
+
+    def setUp(self):
+        self.variants = self.add_variants(2, quantity=10)
+        ProductInventory.objects.filter(variant_id=self.variants[1].pk).update(quantity_reserved=5)
+
+    def test_invalid_fields_reject_the_whole_item(self):
+        results = batch_update.apply_batch(self.shop.pk, [
+            {'variant_id': self.variants[0].pk, 'quantity': 3, 'price': 'NaN'},
+            {'variant_id': self.variants[0].pk, 'price': '1e12'},
+            {'variant_id': 'x', 'quantity': 1},
+        ])
+        self.assertEqual([r['status'] for r in results], ['invalid', 'invalid', 'invalid'])
+        self.assertEqual(ProductInventory.objects.get(variant_id=self.variants[0].pk).quantity_available, 10)
+
+    def test_below_reserved_keeps_the_old_price(self):
+        results = batch_update.apply_batch(self.shop.pk, [
+            {'variant_id': self.variants[0].pk, 'quantity': 4, 'price': '1.50'},
+            {'variant_id': self.variants[1].pk, 'quantity': 4, 'price': '1.50'},
+        ])
+        self.assertEqual([r['status'] for r in results], ['ok', 'below_reserved'])
+        prices = dict(ProductVariants.objects.values_list('variant_id', 'price'))
+        self.assertEqual(prices[self.variants[0].pk], Decimal('1.50'))
+        self.assertEqual(prices[self.variants[1].pk], Decimal('9.99'))
+
+class InventoryContentionBenchmark(CatalogTablesMixin, TransactionTestCase):
+    """Many threads race for the same two variants; none may oversell."""
+
+    available_apps = ['products']
+    THREADS = 32
+    STOCK = 20
+
+    def setUp(self):
+        self.create_catalog()
+        self.variants = [v.pk for v in self.add_variants(2, quantity=self.STOCK)]
+
+    def tearDown(self):
+        # TransactionTestCase only flushes managed tables; plain DELETEs keep the catalog signals out.
+        with connection.cursor() as cursor:
+            for model in reversed(self.models):
+                cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+
+    def _checkout(self, user_id, results):
+        try:
+            # Lines arrive in opposite orders; the service sorts them so carts never deadlock.
+            lines = [(vid, 1) for vid in (self.variants if user_id % 2 else reversed(self.variants))]
+            token = inventory.reserve(lines, user_id)
+            inventory.commit(token, user_id)
+            results.append(True)
+        except inventory.InsufficientStock:
+            results.append(False)
+        finally:
+            connection.close()
+
+    def test_concurrent_checkouts_do_not_oversell(self):
+        results = []
+        threads = [threading.Thread(target=self._checkout, args=(i, results)) for i in range(self.THREADS)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        sys.stderr.write(f'\n{self.THREADS} concurrent checkouts on {connection.vendor}: '
+                         f'{elapsed * 1000:.0f} ms ({self.THREADS / elapsed:.0f}/s)\n')
+        self.assertEqual(len(results), self.THREADS)
+        self.assertEqual(results.count(True), self.STOCK)
+        for available, reserved in ProductInventory.objects.values_list('quantity_available', 'quantity_reserved'):
+            self.assertEqual((available, reserved), (0, 0))
+
+
+class CachedPageTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_etag_follows_content_not_version(self):
+        # timeout=0 rebuilds every time, as after an expiry without a namespace bump.
+        etags = [cached_page('test-ns', {'page': 1}, lambda: payload, timeout=0)[1]
+                 for payload in ({'price': '1.00'}, {'price': '2.00'}, {'price': '1.00'})]
+        self.assertNotEqual(etags[0], etags[1])
+        self.assertEqual(etags[0], etags[2])
+
+    def test_stale_validator_gets_full_response(self):
+        data, etag, modified = cached_page('test-ns', {}, lambda: {'a': 1})
+        request = APIRequestFactory().get('/', HTTP_IF_NONE_MATCH=f'"{etag}"')
+        self.assertEqual(conditional_response(request, data, etag, modified).status_code, 304)
+        _, new_etag, _ = cached_page('test-ns', {'other': 1}, lambda: {'a': 2})
+        self.assertEqual(conditional_response(request, {'a': 2}, new_etag, modified).status_code, 200)
+
+    def test_warm_version_is_one_cache_read(self):
+        first = get_version('test-ns')
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many, \
+                mock.patch.object(cache, 'add') as add:
+            self.assertEqual(get_version('test-ns'), first)
+        self.assertEqual((get_many.call_count, add.call_count), (1, 0))
+
+
+class ListingInvalidationTests(CatalogTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.variants = self.add_variants(1, quantity=1)
+        listings.refresh([self.product.pk])
+
+    def test_price_change_retires_listing_pages(self):
+        before, _ = get_version(LISTINGS_NAMESPACE)
+        ProductVariants.objects.filter(pk=self.variants[0].pk).update(price=Decimal('5.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            listings.refresh([self.product.pk])
+        self.assertGreater(get_version(LISTINGS_NAMESPACE)[0], before)
+
+    def test_unchanged_rows_keep_listing_pages(self):
+        before, _ = get_version(LISTINGS_NAMESPACE)
+        Products.objects.filter(pk=self.product.pk).update(featured=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            listings.refresh([self.product.pk])
+        self.assertEqual(get_version(LISTINGS_NAMESPACE)[0], before)
+        Products.objects.filter(pk=self.product.pk).update(status='rejected')
+        with self.captureOnCommitCallbacks(execute=True):
+            listings.refresh([self.product.pk])
+        self.assertGreater(get_version(LISTINGS_NAMESPACE)[0], before)
+
+    def test_only_stock_flips_retire_listing_pages(self):
+        before, _ = get_version(LISTINGS_NAMESPACE)
+        with self.captureOnCommitCallbacks(execute=True):
+            listings.refresh_stock([self.product.pk])
+        self.assertEqual(get_version(LISTINGS_NAMESPACE)[0], before)
+        ProductInventory.objects.filter(variant_id=self.variants[0].pk).update(quantity_reserved=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            listings.refresh_stock([self.product.pk])
+        self.assertGreater(get_version(LISTINGS_NAMESPACE)[0], before)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ProductSearchIndexTests(CatalogTestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.multiple(search, _index=None, _index_version=None, _rebuilding=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        search.get_index()
+
+    def save(self, **changes):
+        product = Products.objects.get(pk=self.product.pk)
+        for field, value in changes.items():
+            setattr(product, field, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+
+    def found(self, query):
+        return [pid for pid, _ in search.get_index().search(query)]
+
+    def test_rename_is_patched_in_without_a_rebuild(self):
+        self.assertEqual(self.found('lamp'), [self.product.pk])
+        self.save(product_name='Desk Light', description='brass reading light')
+        with mock.patch.object(search.InvertedIndex, 'build') as build:
+            self.assertEqual(self.found('light'), [self.product.pk])
+            self.assertEqual(self.found('lamp'), [])
+        build.assert_not_called()
+        self.save(status='rejected')
+        self.assertEqual(self.found('light'), [])
+
+    def test_unindexed_edit_does_not_bump(self):
+        before = get_version(search.SEARCH_NAMESPACE)[0]
+        self.save(featured=1)
+        self.assertEqual(get_version(search.SEARCH_NAMESPACE)[0], before)
+
+    def test_expired_log_rebuilds_off_the_request(self):
+        stale = search.get_index()
+        self.save(product_name='Desk Light')
+        cache.delete_many([f'{search.SEARCH_NAMESPACE}:changes:{v}' for v in range(10)])
+        with mock.patch.object(search.threading, 'Thread') as thread:
+            # The request is answered from the old index while the rebuild is queued.
+            self.assertIs(search.get_index(), stale)
+            self.assertIs(search.get_index(), stale)
+        thread.assert_called_once()
+        with mock.patch.object(search.connection, 'close'):
+            thread.call_args.kwargs['target'](*thread.call_args.kwargs['args'])
+        self.assertEqual(self.found('light'), [self.product.pk])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class FacetCatchUpTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.multiple(facets, _index=None, _index_version=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.build = mock.patch.object(facets.FacetIndex, 'build', side_effect=lambda: mock.Mock()).start()
+        self.addCleanup(mock.patch.stopall)
+        facets.get_index()
+
+    def test_logged_changes_are_replayed(self):
+        facets.record_change([4, 5])
+        facets.record_change([6])
+        facets.get_index().refresh.assert_called_once_with({4, 5, 6})
+        self.assertEqual(self.build.call_count, 1)
+
+    def test_expired_log_rebuilds(self):
+        facets.record_change([4])
+        facets.record_change([5])
+        cache.delete(f'{facets.FACETS_NAMESPACE}:changes:2')
+        facets.get_index()
+        self.assertEqual(self.build.call_count, 2)
+
+    def test_version_going_backwards_rebuilds(self):
+        for _ in range(3):
+            facets.record_change([4])
+        facets.get_index()
+        cache.clear()
+        facets.record_change([5])
+        index = facets.get_index()
+        self.assertEqual(self.build.call_count, 2)
+        index.refresh.assert_not_called()
+
+
+class FacetIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = facets.FacetIndex()
+        for pid in range(1, 1001):
+            self.index.set_approved(pid, True)
+            self.index.set_value(pid, 1, 'red' if pid % 2 else 'blue')
+        for pid in range(1, 4):
+            self.index.set_value(pid, 2, 'oak')
+
+    def test_rare_values_stay_sparse(self):
+        self.assertIsInstance(self.index.postings[(2, 'oak')], set)
+        self.assertIsInstance(self.index.postings[(1, 'red')], int)
+
+    def test_counts_mix_sparse_and_dense_postings(self):
+        mask, counts = self.index.query({1: {'red'}})
+        self.assertEqual(mask.bit_count(), 500)
+        self.assertEqual(counts[1], {'red': 500, 'blue': 500})
+        self.assertEqual(counts[2], {'oak': 2})
+        mask, counts = self.index.query({2: {'oak'}})
+        self.assertEqual(sorted(self.index.product_ids_in(mask)), [1, 2, 3])
+        self.assertEqual(counts[1], {'red': 2, 'blue': 1})
+
+    def test_postings_change_shape_with_their_size(self):
+        for pid in range(1, 101):
+            self.index.set_value(pid, 2, 'oak')
+        self.assertIsInstance(self.index.postings[(2, 'oak')], int)
+        for pid in range(1, 100):
+            self.index.clear_product(pid)
+        self.assertEqual(self.index.postings[(2, 'oak')], {99})
+        self.index.clear_product(100)
+        self.assertNotIn((2, 'oak'), self.index.postings)
+
+
+class RecommendationTests(OrderTablesMixin, TestCase):
+    models = ORDER_MODELS + (ProductCopurchaseCounts, ProductRecommendations, JobWatermarks)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_orders()
+        extra = Products.objects.bulk_create([
+            Products(shop_id=cls.shops[0].pk, category_id=cls.products[0].category_id, product_name='Item 2',
+                     product_slug='item-2', status='approved', featured=0, created_at=cls.now, updated_at=cls.now)
+        ])
+        cls.products.extend(extra)
+        cls.variants.extend(ProductVariants.objects.bulk_create([
+            ProductVariants(product_id=p.pk, sku=f'sku-{p.pk}', price=Decimal('10.00'), is_default=1, created_at=cls.now)
+            for p in extra
+        ]))
+        cls.add_order('customer-1', 3, [0, 1])
+        cls.add_order('customer-2', 3, [0, 1, 2])
+        cls.add_order('customer-1', 2, [1, 2])
+        cls.add_order('customer-2', 2, [0, 1], item_status='cancelled')
+        cls.add_order('customer-1', 1, [2])
+
+    def top_k(self):
+        return {
+            pid: [(r.related_product_id, r.score) for r in ProductRecommendations.objects.filter(product_id=pid).order_by('rank')]
+            for pid in ProductRecommendations.objects.values_list('product_id', flat=True).distinct()
+        }
+
+    def test_pair_buffer_counts_packed_pairs(self):
+        buffer = recommendations.PairBuffer()
+        buffer.add([7, 9, 12])
+        buffer.add([9, 12])
+        self.assertEqual(len(buffer), 4)
+        self.assertEqual(buffer.counts(), [(7, 9, 1), (7, 12, 1), (9, 12, 2)])
+        self.assertEqual(buffer.touched_products(), {7, 9, 12})
+
+    def test_update_counts_settled_orders(self):
+        a, b, c = (p.pk for p in self.products)
+        self.assertEqual(recommendations.update(), (4, 3))
+        self.assertEqual(self.top_k(), {a: [(b, 2), (c, 1)], b: [(a, 2), (c, 2)], c: [(b, 2), (a, 1)]})
+        self.assertEqual(recommendations.update(), (0, 0))
+
+    def test_crash_after_a_flush_leaves_consistent_lists(self):
+        real = recommendations._order_baskets
+
+        def dies_after_first_order(after, up_to):
+            baskets = real(after, up_to)
+            yield next(baskets)
+            raise RuntimeError('worker killed')
+
+        with mock.patch.object(recommendations, 'FLUSH_PAIRS', 1), \
+                mock.patch.object(recommendations, '_order_baskets', dies_after_first_order):
+            with self.assertRaises(RuntimeError):
+                recommendations.update()
+        a, b = self.products[0].pk, self.products[1].pk
+        # The first order was flushed: its pair, top-K lists and watermark landed together.
+        self.assertEqual(self.top_k(), {a: [(b, 1)], b: [(a, 1)]})
+        recommendations.update()
+        resumed = self.top_k()
+        recommendations.update(full=True)
+        self.assertEqual(resumed, self.top_k())
+
+
+class ReviewTablesMixin(OrderTablesMixin):
+    models = ORDER_MODELS + (Reviews, ReviewImages, ReviewResponses, ReviewVotes, RatingSummaries, ProductReviewsSummary)
+
+    @classmethod
+    def create_reviewable_items(cls, count):
+        cls.create_orders()
+        cls.items = [OrderItems.objects.get(order=cls.add_order('customer-1', 1, [0])) for _ in range(count)]
+
+    def review(self, item, rating, status='pending', **fields):
+        # create() fires the summary signals, as a submitted review would.
+        return Reviews.objects.create(
+            product_id=item.product_id, order_item_id=item.pk, customer_id='customer-1', shop_id=item.shop_id,
+            rating=rating, is_verified_purchase=1, status=status, created_at=fields.pop('created_at', self.now),
+            updated_at=self.now, **fields,
+        )
+
+
+class RatingSummaryTests(ReviewTablesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_reviewable_items(4)
+
+    def product_summary(self):
+        row = RatingSummaries.objects.get(product_id=self.products[0].pk)
+        doc = ProductReviewsSummary.objects.get(product_id=self.products[0].pk)
+        counts = tuple(getattr(row, field) for field in ratings.COUNT_FIELDS)
+        self.assertEqual((doc.total_reviews, doc.average_rating), (row.total_reviews, row.average_rating))
+        self.assertEqual(doc.rating_distribution_json, {str(r): n for r, n in zip(ratings.RATINGS, counts)})
+        return row.average_rating, counts
+
+    def test_events_apply_deltas(self):
+        five = self.review(self.items[0], 5, status='approved')
+        three = self.review(self.items[1], 3, status='approved')
+        self.review(self.items[2], 1)
+        self.assertEqual(self.product_summary(), (Decimal('4.00'), (0, 0, 1, 0, 1)))
+        three.rating = 4
+        three.save()
+        self.assertEqual(self.product_summary(), (Decimal('4.50'), (0, 0, 0, 1, 1)))
+        five.status = 'rejected'
+        five.save()
+        self.assertEqual(self.product_summary(), (Decimal('4.00'), (0, 0, 0, 1, 0)))
+        three.delete()
+        self.assertEqual(self.product_summary(), (Decimal('0.00'), (0, 0, 0, 0, 0)))
+        self.assertEqual(RatingSummaries.objects.get(shop_id=self.shops[0].pk).total_reviews, 0)
+
+    def test_event_cost_does_not_grow_with_reviews(self):
+        costs = []
+        for item in self.items[:3]:
+            review = self.review(item, 4)
+            review.status = 'approved'
+            with CaptureQueriesContext(connection) as queries:
+                review.save()
+            costs.append(len(queries))
+        self.assertEqual(costs[1], costs[2])
+
+    def test_reconcile_repairs_drift(self):
+        for item, rating in zip(self.items, (5, 4, 4)):
+            self.review(item, rating, status='approved')
+        RatingSummaries.objects.update(rating_5_count=9, total_reviews=11, average_rating=Decimal('1.00'))
+        ProductReviewsSummary.objects.update(total_reviews=0)
+        self.assertEqual(ratings.reconcile(chunk_size=1), 1)
+        self.assertEqual(ratings.reconcile('shop_id', chunk_size=1), 1)
+        self.assertEqual(self.product_summary(), (Decimal('4.33'), (0, 0, 0, 2, 1)))
+        shop = RatingSummaries.objects.get(shop_id=self.shops[0].pk)
+        self.assertEqual((shop.total_reviews, shop.rating_5_count), (3, 1))
+
+
+@override_settings(ROOT_URLCONF='products.urls')
+class ReviewListingTests(ReviewTablesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_reviewable_items(3)
+
+    def setUp(self):
+        self.posted = [
+            self.review(item, 4, status='approved', created_at=self.now - timedelta(hours=i))
+            for i, item in enumerate(self.items)
+        ]
+        self.client = APIClient()
+
+    def vote(self, user, review, vote_type):
+        self.client.force_authenticate(UsersUser(username=user))
+        method = self.client.delete if vote_type is None else self.client.post
+        response = method(reverse('review-vote', args=[review.pk]), {'vote_type': vote_type}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def page(self, **params):
+        response = self.client.get(reverse('review-list'), {'product': self.products[0].pk, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_votes_keep_counters_in_step(self):
+        first, second = self.posted[:2]
+        self.vote('customer-1', second, 'helpful')
+        self.vote('customer-2', second, 'helpful')
+        self.assertEqual(self.vote('customer-2', first, 'not_helpful'),
+                         {'helpful_count': 0, 'unhelpful_count': 1, 'helpful_score': -1})
+        self.vote('customer-2', first, 'helpful')
+        self.assertEqual(self.vote('customer-2', first, None),
+                         {'helpful_count': 0, 'unhelpful_count': 0, 'helpful_score': 0})
+        ids = [r['review_id'] for r in self.page(sort='helpful')['results']]
+        self.assertEqual(ids, [second.pk] + sorted((r.pk for r in self.posted if r != second), reverse=True))
+
+    def test_keyset_walk_newest_first(self):
+        seen, cursor = [], None
+        while True:
+            body = self.page(limit=1, **({'cursor': cursor} if cursor else {}))
+            seen.extend(r['review_id'] for r in body['results'])
+            cursor = body['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, [r.pk for r in self.posted])
+
+    def test_page_attachments_in_two_queries(self):
+        ReviewImages.objects.bulk_create([
+            ReviewImages(review_id=self.posted[0].pk, image_url=f'https://img.example/{i}.jpg', created_at=self.now)
+            for i in range(2)
+        ])
+        ReviewResponses.objects.bulk_create([ReviewResponses(
+            review_id=self.posted[1].pk, responder_id='owner-1', response_text='Thanks!',
+            created_at=self.now, updated_at=self.now,
+        )])
+        with self.assertNumQueries(3):
+            rows, _ = reviews.review_page(product_id=self.products[0].pk)
+        self.assertEqual([len(r['images']) for r in rows], [2, 0, 0])
+        self.assertEqual([r['response'] and r['response']['response_text'] for r in rows], [None, 'Thanks!', None])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(reverse('review-list')).status_code, 400)
+        self.assertEqual(self.client.get(reverse('review-list'), {'product': self.products[0].pk, 'sort': 'oldest'}).status_code, 400)
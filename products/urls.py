@@ -4,10 +4,26 @@ from . import views
 urlpatterns = [
     path('', views.product_groups, name='product-groups'),
     path('public/', views.product_groups_public, name='product-groups-public'),
+    path('search/', views.search_products, name='product-search'),
+    path('facets/', views.facet_products, name='product-facets'),
+    path('categories/', views.category_tree, name='category-tree'),
+    path('categories/<int:pk>/products/', views.category_products, name='category-products'),
+    path('<int:pk>/', views.product_detail, name='product-detail'),
+    path('<int:pk>/recommendations/', views.product_recommendations, name='product-recommendations'),
+    path('reviews/', views.review_list, name='review-list'),
+    path('reviews/<int:pk>/vote/', views.vote_review, name='review-vote'),
+    path('reviews/moderation/lease/', views.lease_reviews, name='review-moderation-lease'),
+    path('reviews/moderation/decide/', views.moderate_reviews, name='review-moderation-decide'),
+    path('reviews/moderation/release/', views.release_reviews, name='review-moderation-release'),
     path('<int:pk>/approve/', views.approve_product, name='product-approve'),
     path('<int:pk>/reject/', views.reject_product, name='product-reject'),
     path('mine/', views.my_products, name='my-products'),
     path('submit/', views.submit_product, name='submit-product'),
+    path('import/', views.import_products, name='product-import'),
     path('<int:pk>/stock/', views.update_stock, name='product-update-stock'),
+    path('stock/batch/', views.batch_update_stock, name='product-batch-stock'),
+    path('inventory/reserve/', views.reserve_stock, name='inventory-reserve'),
+    path('inventory/commit/', views.commit_stock, name='inventory-commit'),
+    path('inventory/release/', views.release_stock, name='inventory-release'),
     path('<int:pk>/request-edit/', views.request_edit, name='product-request-edit'),
 ]
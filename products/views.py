@@ -1,60 +1,337 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Product
+from decimal import Decimal
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.text import slugify
+from .models import Categories, ProductListings, Products, ProductVariants, Reviews
 from .serializers import ProductSerializer
-from shop.models import Shop
+from shop.models import Shops
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from config.caching import cached_page, conditional_response
+from config.pagination import keyset_page, parse_limit
+from config.validation import positive_int
+from . import analytics, batch_update, categories, detail, facets, importer, inventory, listings, moderation, recommendations, reviews, search
+from .catalog import LISTINGS_NAMESPACE, invalidate_catalog
+
+MODERATION_STATUSES = ('pending', 'approved', 'rejected', 'flagged', 'modification')
+# Slim projection for board rows; the full record is fetched on the detail page.
+MODERATION_FIELDS = (
+    'product_id', 'product_name', 'shop_id', 'category_id', 'sku', 'brand',
+    'status', 'featured', 'created_at', 'updated_at',
+)
+MODERATION_ORDER = ('updated_at', 'product_id')
+PUBLIC_CATALOG_FIELDS = (
+    'product_id', 'product_name', 'product_slug', 'short_description',
+    'shop_id', 'category_id', 'brand', 'featured',
+)
 
 
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def product_groups(request):
-    qs = Product.objects.all()
-    serialize = lambda q: ProductSerializer(q, many=True).data
-    groups = {
-        'pending': serialize(qs.filter(status='pending')),
-        'approved': serialize(qs.filter(status='approved')),
-        'rejected': serialize(qs.filter(status='rejected')),
-        'flagged': serialize(qs.filter(status='flagged')),
-        'modification': serialize(qs.filter(status='modification')),
-    }
+    # One GROUP BY for the counts, then a bounded keyset page per status
+    # (served by idx_products_status), so cost tracks page size, not catalog size.
+    counts = dict.fromkeys(MODERATION_STATUSES, 0)
+    rows = Products.objects.values('status').annotate(n=Count('product_id')).order_by()
+    counts.update({r['status']: r['n'] for r in rows if r['status'] in counts})
+
+    only = request.query_params.get('status')
+    if only is not None and only not in counts:
+        return Response({'detail': 'unknown status'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = parse_limit(request)
+    # A cursor only makes sense when paging through a single status.
+    cursor = request.query_params.get('cursor') if only else None
+
+    groups = {'counts': counts}
+    for s in ([only] if only else MODERATION_STATUSES):
+        qs = Products.objects.filter(status=s).values(*MODERATION_FIELDS)
+        page, next_cursor = keyset_page(qs, MODERATION_ORDER, cursor, limit)
+        groups[s] = {'results': page, 'next': next_cursor}
     return Response(groups)
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def product_groups_public(request):
-    qs = Product.objects.all()
-    serialize = lambda q: ProductSerializer(q, many=True).data
-    groups = {
-        'approved': serialize(qs.filter(status='approved')),
+    # Pages are cached per listings version; approve/reject and any listing row
+    # change bump it, and clients revalidate with ETag / If-Modified-Since for a 304.
+    try:
+        params = _parse_listing_params(request)
+    except ValueError as exc:
+        return Response({'detail': f'invalid {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    def build():
+        qs = ProductListings.objects.filter(status='approved')
+        page, next_cursor = listings.listing_page(qs, params['sort'], params['cursor'], params['limit'], params)
+        return {'approved': page, 'next': next_cursor}
+
+    data, etag, last_modified = cached_page(LISTINGS_NAMESPACE, params, build)
+    return conditional_response(request, data, etag, last_modified)
+
+
+def _parse_listing_params(request):
+    qp = request.query_params
+    sort = qp.get('sort') or 'newest'
+    if sort not in listings.SORTS:
+        raise ValueError('sort')
+    params = {
+        'sort': sort,
+        'cursor': qp.get('cursor'),
+        'limit': parse_limit(request),
+        'in_stock': qp.get('in_stock') in ('1', 'true'),
     }
-    return Response(groups)
+    for key in ('min_price', 'max_price'):
+        try:
+            params[key] = Decimal(qp[key]) if qp.get(key) else None
+        except ArithmeticError:
+            raise ValueError(key)
+    return params
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def category_tree(request):
+    # Flat list of active categories (optionally one subtree) with per-node
+    # approved-product counts; clients assemble the tree from parent_category_id.
+    qs = Categories.objects.filter(is_active=1)
+    root = request.query_params.get('root')
+    if root:
+        try:
+            qs = qs.filter(category_id__in=categories.subtree_ids(int(root)))
+        except ValueError:
+            return Response({'detail': 'invalid root'}, status=status.HTTP_400_BAD_REQUEST)
+    counts = categories.subtree_product_counts()
+    rows = list(qs.order_by('sort_order', 'category_id').values(
+        'category_id', 'parent_category_id', 'category_name', 'category_slug', 'image_url', 'sort_order',
+    ))
+    for row in rows:
+        row['product_count'] = counts.get(row['category_id'], 0)
+    return Response({'categories': rows})
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def category_products(request, pk: int):
+    try:
+        params = _parse_listing_params(request)
+    except ValueError as exc:
+        return Response({'detail': f'invalid {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    def build():
+        qs = ProductListings.objects.filter(status='approved', category_id__in=categories.subtree_ids(pk))
+        page, next_cursor = listings.listing_page(qs, params['sort'], params['cursor'], params['limit'], params)
+        return {'results': page, 'next': next_cursor}
+
+    data, etag, last_modified = cached_page(LISTINGS_NAMESPACE, dict(params, category=pk), build)
+    return conditional_response(request, data, etag, last_modified)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def product_detail(request, pk: int):
+    doc = detail.get_document(pk)
+    if doc is None:
+        return Response({'detail': 'not found'}, status=404)
+    analytics.record(pk, 'views')
+    return Response(doc)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def product_recommendations(request, pk: int):
+    return Response({'results': recommendations.for_product(pk)})
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def review_list(request):
+    # ?product=<id> or ?shop=<id>; sort=newest|helpful; cursor/limit as elsewhere.
+    qp = request.query_params
+    sort = qp.get('sort') or 'newest'
+    if sort not in reviews.SORTS:
+        return Response({'detail': 'invalid sort'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        product_id = int(qp['product']) if qp.get('product') else None
+        shop_id = int(qp['shop']) if qp.get('shop') else None
+    except ValueError:
+        return Response({'detail': 'invalid product or shop'}, status=status.HTTP_400_BAD_REQUEST)
+    if (product_id is None) == (shop_id is None):
+        return Response({'detail': 'exactly one of product or shop is required'}, status=status.HTTP_400_BAD_REQUEST)
+    rows, next_cursor = reviews.review_page(product_id, shop_id, sort, qp.get('cursor'), parse_limit(request))
+    return Response({'results': rows, 'next_cursor': next_cursor})
+
+
+@api_view(['POST', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def vote_review(request, pk: int):
+    vote_type = None if request.method == 'DELETE' else request.data.get('vote_type')
+    if request.method == 'POST' and vote_type not in reviews.VOTE_TYPES:
+        return Response({'detail': 'vote_type must be helpful or not_helpful'}, status=status.HTTP_400_BAD_REQUEST)
+    if not Reviews.objects.filter(pk=pk, status=reviews.VISIBLE_STATUS).exists():
+        return Response({'detail': 'not found'}, status=404)
+    reviews.cast_vote(pk, request.user.username, vote_type)
+    return Response(Reviews.objects.filter(pk=pk).values('helpful_count', 'unhelpful_count', 'helpful_score').first())
+
+
+def _parse_attribute_selection(values):
+    # ?attr=<attribute_id>:<value>, repeated; several values of one attribute are OR-ed.
+    selected = {}
+    for raw in values:
+        attribute_id, sep, value = raw.partition(':')
+        if not sep or not value:
+            raise ValueError('attr')
+        try:
+            selected.setdefault(int(attribute_id), set()).add(value)
+        except ValueError:
+            raise ValueError('attr')
+    return selected
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def facet_products(request):
+    params = request.query_params
+    try:
+        selected = _parse_attribute_selection(params.getlist('attr'))
+        filters = _parse_search_filters(params)
+        wanted = {int(a) for a in params.get('facets', '').split(',') if a} or None
+    except ValueError as exc:
+        return Response({'detail': f'invalid {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = parse_limit(request)
+    try:
+        offset = max(0, int(params.get('offset', 0)))
+    except ValueError:
+        offset = 0
+
+    index = facets.get_index()
+    q = (params.get('q') or '').strip()
+    ranked = None
+    candidates = None
+    if q:
+        ranked = search.matching_ids(q, filters)
+        candidates = index.mask_for(ranked)
+    elif any(v not in (None, '') for v in filters.values()):
+        base = search.apply_filters(Products.objects.filter(status='approved'), filters)
+        candidates = index.mask_for(base.values_list('pk', flat=True).iterator(chunk_size=5000))
+
+    mask, counts = index.query(selected, candidates, wanted)
+    if ranked is not None:
+        matched = set(index.product_ids_in(mask))
+        ordered = [pid for pid in ranked if pid in matched]
+    else:
+        ordered = sorted(index.product_ids_in(mask), reverse=True)
+    page_ids = ordered[offset:offset + limit]
+    rows = {r['product_id']: r for r in Products.objects.filter(pk__in=page_ids).values(*PUBLIC_CATALOG_FIELDS)}
+    return Response({
+        'results': [rows[pid] for pid in page_ids if pid in rows],
+        'count': len(ordered),
+        'facets': {str(a): values for a, values in counts.items()},
+    })
+
+
+def _parse_search_filters(params):
+    filters = {'brand': params.get('brand') or None}
+    for key, cast in (('shop', int), ('category', int), ('min_price', Decimal), ('max_price', Decimal)):
+        raw = params.get(key)
+        if raw in (None, ''):
+            filters[key] = None
+            continue
+        try:
+            filters[key] = cast(raw)
+        except (ValueError, ArithmeticError):
+            raise ValueError(key)
+    return filters
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search_products(request):
+    q = (request.query_params.get('q') or '').strip()
+    if not q:
+        return Response({'detail': 'q required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        filters = _parse_search_filters(request.query_params)
+    except ValueError as exc:
+        return Response({'detail': f'invalid {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = parse_limit(request)
+    try:
+        offset = max(0, int(request.query_params.get('offset', 0)))
+    except ValueError:
+        offset = 0
+    rows, total = search.search_products(q, filters, PUBLIC_CATALOG_FIELDS, limit, offset)
+    return Response({'results': rows, 'count': total})
+
+
+def _set_product_status(pk, new_status):
+    try:
+        p = Products.objects.get(pk=pk)
+    except Products.DoesNotExist:
+        return Response({'ok': False, 'error': 'not_found'}, status=404)
+    if p.status != new_status:
+        p.status = new_status
+        p.updated_at = timezone.now()
+        p.save(update_fields=['status', 'updated_at'])
+        invalidate_catalog()
+    return Response({'ok': True})
 
 
 @api_view(['POST'])
 @permission_classes([IsAdminUser])
 def approve_product(request, pk: int):
-    try:
-        p = Product.objects.get(pk=pk)
-        p.status = 'approved'
-        p.save(update_fields=['status', 'updated_at'])
-        return Response({'ok': True})
-    except Product.DoesNotExist:
-        return Response({'ok': False, 'error': 'not_found'}, status=404)
+    return _set_product_status(pk, 'approved')
 
 
 @api_view(['POST'])
 @permission_classes([IsAdminUser])
 def reject_product(request, pk: int):
+    return _set_product_status(pk, 'rejected')
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def lease_reviews(request):
     try:
-        p = Product.objects.get(pk=pk)
-        p.status = 'rejected'
-        p.save(update_fields=['status', 'updated_at'])
-        return Response({'ok': True})
-    except Product.DoesNotExist:
-        return Response({'ok': False, 'error': 'not_found'}, status=404)
+        size = int(request.data.get('size', 50))
+    except (TypeError, ValueError):
+        return Response({'detail': 'invalid size'}, status=status.HTTP_400_BAD_REQUEST)
+    rows = moderation.lease(request.user.username, max(1, size))
+    return Response({'results': rows, 'lease_seconds': moderation.LEASE_SECONDS})
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def moderate_reviews(request):
+    decisions = request.data.get('decisions')
+    if not isinstance(decisions, list) or not decisions:
+        return Response({'detail': 'decisions must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(decisions) > moderation.MAX_BATCH:
+        return Response({'detail': f'at most {moderation.MAX_BATCH} decisions per request'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        if any(d['action'] not in moderation.ACTIONS for d in decisions):
+            raise ValueError
+        applied, skipped = moderation.decide(request.user.username, decisions)
+    except (KeyError, TypeError, ValueError):
+        return Response({'detail': 'each decision needs review_id and action approve|reject'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return Response({'applied': applied, 'skipped': skipped})
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def release_reviews(request):
+    ids = request.data.get('review_ids')
+    if ids is not None:
+        if not isinstance(ids, list) or len(ids) > moderation.MAX_BATCH:
+            return Response({'detail': f'review_ids must be a list of at most {moderation.MAX_BATCH} ids'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = [positive_int(i, 'review_ids') for i in ids]
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'released': moderation.release(request.user.username, ids)})
 
 
 @api_view(['GET'])
@@ -63,8 +340,7 @@ def my_products(request):
     user = request.user if request.user and request.user.is_authenticated else None
     if not user:
         return Response({'detail': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
-    shops = Shop.objects.filter(owner=user)
-    qs = Product.objects.filter(shop__in=shops)
+    qs = Products.objects.filter(shop__owner__keycloak_user_id=user.username).order_by('product_id')
     return Response(ProductSerializer(qs, many=True).data)
 
 
@@ -77,36 +353,142 @@ def submit_product(request):
     shop_id = request.data.get('shop')
     name = request.data.get('name')
     price = request.data.get('price')
-    category = request.data.get('category', '')
-    description = request.data.get('description', '')
     if not shop_id or not name or price is None:
         return Response({'detail': 'Missing fields'}, status=status.HTTP_400_BAD_REQUEST)
-    try:
-        shop = Shop.objects.get(pk=shop_id, owner=user)
-    except Shop.DoesNotExist:
+    shop = Shops.objects.filter(pk=shop_id, owner__keycloak_user_id=user.username).first()
+    if shop is None:
         return Response({'detail': 'Shop not found'}, status=status.HTTP_404_NOT_FOUND)
-    p = Product.objects.create(shop=shop, name=name, price=price, description=description, category=category, status='pending')
+    # A submission is a one-row import: same validation, default variant and 'pending' status.
+    slug = slugify(str(name))[:255]
+    report = importer.CatalogImporter(shop.pk).run([{
+        'product_name': name, 'product_slug': slug, 'price': price,
+        'category_id': request.data.get('category'), 'description': request.data.get('description'),
+    }])
+    if not report['created']:
+        return Response({'detail': report['errors'][0]['error']}, status=status.HTTP_400_BAD_REQUEST)
+    p = Products.objects.get(shop_id=shop.pk, product_slug=slug)
     return Response(ProductSerializer(p).data, status=status.HTTP_201_CREATED)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def import_products(request):
+    # Body is the raw CSV/JSONL file; it is read straight off the request
+    # stream (request.data is never touched), so nothing is buffered whole.
+    try:
+        shop_id = int(request.query_params.get('shop'))
+    except (TypeError, ValueError):
+        return Response({'detail': 'shop required'}, status=status.HTTP_400_BAD_REQUEST)
+    fmt = request.query_params.get('format') or ('jsonl' if 'json' in (request.content_type or '') else 'csv')
+    if fmt not in importer.PARSERS:
+        return Response({'detail': 'format must be csv or jsonl'}, status=status.HTTP_400_BAD_REQUEST)
+    if not Shops.objects.filter(pk=shop_id, owner__keycloak_user_id=request.user.username).exists():
+        return Response({'detail': 'Shop not found'}, status=status.HTTP_404_NOT_FOUND)
+    if request.stream is None:
+        return Response({'detail': 'empty body'}, status=status.HTTP_400_BAD_REQUEST)
+    report = importer.CatalogImporter(shop_id).run(importer.PARSERS[fmt](request.stream))
+    return Response(report, status=status.HTTP_201_CREATED if report['created'] else status.HTTP_200_OK)
+
+
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
 def update_stock(request, pk: int):
-    try:
-        p = Product.objects.get(pk=pk)
-    except Product.DoesNotExist:
+    variants = ProductVariants.objects.filter(product_id=pk, product__shop__owner__keycloak_user_id=request.user.username)
+    variant_id = request.data.get('variant')
+    if variant_id:
+        try:
+            variant_id = positive_int(variant_id, 'variant')
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    variant = (variants.filter(pk=variant_id) if variant_id else variants.filter(is_default=1)).first()
+    if variant is None:
         return Response({'detail': 'not found'}, status=404)
-    stock = request.data.get('stock')
-    # Demo model lacks stock; ignore or extend model in real implementation
+    try:
+        stock = int(request.data.get('stock'))
+        inventory.set_stock(variant.pk, stock)
+    except (TypeError, ValueError, OverflowError):
+        return Response({'detail': 'stock must be a non-negative integer'}, status=status.HTTP_400_BAD_REQUEST)
+    except inventory.InsufficientStock:
+        return Response({'detail': 'stock is below reserved quantity'}, status=status.HTTP_409_CONFLICT)
     return Response({'ok': True})
 
 
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
-def request_edit(request, pk: int):
+def batch_update_stock(request):
+    items = request.data.get('items')
+    if not isinstance(items, list) or not items:
+        return Response({'detail': 'items required'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > batch_update.MAX_ITEMS:
+        return Response({'detail': f'at most {batch_update.MAX_ITEMS} items per call'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        shop_id = positive_int(request.data.get('shop'), 'shop')
+    except ValueError as exc:
+        return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    shop = Shops.objects.filter(pk=shop_id, owner__keycloak_user_id=request.user.username).first()
+    if shop is None:
+        return Response({'detail': 'Shop not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'results': batch_update.apply_batch(shop.pk, items)})
+
+
+def _inventory_lines(request):
+    items = request.data.get('items')
+    if not isinstance(items, list) or not items:
+        raise ValueError('items required')
+    try:
+        return inventory.normalize_lines((item['variant_id'], item['quantity']) for item in items)
+    except (KeyError, TypeError):
+        raise ValueError('each item needs variant_id and quantity')
+
+
+def _insufficient(exc):
+    return Response({'ok': False, 'error': 'insufficient_stock', 'variant_id': exc.variant_id},
+                    status=status.HTTP_409_CONFLICT)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def reserve_stock(request):
+    try:
+        reservation_id = inventory.reserve(_inventory_lines(request), request.user.pk)
+    except ValueError as exc:
+        return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    except inventory.InsufficientStock as exc:
+        return _insufficient(exc)
+    return Response({'ok': True, 'reservation_id': reservation_id}, status=status.HTTP_201_CREATED)
+
+
+def _close_reservation(request, action):
+    reservation_id = request.data.get('reservation_id')
+    if not isinstance(reservation_id, str) or not reservation_id:
+        return Response({'detail': 'reservation_id required'}, status=status.HTTP_400_BAD_REQUEST)
+    # Staff (e.g. the payment callback) may close any reservation; everyone else only their own.
+    user_id = None if request.user.is_staff else request.user.pk
     try:
-        _ = Product.objects.get(pk=pk)
-    except Product.DoesNotExist:
+        action(reservation_id, user_id)
+    except inventory.UnknownReservation:
+        return Response({'detail': 'reservation not found'}, status=status.HTTP_404_NOT_FOUND)
+    except inventory.InsufficientStock as exc:
+        return _insufficient(exc)
+    return Response({'ok': True})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def commit_stock(request):
+    return _close_reservation(request, inventory.commit)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def release_stock(request):
+    return _close_reservation(request, inventory.release)
+
+
+@api_view(['PATCH'])
+@permission_classes([IsAuthenticated])
+def request_edit(request, pk: int):
+    if not Products.objects.filter(pk=pk).exists():
         return Response({'detail': 'not found'}, status=404)
     # Accept and noop store pending changes for demo
     return Response({'ok': True})
@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from orders.models import OrderItems
+from .models import JobWatermarks
+
+# No order transaction is expected to stay open longer than this.
+ORDER_SETTLE_SECONDS = getattr(settings, 'ORDER_SETTLE_SECONDS', 300)
+
+
+def get_watermark(job_name, for_update=False):
+    """Current position of ``job_name``; ``for_update`` locks the row until the surrounding transaction ends."""
+    rows = JobWatermarks.objects.filter(pk=job_name)
+    if for_update:
+        rows = rows.select_for_update()
+    row = rows.values_list('position', flat=True).first()
+    return row or 0
+
+
+def set_watermark(job_name, position):
+    JobWatermarks.objects.update_or_create(
+        job_name=job_name, defaults={'position': position, 'updated_at': timezone.now()},
+    )
+
+
+def settled_order_id(settle_seconds=ORDER_SETTLE_SECONDS):
+    """Upper bound for order_id watermarks: every order at or below it has committed.
+
+    order_ids are handed out when a transaction inserts, not when it commits,
+    so MAX(order_id) can be ahead of a slower checkout that still holds a
+    lower id. Stopping at the newest order whose items are ``settle_seconds``
+    old leaves that checkout for a later run instead of skipping it forever.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+    row = (OrderItems.objects.filter(created_at__lte=cutoff)
+           .order_by('-created_at', '-order_id').values_list('order_id', flat=True).first())
+    return row or 0
@@ -101,3 +101,13 @@ class ReportsReport(models.Model):
     class Meta:
         managed = False
         db_table = 'reports_report'
+
+
+class JobWatermarks(models.Model):
+    job_name = models.CharField(primary_key=True, max_length=100)
+    position = models.PositiveBigIntegerField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'job_watermarks'
@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+from orders.models import OrderItems
+from .models import ShopPerformance, ShopPolicies, Shops, ShopStatistics
+from .serializers import ShopDetailSerializer
+
+DASHBOARD_TIMEOUT = getattr(settings, 'SHOP_DASHBOARD_TIMEOUT', 60)
+SERIES_DAYS = (30, 90)
+OPEN_ITEM_STATUSES = ('pending', 'shipped')
+STATISTICS_FIELDS = ('total_products', 'total_orders', 'total_revenue', 'average_rating', 'total_reviews',
+                     'last_calculated_at')
+POLICY_FIELDS = ('return_policy', 'shipping_policy', 'privacy_policy', 'terms_of_service', 'refund_policy')
+PERFORMANCE_FIELDS = ('date', 'orders_count', 'revenue', 'commission_paid', 'average_rating', 'response_time_hours')
+
+
+def _key(shop_id):
+    return f'shop:dashboard:{shop_id}'
+
+
+def _related(shop, name, fields):
+    # Reverse one-to-one: a missing row raises instead of returning None.
+    try:
+        row = getattr(shop, name)
+    except (ShopStatistics.DoesNotExist, ShopPolicies.DoesNotExist):
+        return None
+    return {f: getattr(row, f) for f in fields}
+
+
+def build_dashboard(shop_id, request=None):
+    """Assemble the seller dashboard in three queries: shop row, performance series, open orders."""
+    # owner is joined too: it is keyed by keycloak_user_id, so serialising it would otherwise fetch the profile.
+    shop = (Shops.objects.select_related('owner', 'shopstatistics', 'shoppolicies')
+            .filter(pk=shop_id).first())
+    if shop is None:
+        return None
+    today = timezone.localdate()
+    since = today - timedelta(days=max(SERIES_DAYS) - 1)
+    series = list(ShopPerformance.objects.filter(shop_id=shop_id, date__gte=since)
+                  .order_by('date').values(*PERFORMANCE_FIELDS))
+    open_orders = dict.fromkeys(OPEN_ITEM_STATUSES, 0)
+    open_orders.update(
+        OrderItems.objects.filter(shop_id=shop_id, status__in=OPEN_ITEM_STATUSES)
+        .values('status').annotate(n=Count('order_id', distinct=True)).order_by()
+        .values_list('status', 'n')
+    )
+    return {
+        'shop': ShopDetailSerializer(shop, context={'request': request}).data,
+        'statistics': _related(shop, 'shopstatistics', STATISTICS_FIELDS),
+        'policies': _related(shop, 'shoppolicies', POLICY_FIELDS),
+        'performance': {
+            # The shorter windows are tails of the longest one, not extra queries.
+            f'{days}d': [row for row in series if row['date'] > today - timedelta(days=days)]
+            for days in SERIES_DAYS
+        },
+        'open_orders': open_orders,
+    }
+
+
+def get_dashboard(shop_id, request=None):
+    data = cache.get(_key(shop_id))
+    if data is None:
+        data = build_dashboard(shop_id, request)
+        if data is not None:
+            cache.set(_key(shop_id), data, DASHBOARD_TIMEOUT)
+    return data
+
+
+def invalidate(shop_id):
+    cache.delete(_key(shop_id))
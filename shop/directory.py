@@ -0,0 +1,28 @@
+from config.caching import bump_version
+from config.pagination import keyset_page
+from .models import Shops
+
+# Cache namespace for every public directory page; bumping it retires them all at once.
+DIRECTORY_NAMESPACE = 'shop:directory'
+DIRECTORY_FIELDS = (
+    'shop_id', 'shop_name', 'shop_slug', 'city', 'state', 'country',
+    'description', 'logo_url', 'banner_url', 'shop_type',
+)
+DIRECTORY_ORDER = ('shop_name', 'shop_id')
+LOCATION_FILTERS = ('country', 'state', 'city')
+
+
+def invalidate_directory():
+    bump_version(DIRECTORY_NAMESPACE)
+
+
+def directory_page(params):
+    """One page of approved shops; ``params`` carries cursor, limit, location and category filters."""
+    qs = Shops.objects.filter(status='approved')
+    for key in LOCATION_FILTERS:
+        if params.get(key):
+            qs = qs.filter(**{key: params[key]})
+    if params.get('category') is not None:
+        # (shop, category) is unique, so the join cannot duplicate rows.
+        qs = qs.filter(shopcategoryassignments__category_id=params['category'])
+    return keyset_page(qs.values(*DIRECTORY_FIELDS), DIRECTORY_ORDER, params.get('cursor'), params['limit'])
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from shop import uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete abandoned resumable uploads and temp files under MEDIA_ROOT/shop_docs/partial'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age-hours', type=float, default=uploads.PARTIAL_TTL / 3600,
+                            help='remove files untouched for this long')
+
+    def handle(self, *args, **options):
+        removed = uploads.cleanup_partial(options['max_age_hours'] * 3600)
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} partial upload files'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from shop import statistics
+
+
+class Command(BaseCommand):
+    help = 'Fold activity since the last run into shop_statistics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='recompute every shop from scratch')
+
+    def handle(self, *args, **options):
+        orders, products, ratings = statistics.refresh(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Folded in {orders} orders; refreshed products for {products} shops and ratings for {ratings} shops'
+        ))
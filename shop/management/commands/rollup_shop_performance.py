@@ -0,0 +1,33 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from shop import performance
+
+
+class Command(BaseCommand):
+    help = 'Roll up one day (default: yesterday) or a date range into shop_performance'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='YYYY-MM-DD; defaults to yesterday')
+        parser.add_argument('--start', help='backfill from YYYY-MM-DD (inclusive)')
+        parser.add_argument('--end', help='backfill to YYYY-MM-DD (inclusive); defaults to yesterday')
+        parser.add_argument('--workers', type=int, default=4, help='processes used for a backfill')
+
+    def handle(self, *args, **options):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        try:
+            if options['start']:
+                first = date.fromisoformat(options['start'])
+                last = date.fromisoformat(options['end']) if options['end'] else yesterday
+                if last < first:
+                    raise CommandError('--end is before --start')
+                for day, shops in performance.backfill(first, last, workers=options['workers']):
+                    self.stdout.write(f'{day}: {shops} shops')
+                return
+            day = date.fromisoformat(options['date']) if options['date'] else yesterday
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        shops = performance.rollup_day(day)
+        self.stdout.write(self.style.SUCCESS(f'{day}: rolled up {shops} shops'))
@@ -0,0 +1,152 @@
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+import django
+from django.db import connections, transaction
+from django.db.models import Avg, Count, Q, Sum
+from django.utils import timezone
+
+from config.db import bulk_upsert
+from orders.models import OrderItems
+from payments.models import Commissions
+from products.models import Reviews
+from seller_messages.models import SellerMessagesSellermessage
+from users.models import UsersUser
+from .models import ShopPerformance, Shops
+
+COLUMNS = ('shop_id', 'date', 'orders_count', 'revenue', 'commission_paid', 'average_rating',
+           'response_time_hours', 'created_at')
+EXCLUDED_ITEM_STATUSES = ('cancelled', 'refunded')
+PAID_COMMISSION_STATUS = 'paid_out'
+# A customer message older than this with no reply is not counted against the day.
+RESPONSE_LOOKBACK = timedelta(days=7)
+CHUNK_SIZE = 5000
+# Orders, commissions and reviews are grouped by shop in the database: NumPy is
+# not a dependency here, and a GROUP BY hands back one row per shop instead of
+# streaming every item of the day into Python. Only the message timestamps,
+# which need pairing rather than summing, are streamed in chunks.
+
+
+def _window(day):
+    start = datetime.combine(day, time.min)
+    if timezone.is_naive(start) and timezone.is_aware(timezone.now()):
+        start = timezone.make_aware(start)
+    return start, start + timedelta(days=1)
+
+
+def _order_totals(start, end):
+    rows = (OrderItems.objects
+            .filter(created_at__gte=start, created_at__lt=end)
+            .exclude(status__in=EXCLUDED_ITEM_STATUSES)
+            .values('shop_id')
+            .annotate(orders=Count('order_id', distinct=True), revenue=Sum('total_price'))
+            .order_by())
+    return {r['shop_id']: (r['orders'], r['revenue'] or Decimal('0')) for r in rows}
+
+
+def _commission_totals(start, end):
+    rows = (Commissions.objects
+            .filter(status=PAID_COMMISSION_STATUS, calculated_at__gte=start, calculated_at__lt=end)
+            .values('shop_id').annotate(paid=Sum('commission_amount')).order_by())
+    return {r['shop_id']: r['paid'] or Decimal('0') for r in rows}
+
+
+def _day_ratings(start, end):
+    rows = (Reviews.objects
+            .filter(status='approved', created_at__gte=start, created_at__lt=end)
+            .values('shop_id').annotate(avg=Avg('rating')).order_by())
+    return {r['shop_id']: r['avg'] for r in rows}
+
+
+def _running_ratings(shop_ids, end):
+    """Average of each shop's approved reviews created before ``end``, as the day itself saw it."""
+    rows = (Reviews.objects
+            .filter(status='approved', shop_id__in=shop_ids, created_at__lt=end)
+            .values('shop_id').annotate(avg=Avg('rating')).order_by())
+    return {r['shop_id']: r['avg'] for r in rows}
+
+
+def _response_hours(start, end):
+    """Average hours each shop owner took to answer a customer, for replies sent in [start, end).
+
+    Messages are streamed in time order in chunks; only the oldest unanswered
+    message per (owner, customer) pair is kept in memory.
+    """
+    owners = defaultdict(list)
+    owner_ids = dict(UsersUser.objects.filter(username__in=Shops.objects.values('owner_id'))
+                     .values_list('username', 'id'))
+    for shop_id, keycloak_id in Shops.objects.filter(owner_id__in=owner_ids).values_list('shop_id', 'owner_id'):
+        owners[owner_ids[keycloak_id]].append(shop_id)
+    if not owners:
+        return {}
+    messages = (SellerMessagesSellermessage.objects
+                .filter(Q(receiver_id__in=owners) | Q(sender_id__in=owners),
+                        created_at__gte=start - RESPONSE_LOOKBACK, created_at__lt=end)
+                .order_by('created_at', 'id')
+                .values_list('sender_id', 'receiver_id', 'created_at'))
+    waiting, totals = {}, defaultdict(lambda: [0.0, 0])
+    for sender, receiver, created_at in messages.iterator(chunk_size=CHUNK_SIZE):
+        if receiver in owners and sender not in owners:
+            waiting.setdefault((receiver, sender), created_at)
+        elif sender in owners and (sender, receiver) in waiting:
+            asked = waiting.pop((sender, receiver))
+            if created_at >= start:
+                for shop_id in owners[sender]:
+                    totals[shop_id][0] += (created_at - asked).total_seconds() / 3600
+                    totals[shop_id][1] += 1
+    return {shop_id: Decimal(str(round(hours / n, 2))) for shop_id, (hours, n) in totals.items()}
+
+
+def rollup_day(day):
+    """Recompute every shop_performance row for ``day``; returns the number of shops written.
+
+    Rows of shops with no activity left that day are removed, so a rerun after
+    cancellations or deletions does not keep stale figures.
+    """
+    start, end = _window(day)
+    orders = _order_totals(start, end)
+    commissions = _commission_totals(start, end)
+    ratings = _day_ratings(start, end)
+    response = _response_hours(start, end)
+    shop_ids = sorted(set(orders) | set(commissions) | set(ratings) | set(response))
+    # Shops with no reviews that day carry the average they had at the end of it.
+    running = _running_ratings([sid for sid in shop_ids if sid not in ratings], end)
+    now = timezone.now()
+    rows = []
+    for sid in shop_ids:
+        count, revenue = orders.get(sid, (0, Decimal('0')))
+        rating = ratings.get(sid, running.get(sid))
+        rating = Decimal(str(round(rating, 2))) if rating is not None else Decimal('0')
+        rows.append((sid, day, count, revenue, commissions.get(sid, Decimal('0')), rating, response.get(sid), now))
+    with transaction.atomic():
+        ShopPerformance.objects.filter(date=day).exclude(shop_id__in=shop_ids).delete()
+        if rows:
+            bulk_upsert(ShopPerformance._meta.db_table, COLUMNS, ('shop_id', 'date'), rows, replace=COLUMNS[2:])
+    return len(rows)
+
+
+def _run_in_worker(day):
+    try:
+        return day, rollup_day(day)
+    finally:
+        connections.close_all()
+
+
+def backfill(first, last, workers=4):
+    """Roll up every day in [first, last] across ``workers`` processes; yields ``(day, shops)``.
+
+    Workers are spawned, not forked: each one runs django.setup() and opens its
+    own connections, so nothing (DB sockets, cache clients, locks) is shared
+    with this process. ``workers=1`` runs the days here, one after another.
+    """
+    days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+    if workers <= 1:
+        for day in days:
+            yield day, rollup_day(day)
+        return
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+        yield from pool.map(_run_in_worker, days)
@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import BasePermission
+
+from .models import Shops, ShopStaff, ShopUserRoles
+
+PERMISSIONS_TIMEOUT = getattr(settings, 'SHOP_PERMISSIONS_TIMEOUT', 60)
+VIEW, MANAGE_PRODUCTS, MANAGE_ORDERS, MANAGE_STAFF, MANAGE_SETTINGS = (
+    'view', 'manage_products', 'manage_orders', 'manage_staff', 'manage_settings',
+)
+ALL_CAPABILITIES = frozenset((VIEW, MANAGE_PRODUCTS, MANAGE_ORDERS, MANAGE_STAFF, MANAGE_SETTINGS))
+# ShopStaff.role and ShopUserRoles.keycloak_role_name -> capabilities; unknown roles can only view.
+ROLE_CAPABILITIES = {
+    'owner': ALL_CAPABILITIES,
+    'manager': frozenset((VIEW, MANAGE_PRODUCTS, MANAGE_ORDERS, MANAGE_SETTINGS)),
+    'shop manager': frozenset((VIEW, MANAGE_PRODUCTS, MANAGE_ORDERS, MANAGE_SETTINGS)),
+    'staff': frozenset((VIEW, MANAGE_PRODUCTS, MANAGE_ORDERS)),
+    'viewer': frozenset((VIEW,)),
+}
+
+
+def _key(user_id):
+    return f'shop:permissions:{user_id}'
+
+
+def _extra(permissions_json):
+    # permissions_json is either a list of capabilities or {capability: bool}.
+    if isinstance(permissions_json, dict):
+        return {c for c, allowed in permissions_json.items() if allowed and c in ALL_CAPABILITIES}
+    if isinstance(permissions_json, list):
+        return {c for c in permissions_json if c in ALL_CAPABILITIES}
+    return set()
+
+
+def build_permissions(user_id):
+    """``{shop_id: capabilities}`` for ``user_id`` from ownership, staff rows and shop roles."""
+    perms = {}
+
+    def grant(shop_id, capabilities):
+        perms[shop_id] = perms.get(shop_id, frozenset()) | frozenset(capabilities)
+
+    for shop_id in Shops.objects.filter(owner_id=user_id).values_list('shop_id', flat=True):
+        grant(shop_id, ALL_CAPABILITIES)
+    staff = ShopStaff.objects.filter(user_id=user_id, status='active').values_list('shop_id', 'role', 'permissions_json')
+    for shop_id, role, permissions_json in staff:
+        grant(shop_id, ROLE_CAPABILITIES.get(role, {VIEW}) | _extra(permissions_json))
+    roles = ShopUserRoles.objects.filter(keycloak_user_id=user_id, is_active=1).values_list('shop_id', 'keycloak_role_name')
+    for shop_id, role_name in roles:
+        grant(shop_id, ROLE_CAPABILITIES.get(role_name.lower(), {VIEW}))
+    return perms
+
+
+def get_permissions(user_id):
+    """Cached ``{shop_id: frozenset(capabilities)}``; rebuilt after PERMISSIONS_TIMEOUT or invalidate()."""
+    perms = cache.get(_key(user_id))
+    if perms is None:
+        perms = build_permissions(user_id)
+        cache.set(_key(user_id), perms, PERMISSIONS_TIMEOUT)
+    return perms
+
+
+def invalidate(user_id):
+    cache.delete(_key(user_id))
+
+
+def shop_ids(user_id, capability=VIEW):
+    return [shop_id for shop_id, caps in get_permissions(user_id).items() if capability in caps]
+
+
+class HasShopCapability(BasePermission):
+    """Allow the request when the user holds ``capability`` on the shop named by the ``pk`` URL kwarg.
+
+    Without a ``pk`` it only requires the user to hold the capability on some
+    shop. Use ``HasShopCapability.require('manage_orders')`` for other capabilities.
+    """
+
+    capability = VIEW
+    shop_kwarg = 'pk'
+
+    @classmethod
+    def require(cls, capability, shop_kwarg='pk'):
+        return type(f'HasShop_{capability}', (cls,), {'capability': capability, 'shop_kwarg': shop_kwarg})
+
+    def has_permission(self, request, view):
+        if not (request.user and request.user.is_authenticated):
+            return False
+        perms = get_permissions(request.user.username)
+        shop_id = getattr(view, 'kwargs', {}).get(self.shop_kwarg)
+        if shop_id is None:
+            return any(self.capability in caps for caps in perms.values())
+        return self.capability in perms.get(int(shop_id), ())
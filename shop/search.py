@@ -0,0 +1,95 @@
+import threading
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from config.caching import bump_version, get_version
+from products.search import MAX_CANDIDATES, InvertedIndex
+from .directory import LOCATION_FILTERS
+from .models import Shops
+
+# Bumped only when a shop enters or leaves the index or its indexed text
+# changes, so profile edits elsewhere do not force a rebuild.
+SEARCH_NAMESPACE = 'shop:search'
+FIELD_WEIGHTS = (('shop_name', 3.0), ('description', 1.0))
+INDEXED_FIELDS = ('status',) + tuple(field for field, _ in FIELD_WEIGHTS)
+# How much a 5-star average lifts relevance: rank = relevance * (1 + RATING_WEIGHT * rating / 5).
+RATING_WEIGHT = 0.5
+# A bare MATCH in WHERE lets MySQL answer the filter from the FULLTEXT index;
+# the blended rank is only computed for the rows it returns.
+FULLTEXT_MATCH = 'MATCH (shop_name, description) AGAINST (%s IN NATURAL LANGUAGE MODE)'
+FULLTEXT_RANK = (
+    'MATCH (shop_name, description) AGAINST (%s IN NATURAL LANGUAGE MODE)'
+    ' * (1 + %s * COALESCE((SELECT average_rating FROM shop_statistics'
+    ' WHERE shop_statistics.shop_id = shops.shop_id), 0) / 5)'
+)
+
+
+def _blend(relevance, rating):
+    return relevance * (1 + RATING_WEIGHT * float(rating or 0) / 5)
+
+
+def invalidate_search():
+    bump_version(SEARCH_NAMESPACE)
+
+
+def _build_index():
+    index = InvertedIndex(FIELD_WEIGHTS)
+    rows = Shops.objects.filter(status='approved').values('shop_id', 'shop_name', 'description')
+    for row in rows.iterator(chunk_size=2000):
+        index.add(row['shop_id'], row)
+    return index
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Process-local index, rebuilt once whenever the search version moves."""
+    global _index, _index_version
+    version, _ = get_version(SEARCH_NAMESPACE)
+    if _index is None or _index_version != version:
+        with _index_lock:
+            if _index is None or _index_version != version:
+                _index = _build_index()
+                _index_version = version
+    return _index
+
+
+def apply_filters(qs, filters):
+    for key in LOCATION_FILTERS:
+        if filters.get(key):
+            qs = qs.filter(**{key: filters[key]})
+    if filters.get('category') is not None:
+        qs = qs.filter(shopcategoryassignments__category_id=filters['category'])
+    return qs
+
+
+def search_shops(query, filters, fields, limit, offset=0):
+    """Return ``(rows, total)`` for approved shops matching ``query``, best first.
+
+    Rank is full-text relevance lifted by the shop's average rating, so a
+    well-rated shop wins ties against an equally relevant unrated one.
+    """
+    base = apply_filters(Shops.objects.filter(status='approved'), filters)
+    if connection.vendor == 'mysql':
+        # extra() emits the predicate verbatim; a boolean RawSQL filter would be
+        # compiled to MATCH(...) = 1 on MySQL, which the index cannot serve.
+        matched = base.extra(where=[FULLTEXT_MATCH], params=[query])
+        qs = (matched.annotate(score=RawSQL(FULLTEXT_RANK, (query, RATING_WEIGHT)))
+                     .order_by('-score', '-shop_id'))
+        return list(qs.values(*fields, 'score')[offset:offset + limit]), matched.count()
+
+    ranked = get_index().search(query)[:MAX_CANDIDATES]
+    # One query both applies the filters and fetches the ratings for the blend.
+    ratings = dict(base.filter(pk__in=[sid for sid, _ in ranked])
+                   .values_list('shop_id', 'shopstatistics__average_rating'))
+    ranked = sorted(
+        ((sid, _blend(score, ratings[sid])) for sid, score in ranked if sid in ratings),
+        key=lambda item: (-item[1], -item[0]),
+    )
+    page = ranked[offset:offset + limit]
+    rows = {r['shop_id']: r for r in Shops.objects.filter(pk__in=[sid for sid, _ in page]).values(*fields)}
+    return [dict(rows[sid], score=round(score, 4)) for sid, score in page if sid in rows], len(ranked)
@@ -0,0 +1,148 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.utils import timezone
+
+from config.caching import bump_version, get_version
+from .models import ShopSettings
+
+# Shops whose decoded settings each process keeps; least recently used are dropped first.
+LRU_SIZE = getattr(settings, 'SHOP_SETTINGS_LRU_SIZE', 1024)
+# Upper bound on staleness should the shared version stamp be evicted or reset.
+LRU_TTL = getattr(settings, 'SHOP_SETTINGS_LRU_TTL', 300)
+# How long a cached entry is trusted before its shared version is looked up again,
+# i.e. how late this process may see another node's write.
+VERSION_CHECK_SECONDS = getattr(settings, 'SHOP_SETTINGS_VERSION_CHECK_SECONDS', 2)
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+
+def _namespace(shop_id):
+    return f'shop:settings:{shop_id}'
+
+
+def decode(value, setting_type):
+    """Turn the stored text into a Python value according to ``setting_type``."""
+    try:
+        if setting_type == 'number':
+            number = Decimal(value)
+            if not number.is_finite():
+                raise ValueError(value)
+            # Huge exponents stay Decimal rather than expanding into an enormous int.
+            return int(number) if number.adjusted() < 19 and number == number.to_integral_value() else number
+        if setting_type == 'boolean':
+            return value.strip().lower() in TRUE_VALUES
+        if setting_type == 'json':
+            return json.loads(value)
+    except (InvalidOperation, ValueError, OverflowError):
+        # A malformed row should not break every caller; hand back the raw text.
+        pass
+    return value
+
+
+def encode(value):
+    """Return ``(text, setting_type)`` for storing ``value``."""
+    if isinstance(value, bool):
+        return ('true' if value else 'false'), 'boolean'
+    if isinstance(value, (int, float, Decimal)):
+        return str(value), 'number'
+    if isinstance(value, (dict, list)):
+        return json.dumps(value), 'json'
+    return str(value), 'string'
+
+
+class SettingsCache:
+    """Bounded per-process LRU of decoded settings, checked against a shared version.
+
+    A warm read costs nothing outside the process: the shop's version stamp
+    is looked up at most once every VERSION_CHECK_SECONDS per entry, and the
+    DB is only hit when another node (or this one) has written since, or when
+    the entry is older than LRU_TTL. Writes made through this process drop
+    its own entry at once.
+    """
+
+    def __init__(self, size=LRU_SIZE, ttl=LRU_TTL, check_every=VERSION_CHECK_SECONDS):
+        self.size = size
+        self.ttl = ttl
+        self.check_every = check_every
+        # shop_id -> [version, values, loaded_at, checked_at]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _fresh(self, shop_id, now, version=None):
+        entry = self._entries.get(shop_id)
+        if entry is None or now - entry[2] >= self.ttl:
+            return None
+        if version is None:
+            if now - entry[3] >= self.check_every:
+                return None
+        elif entry[0] != version:
+            return None
+        else:
+            entry[3] = now
+        self._entries.move_to_end(shop_id)
+        return entry[1]
+
+    def get(self, shop_id):
+        now = time.monotonic()
+        with self._lock:
+            values = self._fresh(shop_id, now)
+        if values is not None:
+            return values
+        version, _ = get_version(_namespace(shop_id))
+        with self._lock:
+            values = self._fresh(shop_id, now, version)
+        if values is not None:
+            return values
+        values = {
+            key: decode(value, setting_type)
+            for key, value, setting_type in ShopSettings.objects.filter(shop_id=shop_id)
+            .values_list('setting_key', 'setting_value', 'setting_type')
+        }
+        with self._lock:
+            self._entries[shop_id] = [version, values, now, now]
+            self._entries.move_to_end(shop_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return values
+
+    def discard(self, shop_id):
+        with self._lock:
+            self._entries.pop(shop_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = SettingsCache()
+
+
+def get_settings(shop_id):
+    """All settings of ``shop_id`` as ``{key: decoded value}``; treat the dict as read-only."""
+    return _cache.get(shop_id)
+
+
+def get_setting(shop_id, key, default=None):
+    return _cache.get(shop_id).get(key, default)
+
+
+def set_setting(shop_id, key, value):
+    text, setting_type = encode(value)
+    now = timezone.now()
+    # The post_save signal bumps the shop's version.
+    row, created = ShopSettings.objects.get_or_create(
+        shop_id=shop_id, setting_key=key,
+        defaults={'setting_value': text, 'setting_type': setting_type, 'created_at': now, 'updated_at': now},
+    )
+    if not created:
+        row.setting_value, row.setting_type, row.updated_at = text, setting_type, now
+        row.save(update_fields=['setting_value', 'setting_type', 'updated_at'])
+
+
+def invalidate(shop_id):
+    bump_version(_namespace(shop_id))
+    _cache.discard(shop_id)
@@ -0,0 +1,97 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from orders.models import OrderItems
+from . import dashboard, permissions, search, shop_settings, statistics
+from .directory import invalidate_directory
+from .models import ShopCategoryAssignments, ShopPolicies, Shops, ShopSettings, ShopStaff, ShopUserRoles
+
+
+@receiver(post_save, sender=Shops)
+@receiver(post_delete, sender=Shops)
+@receiver(post_save, sender=ShopCategoryAssignments)
+@receiver(post_delete, sender=ShopCategoryAssignments)
+def directory_source_changed(sender, instance, **kwargs):
+    # Covers approve/reject as well as profile edits; any of them can change a
+    # directory page. Bumping only after commit keeps a concurrent reader from
+    # caching the old rows under the new version.
+    transaction.on_commit(invalidate_directory)
+
+
+@receiver(post_save, sender=ShopSettings)
+@receiver(post_delete, sender=ShopSettings)
+def settings_changed(sender, instance, **kwargs):
+    # The version lives in the shared cache, so every process drops its copy.
+    # Bumping only after commit keeps a concurrent reader from caching the old
+    # rows under the new version.
+    shop_id = instance.shop_id
+    transaction.on_commit(lambda: shop_settings.invalidate(shop_id))
+
+
+@receiver(pre_save, sender=Shops)
+def shop_pre_save(sender, instance, **kwargs):
+    # Remember the owner before this save, so a transfer also drops the old
+    # owner's permissions, and the indexed fields, so search is only rebuilt
+    # when they change.
+    before = None
+    if instance.pk:
+        before = Shops.objects.filter(pk=instance.pk).values_list('owner_id', *search.INDEXED_FIELDS).first()
+    instance._owner_before = before[0] if before else None
+    instance._search_before = before[1:] if before else None
+
+
+@receiver(post_save, sender=Shops)
+@receiver(post_delete, sender=Shops)
+def search_source_changed(sender, instance, **kwargs):
+    after = tuple(getattr(instance, field) for field in search.INDEXED_FIELDS)
+    if kwargs.get('signal') is post_save and getattr(instance, '_search_before', None) == after:
+        return
+    transaction.on_commit(search.invalidate_search)
+
+
+@receiver(post_save, sender=Shops)
+@receiver(post_delete, sender=Shops)
+def shop_owner_changed(sender, instance, **kwargs):
+    permissions.invalidate(instance.owner_id)
+    before = getattr(instance, '_owner_before', None)
+    if before is not None and before != instance.owner_id:
+        permissions.invalidate(before)
+
+
+@receiver(post_save, sender=ShopStaff)
+@receiver(post_delete, sender=ShopStaff)
+def staff_changed(sender, instance, **kwargs):
+    permissions.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=ShopUserRoles)
+@receiver(post_delete, sender=ShopUserRoles)
+def role_changed(sender, instance, **kwargs):
+    permissions.invalidate(instance.keycloak_user_id)
+
+
+@receiver(post_save, sender=Shops)
+@receiver(post_save, sender=ShopPolicies)
+def dashboard_source_changed(sender, instance, **kwargs):
+    # Profile and policy edits show up at once; stats and orders may lag by the TTL.
+    dashboard.invalidate(instance.pk if sender is Shops else instance.shop_id)
+
+
+@receiver(pre_save, sender=OrderItems)
+def order_item_pre_save(sender, instance, **kwargs):
+    # Remember what the item counted for before this save, so post_save can apply the difference.
+    before = None
+    if instance.pk:
+        before = OrderItems.objects.filter(pk=instance.pk).values_list('status', 'total_price').first()
+    instance._totals_before = before
+
+
+@receiver(post_save, sender=OrderItems)
+def order_item_saved(sender, instance, **kwargs):
+    statistics.item_changed(instance, getattr(instance, '_totals_before', None), (instance.status, instance.total_price))
+
+
+@receiver(post_delete, sender=OrderItems)
+def order_item_deleted(sender, instance, **kwargs):
+    statistics.item_changed(instance, (instance.status, instance.total_price), None)
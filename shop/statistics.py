@@ -0,0 +1,146 @@
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.utils import timezone
+
+from config.db import bulk_upsert
+from orders.models import OrderItems
+from products.models import Products, RatingSummaries
+from reports.jobs import get_watermark, set_watermark, settled_order_id
+from .models import ShopStatistics
+
+JOB_NAME = 'shop_statistics_orders'
+COLUMNS = ('shop_id', 'total_products', 'total_orders', 'total_revenue', 'average_rating', 'total_reviews',
+           'last_calculated_at')
+# Orders folded in per transaction; each range is one GROUP BY over order_items.
+ORDER_BATCH = 10000
+SHOP_BATCH = 500
+EXCLUDED_ITEM_STATUSES = ('cancelled', 'refunded')
+
+
+def _row(shop_id, now, **values):
+    defaults = {'total_products': 0, 'total_orders': 0, 'total_revenue': 0, 'average_rating': 0, 'total_reviews': 0}
+    defaults.update(values)
+    return (shop_id,) + tuple(defaults[c] for c in COLUMNS[1:-1]) + (now,)
+
+
+def _upsert(rows, increment=(), replace=()):
+    bulk_upsert(ShopStatistics._meta.db_table, COLUMNS, ('shop_id',), rows,
+                increment=increment, replace=replace + ('last_calculated_at',))
+
+
+def _fold_orders(now):
+    """Add order counts and revenue for orders past the watermark; returns orders covered."""
+    start = get_watermark(JOB_NAME)
+    # Fix the upper bound first, behind any checkout still in flight, so later
+    # or slower orders wait for the next run instead of falling under the watermark.
+    end = settled_order_id()
+    for low in range(start, end, ORDER_BATCH):
+        high = min(low + ORDER_BATCH, end)
+        # Deltas and watermark move together, so a crashed run never double-counts.
+        # The watermark row is locked before the items are read, so a status
+        # change either lands before this read or sees the new watermark.
+        with transaction.atomic():
+            get_watermark(JOB_NAME, for_update=True)
+            totals = (OrderItems.objects
+                      .filter(order_id__gt=low, order_id__lte=high)
+                      .exclude(status__in=EXCLUDED_ITEM_STATUSES)
+                      .values('shop_id')
+                      .annotate(orders=Count('order_id', distinct=True), revenue=Sum('total_price'))
+                      .order_by('shop_id'))
+            rows = [_row(t['shop_id'], now, total_orders=t['orders'], total_revenue=t['revenue'] or 0) for t in totals]
+            _upsert(rows, increment=('total_orders', 'total_revenue'))
+            set_watermark(JOB_NAME, high)
+    return max(end - start, 0)
+
+
+def contribution(status, total_price):
+    """The revenue an order item adds to its shop's totals, or None if it doesn't count."""
+    if status in EXCLUDED_ITEM_STATUSES:
+        return None
+    return total_price
+
+
+def item_changed(item, before, after):
+    """Correct folded totals for one item going from ``before`` to ``after`` ((status, total_price) or None).
+
+    Items past the watermark are left alone: the next run folds them in with
+    whatever status they have by then. Called from the order_items signals,
+    so set-based UPDATEs of order_items still need a ``refresh(full=True)``.
+    """
+    old = contribution(*before) if before else None
+    new = contribution(*after) if after else None
+    if old == new:
+        return
+    with transaction.atomic():
+        if item.order_id > get_watermark(JOB_NAME, for_update=True):
+            return
+        orders = 0
+        if (old is None) != (new is None):
+            # The order counts once per shop while any of its items there still counts.
+            others = (OrderItems.objects.filter(order_id=item.order_id, shop_id=item.shop_id)
+                      .exclude(pk=item.pk).exclude(status__in=EXCLUDED_ITEM_STATUSES).exists())
+            if not others:
+                orders = 1 if old is None else -1
+        revenue = (new or 0) - (old or 0)
+        updated = (ShopStatistics.objects.filter(shop_id=item.shop_id)
+                   .update(total_orders=F('total_orders') + orders, total_revenue=F('total_revenue') + revenue))
+        if not updated:
+            # Keep the refresh cut-off where it is: stamping "now" would hide product changes from the next run.
+            stamp = ShopStatistics.objects.aggregate(m=Max('last_calculated_at'))['m'] or timezone.now()
+            _upsert([_row(item.shop_id, stamp, total_orders=orders, total_revenue=revenue)],
+                    increment=('total_orders', 'total_revenue'))
+
+
+def _refresh_products(since, now):
+    """Recount approved (catalog-visible) products for shops whose products changed since ``since``."""
+    changed = Products.objects.all()
+    if since is not None:
+        changed = changed.filter(updated_at__gt=since)
+    shop_ids = sorted(set(changed.values_list('shop_id', flat=True)))
+    for start in range(0, len(shop_ids), SHOP_BATCH):
+        batch = shop_ids[start:start + SHOP_BATCH]
+        counts = dict(Products.objects.filter(shop_id__in=batch, status='approved')
+                      .values('shop_id').annotate(n=Count('product_id')).order_by()
+                      .values_list('shop_id', 'n'))
+        with transaction.atomic():
+            _upsert([_row(sid, now, total_products=counts.get(sid, 0)) for sid in batch], replace=('total_products',))
+    return len(shop_ids)
+
+
+def _refresh_ratings(since, now):
+    """Copy shop rating summaries (kept current by products.ratings) that moved since ``since``."""
+    summaries = RatingSummaries.objects.filter(shop_id__isnull=False)
+    if since is not None:
+        summaries = summaries.filter(last_updated_at__gt=since)
+    rows = [
+        _row(sid, now, average_rating=avg, total_reviews=n)
+        for sid, avg, n in summaries.order_by('shop_id').values_list('shop_id', 'average_rating', 'total_reviews')
+    ]
+    for start in range(0, len(rows), SHOP_BATCH):
+        with transaction.atomic():
+            _upsert(rows[start:start + SHOP_BATCH], replace=('average_rating', 'total_reviews'))
+    return len(rows)
+
+
+def refresh(full=False):
+    """Bring shop_statistics up to date with activity since the previous run.
+
+    Orders are folded in as deltas past an order_id watermark that stays
+    behind checkouts still in flight (reports.jobs.settled_order_id); items
+    under it that are later cancelled or refunded are taken back out by
+    item_changed. Product counts
+    and ratings are re-read only for shops whose rows changed after the
+    newest last_calculated_at, so a run costs O(new activity), not O(history).
+    Returns ``(orders, shops_with_product_changes, shops_with_rating_changes)``.
+    """
+    if full:
+        with transaction.atomic():
+            ShopStatistics.objects.update(total_orders=0, total_revenue=0)
+            set_watermark(JOB_NAME, 0)
+        since = None
+    else:
+        since = ShopStatistics.objects.aggregate(m=Max('last_calculated_at'))['m']
+    # Every row written is stamped with the cut-off taken before reading, so
+    # anything that changes mid-run is newer than it and is seen again next time.
+    now = timezone.now()
+    return _fold_orders(now), _refresh_products(since, now), _refresh_ratings(since, now)
@@ -0,0 +1,569 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.test import APIClient, APIRequestFactory
+
+from orders.models import OrderItems
+from orders.tests import ORDER_MODELS, OrderTablesMixin
+from payments.models import Commissions
+from products.models import RatingSummaries, Reviews
+from reports.models import JobWatermarks
+from seller_messages.models import SellerMessagesSellermessage
+from users.models import UserProfiles, UsersUser
+from . import dashboard, performance, permissions, search, shop_settings, statistics, uploads, views
+from .models import (
+    ShopCategories, ShopCategoryAssignments, ShopPerformance, ShopPolicies, ShopSettings, ShopShop, ShopShopattachment, ShopShopdocument, Shops, ShopStaff, ShopStatistics,
+    ShopUserRoles,
+)
+
+# The legacy shop models are unmanaged, so the test runner does not create their tables.
+UPLOAD_MODELS = (UsersUser, ShopShop, ShopShopdocument, ShopShopattachment)
+CSRF_TOKEN = 'a' * 32
+
+
+class UploadTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for model in UPLOAD_MODELS:
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in reversed(UPLOAD_MODELS):
+                editor.delete_model(model)
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.users = UsersUser.objects.bulk_create([
+            UsersUser(username=name, password='', is_superuser=0, first_name='', last_name='', email='',
+                      is_staff=0, is_active=1, date_joined=now, is_seller=1, is_admin=0, phone='')
+            for name in ('alice', 'bob')
+        ])
+        cls.shops = ShopShop.objects.bulk_create([
+            ShopShop(name=user.username, status='approved', created_at=now, updated_at=now, owner_id=user.pk)
+            for user in cls.users
+        ])
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.factory = APIRequestFactory(enforce_csrf_checks=True)
+
+    def post(self, view, user, shop, data, format='multipart'):
+        request = self.factory.post('/', data, format=format, HTTP_X_CSRFTOKEN=CSRF_TOKEN)
+        request.COOKIES['csrftoken'] = CSRF_TOKEN
+        # SessionAuthentication picks the user up from the Django request and enforces CSRF.
+        request.user = user
+        request._dont_enforce_csrf_checks = False
+        return view(request, pk=shop.pk)
+
+
+class UploadViewTests(UploadTestCase):
+
+    def test_multipart_upload_is_content_addressed(self):
+        body = b'license scan'
+        # The parser's handler stores the file while the CSRF check parses the body; no second copy is made.
+        with mock.patch.object(uploads, 'store_file', side_effect=AssertionError('buffered upload')):
+            response = self.post(views.upload_document, self.users[0], self.shops[0],
+                                 {'doc_type': 'license', 'file': SimpleUploadedFile('scan.pdf', body)})
+        self.assertEqual(response.status_code, 201, response.data)
+        digest = hashlib.sha256(body).hexdigest()
+        self.assertEqual(response.data['file'], uploads.content_path(digest, 'scan.pdf'))
+        self.assertTrue(os.path.exists(os.path.join(self.media, response.data['file'])))
+
+    def test_sha256_shortcut_only_for_own_content(self):
+        body = b'shared bytes'
+        self.post(views.upload_attachment, self.users[0], self.shops[0],
+                  {'file': SimpleUploadedFile('a.txt', body)})
+        digest = hashlib.sha256(body).hexdigest()
+        # Bob knows the hash but his shop never stored the file.
+        response = self.post(views.upload_attachment, self.users[1], self.shops[1], {'sha256': digest}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.post(views.start_upload, self.users[1], self.shops[1],
+                             {'sha256': digest, 'filename': 'a.txt'}, format='json')
+        self.assertNotIn('exists', response.data)
+        response = self.post(views.upload_attachment, self.users[0], self.shops[0], {'sha256': digest}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+
+class UploadSessionTests(UploadTestCase):
+
+    def test_resume_and_complete_twice(self):
+        session = uploads.UploadSession.start(1, 1, 'doc.bin', 6)
+        session.append(io.BytesIO(b'abc'), 0)
+        with self.assertRaises(uploads.UploadError):
+            session.append(io.BytesIO(b'def'), 0)
+        session.append(io.BytesIO(b'def'), 3)
+        first = session.complete()
+        again = uploads.UploadSession.load(session.upload_id, 1, 1).complete()
+        self.assertEqual(first, again)
+        self.assertEqual(first[1], hashlib.sha256(b'abcdef').hexdigest())
+        with self.assertRaises(uploads.UploadError):
+            session.append(io.BytesIO(b'x'), 6)
+
+    def test_cleanup_removes_only_stale_files(self):
+        stale = uploads.UploadSession.start(1, 1, 'old.bin', None)
+        fresh = uploads.UploadSession.start(1, 1, 'new.bin', None)
+        past = time.time() - uploads.PARTIAL_TTL - 60
+        for path in uploads.UploadSession._paths(stale.upload_id):
+            os.utime(path, (past, past))
+        self.assertIsNone(uploads.UploadSession.load(stale.upload_id, 1, 1))
+        self.assertEqual(uploads.cleanup_partial(), 2)
+        self.assertIsNotNone(uploads.UploadSession.load(fresh.upload_id, 1, 1))
+
+
+class SettingsDecodeTests(TestCase):
+
+    def test_numbers(self):
+        self.assertEqual(shop_settings.decode('3', 'number'), 3)
+        self.assertEqual(shop_settings.decode('2.50', 'number'), Decimal('2.50'))
+        for raw in ('Infinity', '-Infinity', 'NaN', 'abc'):
+            self.assertEqual(shop_settings.decode(raw, 'number'), raw)
+        self.assertEqual(shop_settings.decode('1e400', 'number'), Decimal('1e400'))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SettingsCacheTests(TestCase):
+    MODELS = (UserProfiles, Shops, ShopSettings)
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for model in cls.MODELS:
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.MODELS):
+                editor.delete_model(model)
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        UserProfiles.objects.bulk_create([UserProfiles(
+            keycloak_user_id='owner-1', email='owner-1@example.com', status='active', created_at=now, updated_at=now,
+        )])
+        cls.shop = Shops.objects.bulk_create([Shops(
+            owner_id='owner-1', shop_name='Shop', shop_slug='shop', status='approved',
+            commission_rate=Decimal('5.00'), minimum_payout_amount=Decimal('10.00'), created_at=now, updated_at=now,
+        )])[0]
+        ShopSettings.objects.bulk_create([ShopSettings(
+            shop_id=cls.shop.pk, setting_key='vacation', setting_value='false', setting_type='boolean',
+            created_at=now, updated_at=now,
+        )])
+
+    def setUp(self):
+        cache.clear()
+        shop_settings._cache.clear()
+
+    def test_warm_read_skips_db_and_shared_cache(self):
+        self.assertEqual(shop_settings.get_settings(self.shop.pk), {'vacation': False})
+        with self.assertNumQueries(0), mock.patch.object(shop_settings, 'get_version') as get_version:
+            self.assertEqual(shop_settings.get_setting(self.shop.pk, 'vacation'), False)
+        get_version.assert_not_called()
+
+    def test_other_nodes_writes_show_after_the_check_window(self):
+        lazy, eager = shop_settings.SettingsCache(check_every=60), shop_settings.SettingsCache(check_every=0)
+        lazy.get(self.shop.pk), eager.get(self.shop.pk)
+        # Another node writes: the row and the shared version change, neither process is told.
+        ShopSettings.objects.filter(shop_id=self.shop.pk).update(setting_value='true')
+        shop_settings.bump_version(shop_settings._namespace(self.shop.pk))
+        self.assertEqual(lazy.get(self.shop.pk), {'vacation': False})
+        self.assertEqual(eager.get(self.shop.pk), {'vacation': True})
+
+    def test_own_write_is_read_back_at_once(self):
+        shop_settings.get_settings(self.shop.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            shop_settings.set_setting(self.shop.pk, 'vacation', True)
+        self.assertIs(shop_settings.get_setting(self.shop.pk, 'vacation'), True)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ShopSearchTests(TestCase):
+    MODELS = (UserProfiles, Shops, ShopStatistics)
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for model in cls.MODELS:
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.MODELS):
+                editor.delete_model(model)
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        UserProfiles.objects.bulk_create([UserProfiles(
+            keycloak_user_id='owner-1', email='owner-1@example.com', status='active', created_at=now, updated_at=now,
+        )])
+        cls.shops = Shops.objects.bulk_create([
+            Shops(owner_id='owner-1', shop_name=name, shop_slug=f'shop-{i}', description=text, status='approved',
+                  commission_rate=Decimal('5.00'), minimum_payout_amount=Decimal('10.00'), created_at=now, updated_at=now)
+            for i, (name, text) in enumerate((('Oak Works', 'hand-made oak tables'), ('Clay Corner', 'mugs and bowls')))
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, q):
+        rows, _ = search.search_shops(q, {}, ('shop_id', 'shop_name'), 10)
+        return [row['shop_name'] for row in rows]
+
+    def version(self):
+        return search.get_version(search.SEARCH_NAMESPACE)[0]
+
+    def test_rename_reaches_the_index(self):
+        self.assertEqual(self.search('oak'), ['Oak Works'])
+        shop = Shops.objects.get(pk=self.shops[1].pk)
+        shop.shop_name = 'Oak Clay'
+        with self.captureOnCommitCallbacks(execute=True):
+            shop.save()
+        self.assertEqual(self.search('oak'), ['Oak Works', 'Oak Clay'])
+
+    def test_unindexed_edit_keeps_the_index(self):
+        before = self.version()
+        shop = Shops.objects.get(pk=self.shops[0].pk)
+        shop.city = 'Porto'
+        with self.captureOnCommitCallbacks(execute=True):
+            shop.save()
+        self.assertEqual(self.version(), before)
+        shop.status = 'suspended'
+        with self.captureOnCommitCallbacks(execute=True):
+            shop.save()
+        self.assertEqual(self.version(), before + 1)
+
+
+@override_settings(ROOT_URLCONF='shop.urls',
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ShopDirectoryTests(TestCase):
+    MODELS = (UserProfiles, Shops, ShopCategories, ShopCategoryAssignments)
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for model in cls.MODELS:
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.MODELS):
+                editor.delete_model(model)
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        UserProfiles.objects.bulk_create([UserProfiles(
+            keycloak_user_id='owner-1', email='owner-1@example.com', status='active', created_at=now, updated_at=now,
+        )])
+        cls.shops = Shops.objects.bulk_create([
+            Shops(owner_id='owner-1', shop_name=name, shop_slug=name.lower(), city=city, status=shop_status,
+                  commission_rate=Decimal('5.00'), minimum_payout_amount=Decimal('10.00'), created_at=now, updated_at=now)
+            for name, city, shop_status in (('Alder', 'Porto', 'approved'), ('Birch', 'Lisbon', 'approved'),
+                                            ('Cedar', 'Porto', 'approved'), ('Dogwood', 'Porto', 'pending'))
+        ])
+        category = ShopCategories.objects.bulk_create([ShopCategories(category_name='Wood', created_at=now)])[0]
+        ShopCategoryAssignments.objects.bulk_create([
+            ShopCategoryAssignments(shop_id=cls.shops[i].pk, category_id=category.pk, assigned_at=now) for i in (1, 2, 3)
+        ])
+        cls.category = category
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def names(self, **params):
+        response = self.client.get(reverse('shop-list-public'), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [s['shop_name'] for s in response.json()['shops']], response.json()['next']
+
+    def test_approved_shops_filtered_and_paged(self):
+        self.assertEqual(self.names(), (['Alder', 'Birch', 'Cedar'], None))
+        self.assertEqual(self.names(city='Porto')[0], ['Alder', 'Cedar'])
+        self.assertEqual(self.names(category=self.category.pk)[0], ['Birch', 'Cedar'])
+        first, cursor = self.names(limit=2)
+        self.assertEqual((first, self.names(limit=2, cursor=cursor)[0]), (['Alder', 'Birch'], ['Cedar']))
+
+    def test_revalidation_and_invalidation_after_commit(self):
+        response = self.client.get(reverse('shop-list-public'))
+        etag = response['ETag']
+        self.assertEqual(self.client.get(reverse('shop-list-public'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        shop = Shops.objects.get(pk=self.shops[3].pk)
+        shop.status = 'approved'
+        with self.captureOnCommitCallbacks() as callbacks:
+            shop.save(update_fields=['status'])
+            # Until the transaction commits, readers keep the old page.
+            self.assertEqual(self.names()[0], ['Alder', 'Birch', 'Cedar'])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.names()[0], ['Alder', 'Birch', 'Cedar', 'Dogwood'])
+        self.assertEqual(self.client.get(reverse('shop-list-public'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(ROOT_URLCONF='shop.urls')
+class ModerationBoardTests(TestCase):
+    MODELS = (UserProfiles, Shops)
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for model in cls.MODELS:
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.MODELS):
+                editor.delete_model(model)
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        UserProfiles.objects.bulk_create([UserProfiles(
+            keycloak_user_id='owner-1', email='owner-1@example.com', status='active', created_at=now, updated_at=now,
+        )])
+        cls.shops = Shops.objects.bulk_create([
+            Shops(owner_id='owner-1', shop_name=f'Shop {i}', shop_slug=f'shop-{i}', status=shop_status,
+                  tax_id='secret', commission_rate=Decimal('5.00'), minimum_payout_amount=Decimal('10.00'),
+                  created_at=now + timedelta(minutes=i), updated_at=now)
+            for i, shop_status in enumerate(('pending', 'pending', 'pending', 'approved', 'suspended'))
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(UsersUser(username='admin', is_staff=1))
+
+    def test_counts_and_slim_pages_per_status(self):
+        with self.assertNumQueries(1 + len(views.MODERATION_STATUSES)):
+            body = self.client.get(reverse('shop-groups')).json()
+        self.assertEqual(body['counts'], {'pending': 3, 'approved': 1, 'rejected': 0, 'suspended': 1})
+        self.assertEqual(set(body) - {'counts'}, set(views.MODERATION_STATUSES))
+        row = body['approved']['results'][0]
+        self.assertEqual(set(row), set(views.MODERATION_FIELDS))
+        self.assertEqual(row['shop_id'], self.shops[3].pk)
+
+    def test_cursor_pages_one_status(self):
+        seen, cursor = [], None
+        while True:
+            params = {'status': 'pending', 'limit': 2, **({'cursor': cursor} if cursor else {})}
+            page = self.client.get(reverse('shop-groups'), params).json()['pending']
+            seen.extend(r['shop_id'] for r in page['results'])
+            cursor = page['next']
+            if not cursor:
+                break
+        self.assertEqual(seen, [s.pk for s in self.shops[:3]])
+
+    def test_rejects_statuses_outside_the_enum(self):
+        self.assertEqual(self.client.get(reverse('shop-groups'), {'status': 'modification'}).status_code, 400)
+
+    def test_admin_only(self):
+        self.client.force_authenticate(UsersUser(username='owner-1', is_staff=0))
+        self.assertEqual(self.client.get(reverse('shop-groups')).status_code, 403)
+
+
+class OwnerPermissionTests(TestCase):
+    MODELS = (UserProfiles, Shops, ShopStaff, ShopUserRoles)
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for model in cls.MODELS:
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.MODELS):
+                editor.delete_model(model)
+
+    def test_transfer_drops_old_owner_permissions(self):
+        now = timezone.now()
+        UserProfiles.objects.bulk_create([
+            UserProfiles(keycloak_user_id=uid, email=f'{uid}@example.com', status='active', created_at=now, updated_at=now)
+            for uid in ('old-owner', 'new-owner')
+        ])
+        shop = Shops.objects.bulk_create([Shops(
+            owner_id='old-owner', shop_name='Shop', shop_slug='shop', status='approved',
+            commission_rate=Decimal('5.00'), minimum_payout_amount=Decimal('10.00'), created_at=now, updated_at=now,
+        )])[0]
+        self.assertIn(shop.pk, permissions.get_permissions('old-owner'))
+        shop.owner_id = 'new-owner'
+        shop.save()
+        self.assertNotIn(shop.pk, permissions.get_permissions('old-owner'))
+        self.assertIn(shop.pk, permissions.get_permissions('new-owner'))
+
+
+@override_settings(ROOT_URLCONF='shop.urls',
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DashboardTests(OrderTablesMixin, TestCase):
+    models = ORDER_MODELS + (ShopStatistics, ShopPolicies, ShopPerformance, ShopStaff, ShopUserRoles)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_orders()
+        cls.add_order('customer-1', 1, [0])
+        cls.add_order('customer-2', 1, [0, 0], item_status='shipped')
+        cls.add_order('customer-2', 2, [0], item_status='delivered')
+        cls.add_order('customer-2', 1, [1])
+        shop = cls.shops[0]
+        ShopStatistics.objects.bulk_create([ShopStatistics(
+            shop_id=shop.pk, total_products=1, total_orders=3, total_revenue=Decimal('40.00'),
+            average_rating=Decimal('4.50'), total_reviews=2, last_calculated_at=cls.now,
+        )])
+        today = timezone.localdate()
+        ShopPerformance.objects.bulk_create([
+            ShopPerformance(shop_id=shop.pk, date=today - timedelta(days=days), orders_count=1, revenue=Decimal('10.00'),
+                            commission_paid=0, average_rating=Decimal('4.50'), created_at=cls.now)
+            for days in (1, 60, 100)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_build_dashboard_in_three_queries(self):
+        with self.assertNumQueries(3):
+            data = dashboard.build_dashboard(self.shops[0].pk)
+        self.assertEqual(data['shop']['shop_name'], 'Shop 0')
+        self.assertEqual(data['statistics']['total_orders'], 3)
+        self.assertIsNone(data['policies'])
+        self.assertEqual(data['open_orders'], {'pending': 1, 'shipped': 1})
+        self.assertEqual([len(data['performance'][k]) for k in ('30d', '90d')], [1, 2])
+
+    def test_endpoint_serves_owner_only(self):
+        client = APIClient()
+        url = reverse('my-shop-dashboard', args=[self.shops[0].pk])
+        client.force_authenticate(UsersUser(username='customer-1', is_staff=0))
+        self.assertEqual(client.get(url).status_code, 403)
+        client.force_authenticate(UsersUser(username='owner-1', is_staff=0))
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['open_orders'], {'pending': 1, 'shipped': 1})
+
+
+class PerformanceRollupTests(OrderTablesMixin, TestCase):
+    models = ORDER_MODELS + (UsersUser, Commissions, Reviews, SellerMessagesSellermessage, ShopPerformance)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_orders()
+        order = cls.add_order('customer-1', 2, [0, 0])
+        cls.day = order.order_date.date()
+        cls.add_order('customer-2', 2, [0], item_status='cancelled')
+        item = OrderItems.objects.filter(order=order).first()
+        Commissions.objects.bulk_create([
+            Commissions(order_id=order.pk, shop_id=cls.shops[0].pk, item_id=item.pk, commission_rate=Decimal('5.00'),
+                        gross_amount=Decimal('10.00'), commission_amount=Decimal('0.50'), platform_fee=0,
+                        net_amount=Decimal('9.50'), status=status, calculated_at=order.order_date)
+            for status in ('paid_out', 'pending')
+        ])
+        # One review before the day and one after it; only the first shapes that day's average.
+        reviewed = [cls.add_order('customer-1', days, [0]) for days in (10, 0)]
+        Reviews.objects.bulk_create([
+            Reviews(product_id=cls.products[0].pk, order_item=OrderItems.objects.get(order=o), customer_id='customer-1',
+                    shop_id=cls.shops[0].pk, rating=rating, is_verified_purchase=1, status='approved',
+                    created_at=o.order_date, updated_at=o.order_date)
+            for o, rating in zip(reviewed, (4, 2))
+        ])
+        users = {u.username: u for u in UsersUser.objects.bulk_create([
+            UsersUser(username=name, password='', is_superuser=0, first_name='', last_name='', email='',
+                      is_staff=0, is_active=1, date_joined=cls.now, is_seller=0, is_admin=0, phone='')
+            for name in ('owner-1', 'customer-1')
+        ])}
+        asked = datetime.combine(cls.day, datetime.min.time(), dt_timezone.utc) + timedelta(hours=10)
+        SellerMessagesSellermessage.objects.bulk_create([
+            SellerMessagesSellermessage(message='?', created_at=asked, sender=users['customer-1'], receiver=users['owner-1']),
+            SellerMessagesSellermessage(message='!', created_at=asked + timedelta(hours=2),
+                                        sender=users['owner-1'], receiver=users['customer-1']),
+        ])
+        # Left over from an earlier run; shop 1 (another owner's) has no activity that day any more.
+        Shops.objects.filter(pk=cls.shops[1].pk).update(owner_id='customer-2')
+        ShopPerformance.objects.bulk_create([ShopPerformance(
+            shop_id=cls.shops[1].pk, date=cls.day, orders_count=5, revenue=Decimal('50.00'), commission_paid=0,
+            average_rating=0, created_at=cls.now,
+        )])
+
+    def test_rollup_day(self):
+        self.assertEqual(list(performance.backfill(self.day, self.day, workers=1)), [(self.day, 1)])
+        row = ShopPerformance.objects.get(date=self.day)
+        self.assertEqual(row.shop_id, self.shops[0].pk)
+        self.assertEqual((row.orders_count, row.revenue, row.commission_paid), (1, Decimal('20.00'), Decimal('0.50')))
+        self.assertEqual(row.average_rating, Decimal('4.00'))
+        self.assertEqual(row.response_time_hours, Decimal('2.00'))
+
+
+class StatisticsTests(OrderTablesMixin, TestCase):
+    models = ORDER_MODELS + (ShopStatistics, RatingSummaries, JobWatermarks)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_orders()
+        cls.orders = [cls.add_order('customer-1', 2, items) for items in ([0, 0], [0], [1])]
+
+    def totals(self):
+        return dict((sid, (n, revenue)) for sid, n, revenue in
+                    ShopStatistics.objects.values_list('shop_id', 'total_orders', 'total_revenue'))
+
+    def set_status(self, order, status, index=0):
+        item = OrderItems.objects.filter(order=order).order_by('pk')[index]
+        item.status = status
+        item.save()
+
+    def test_cancellations_after_folding_are_subtracted(self):
+        statistics.refresh()
+        shop0, shop1 = (s.pk for s in self.shops)
+        self.assertEqual(self.totals(), {shop0: (2, Decimal('30.00')), shop1: (1, Decimal('10.00'))})
+        self.set_status(self.orders[0], 'cancelled')
+        # The order still has a live item at shop 0, so it keeps counting as an order.
+        self.assertEqual(self.totals()[shop0], (2, Decimal('20.00')))
+        self.set_status(self.orders[0], 'cancelled', index=1)
+        self.set_status(self.orders[2], 'refunded')
+        self.assertEqual(self.totals(), {shop0: (1, Decimal('10.00')), shop1: (0, Decimal('0.00'))})
+        self.set_status(self.orders[2], 'delivered')
+        incremental = self.totals()
+        statistics.refresh()
+        self.assertEqual(self.totals(), incremental)
+        statistics.refresh(full=True)
+        self.assertEqual(self.totals(), incremental)
+
+    def test_items_past_the_watermark_wait_for_the_next_run(self):
+        self.set_status(self.orders[1], 'cancelled')
+        self.assertEqual(self.totals(), {})
+        statistics.refresh()
+        self.assertEqual(self.totals()[self.shops[0].pk], (1, Decimal('20.00')))
@@ -0,0 +1,303 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from rest_framework.parsers import MultiPartParser
+
+UPLOAD_DIR = 'shop_docs'
+PARTIAL_DIR = 'partial'
+CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_SIZE = getattr(settings, 'SHOP_UPLOAD_MAX_SIZE', 100 * 1024 * 1024)
+# Resumable sessions and stray temp files untouched for this long are expired.
+PARTIAL_TTL = getattr(settings, 'SHOP_UPLOAD_PARTIAL_TTL', 24 * 60 * 60)
+_EXTENSION_RE = re.compile(r'^\.[a-z0-9]{1,10}$')
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+_UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    pass
+
+
+def _root():
+    return Path(settings.MEDIA_ROOT) / UPLOAD_DIR
+
+
+def _extension(filename):
+    ext = os.path.splitext(filename or '')[1].lower()
+    return ext if _EXTENSION_RE.match(ext) else ''
+
+
+def content_path(digest, filename):
+    """Storage path (relative to MEDIA_ROOT) for content with ``digest``; fits the 100-char file columns."""
+    return f'{UPLOAD_DIR}/{digest[:2]}/{digest}{_extension(filename)}'
+
+
+def content_prefix(digest):
+    """Prefix shared by every stored path for ``digest`` (any extension), or None for a malformed digest."""
+    if not isinstance(digest, str) or not _DIGEST_RE.match(digest):
+        return None
+    return f'{UPLOAD_DIR}/{digest[:2]}/{digest}'
+
+
+def _publish(tmp, digest, filename):
+    rel = content_path(digest, filename)
+    target = Path(settings.MEDIA_ROOT) / rel
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if target.exists():
+        # Same bytes are already stored; keep one copy.
+        tmp.unlink()
+    else:
+        os.replace(tmp, target)
+    return rel
+
+
+def store_chunks(chunks, filename):
+    """Write ``chunks`` to a temp file while hashing, then move it to its content address.
+
+    Only one chunk is held in memory at a time. Returns ``(path, sha256, size)``.
+    """
+    tmp_dir = _root() / PARTIAL_DIR
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    tmp = tmp_dir / f'{uuid.uuid4().hex}.tmp'
+    digest, size = hashlib.sha256(), 0
+    try:
+        with open(tmp, 'wb') as out:
+            for chunk in chunks:
+                size += len(chunk)
+                if size > MAX_UPLOAD_SIZE:
+                    raise UploadError('file too large')
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return _publish(tmp, digest.hexdigest(), filename), digest.hexdigest(), size
+
+
+def store_file(uploaded):
+    """Store a Django ``UploadedFile`` content-addressed; returns ``(path, sha256, size)``."""
+    return store_chunks(uploaded.chunks(CHUNK_SIZE), uploaded.name)
+
+
+class StoredUpload(UploadedFile):
+    """What ContentAddressedUploadHandler puts in request.FILES: the file is already stored."""
+
+    def __init__(self, path, sha256, size, name):
+        super().__init__(file=None, name=name, size=size)
+        self.path = path
+        self.sha256 = sha256
+
+
+class ContentAddressedUploadHandler(FileUploadHandler):
+    """Multipart handler that hashes each chunk as it is written under MEDIA_ROOT.
+
+    Replaces Django's memory/temp-file handlers, so a request holds at most one
+    chunk in memory and the bytes are written once, straight to storage.
+    """
+
+    chunk_size = CHUNK_SIZE
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        tmp_dir = _root() / PARTIAL_DIR
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp = tmp_dir / f'{uuid.uuid4().hex}.tmp'
+        self.out = open(self.tmp, 'wb')
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > MAX_UPLOAD_SIZE:
+            self.upload_interrupted()
+            raise StopUpload(connection_reset=True)
+        self.digest.update(raw_data)
+        self.out.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        self.out.close()
+        path = _publish(self.tmp, self.digest.hexdigest(), self.file_name)
+        return StoredUpload(path, self.digest.hexdigest(), file_size, self.file_name)
+
+    def upload_interrupted(self):
+        if getattr(self, 'out', None) is not None:
+            self.out.close()
+            self.tmp.unlink(missing_ok=True)
+
+
+class ContentAddressedMultiPartParser(MultiPartParser):
+    """MultiPartParser whose files go through ContentAddressedUploadHandler.
+
+    Used via @parser_classes, so the handler is in place whenever DRF first
+    parses the body, including SessionAuthentication's CSRF check, which runs
+    before the view and would otherwise buffer the body with the default handlers.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        django_request = getattr(request, '_request', request)
+        django_request.upload_handlers = [ContentAddressedUploadHandler(django_request)]
+        return super().parse(stream, media_type, parser_context)
+
+
+def _read_stream(stream):
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+class UploadSession:
+    """A resumable upload: a partial file plus a small JSON sidecar under MEDIA_ROOT.
+
+    Clients append byte ranges at the current offset and may resume after a
+    dropped connection by asking for the offset first. Appends and completion
+    hold an exclusive flock on the sidecar, so concurrent requests for one
+    upload run one at a time. Sessions idle for PARTIAL_TTL are expired.
+    """
+
+    def __init__(self, upload_id, meta):
+        self.upload_id = upload_id
+        self.meta = meta
+
+    @staticmethod
+    def _paths(upload_id):
+        base = _root() / PARTIAL_DIR
+        return base / f'{upload_id}.part', base / f'{upload_id}.json'
+
+    @classmethod
+    def start(cls, shop_id, user_id, filename, size):
+        if size is not None and not 0 <= size <= MAX_UPLOAD_SIZE:
+            raise UploadError('file too large' if size > 0 else 'invalid size')
+        upload_id = uuid.uuid4().hex
+        data, meta_path = cls._paths(upload_id)
+        data.parent.mkdir(parents=True, exist_ok=True)
+        meta = {'shop_id': shop_id, 'user_id': user_id, 'filename': filename, 'size': size}
+        data.touch()
+        meta_path.write_text(json.dumps(meta))
+        return cls(upload_id, meta)
+
+    @classmethod
+    def load(cls, upload_id, shop_id, user_id):
+        if not isinstance(upload_id, str) or not _UPLOAD_ID_RE.match(upload_id):
+            return None
+        data, meta_path = cls._paths(upload_id)
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return None
+        if meta.get('shop_id') != shop_id or meta.get('user_id') != user_id:
+            return None
+        if _last_touched(data, meta_path) < time.time() - PARTIAL_TTL:
+            return None
+        return cls(upload_id, meta)
+
+    @contextmanager
+    def _locked(self):
+        _, meta_path = self._paths(self.upload_id)
+        try:
+            handle = open(meta_path, 'r+')
+        except FileNotFoundError:
+            raise UploadError('unknown upload_id')
+        with handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            # Re-read under the lock: another request may have finished the upload meanwhile.
+            self.meta = json.loads(handle.read())
+            yield handle
+
+    @property
+    def offset(self):
+        if self.meta.get('completed'):
+            return self.meta['completed']['size']
+        return self._paths(self.upload_id)[0].stat().st_size
+
+    def append(self, stream, offset):
+        """Append the request body at ``offset``; returns the new offset."""
+        with self._locked():
+            if self.meta.get('completed'):
+                raise UploadError('upload already completed')
+            if offset != self.offset:
+                raise UploadError(f'offset mismatch, expected {self.offset}')
+            if stream is None:
+                return offset
+            data, _ = self._paths(self.upload_id)
+            size = offset
+            with open(data, 'ab') as out:
+                for chunk in _read_stream(stream):
+                    size += len(chunk)
+                    if size > MAX_UPLOAD_SIZE or (self.meta['size'] is not None and size > self.meta['size']):
+                        out.truncate(offset)
+                        raise UploadError('more bytes than declared')
+                    out.write(chunk)
+            return size
+
+    def complete(self):
+        """Hash the finished file and move it to its content address; returns ``(path, sha256, size)``.
+
+        The result is kept in the sidecar, so a retried request gets the same
+        answer instead of finding the partial file gone.
+        """
+        with self._locked() as handle:
+            done = self.meta.get('completed')
+            if done:
+                return done['path'], done['sha256'], done['size']
+            data, _ = self._paths(self.upload_id)
+            if self.meta['size'] is not None and self.offset != self.meta['size']:
+                raise UploadError('upload incomplete')
+            digest, size = hashlib.sha256(), 0
+            with open(data, 'rb') as f:
+                for chunk in _read_stream(f):
+                    size += len(chunk)
+                    digest.update(chunk)
+            rel = _publish(data, digest.hexdigest(), self.meta['filename'])
+            self.meta['completed'] = {'path': rel, 'sha256': digest.hexdigest(), 'size': size}
+            handle.seek(0)
+            handle.truncate()
+            handle.write(json.dumps(self.meta))
+        return rel, digest.hexdigest(), size
+
+
+def _last_touched(*paths):
+    times = []
+    for path in paths:
+        try:
+            times.append(path.stat().st_mtime)
+        except FileNotFoundError:
+            pass
+    return max(times, default=0)
+
+
+def cleanup_partial(max_age=PARTIAL_TTL):
+    """Delete upload sessions and temp files untouched for ``max_age`` seconds; returns files removed."""
+    base = _root() / PARTIAL_DIR
+    if not base.is_dir():
+        return 0
+    cutoff = time.time() - max_age
+    groups = {}
+    for path in base.iterdir():
+        # A session's .part and .json expire together, judged by the newer of the two.
+        key = path.stem if path.suffix in ('.part', '.json') else path.name
+        groups.setdefault(key, []).append(path)
+    removed = 0
+    for paths in groups.values():
+        if _last_touched(*paths) >= cutoff:
+            continue
+        for path in paths:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            removed += 1
+    return removed
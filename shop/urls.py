@@ -4,12 +4,16 @@ from . import views
 urlpatterns = [
     path('', views.shop_groups, name='shop-groups'),
     path('public/', views.shop_list_public, name='shop-list-public'),
+    path('search/', views.search_shops, name='shop-search'),
     path('<int:pk>/', views.shop_detail_admin, name='shop-detail-admin'),
     path('<int:pk>/approve/', views.approve_shop, name='shop-approve'),
     path('<int:pk>/reject/', views.reject_shop, name='shop-reject'),
     path('mine/', views.my_shops, name='my-shops'),
     path('mine/<int:pk>/', views.my_shop_detail, name='my-shop-detail'),
+    path('mine/<int:pk>/dashboard/', views.my_shop_dashboard, name='my-shop-dashboard'),
     path('submit/', views.submit_shop, name='submit-shop'),
     path('<int:pk>/upload-document/', views.upload_document, name='upload-document'),
     path('<int:pk>/upload-attachment/', views.upload_attachment, name='upload-attachment'),
+    path('<int:pk>/uploads/', views.start_upload, name='upload-start'),
+    path('<int:pk>/uploads/<str:upload_id>/', views.upload_chunk, name='upload-chunk'),
 ]
@@ -1,4 +1,5 @@
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, parser_classes, permission_classes
+from rest_framework.parsers import FormParser, JSONParser
 from rest_framework.response import Response
 from rest_framework import status
 # CORRECTED: Import all necessary models with their correct names
@@ -7,72 +8,138 @@ from .models import Shops, ShopShop, ShopShopdocument, ShopShopattachment
 from .serializers import ShopSerializer, ShopDetailSerializer, ShopDocumentSerializer, ShopAttachmentSerializer
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from django.shortcuts import get_object_or_404
+from django.db.models import Count
+from django.utils import timezone
+from config.caching import cached_page, conditional_response
+from config.pagination import keyset_page, parse_limit
+from . import dashboard, directory, permissions, search, uploads
+from .permissions import HasShopCapability
+
+# The values of the shops.status ENUM (db_structure/2.Shop_management.sql).
+MODERATION_STATUSES = ('pending', 'approved', 'rejected', 'suspended')
+# Slim projection for board rows; the full record is fetched on the detail page.
+MODERATION_FIELDS = ('shop_id', 'shop_name', 'owner_id', 'city', 'status', 'created_at')
+MODERATION_ORDER = ('created_at', 'shop_id')
 
 
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def shop_groups(request):
-    qs = Shops.objects.all()
-    serialize = lambda q: ShopSerializer(q, many=True).data
-    groups = {
-        'pending': serialize(qs.filter(status='pending')),
-        'approved': serialize(qs.filter(status='approved')),
-        'rejected': serialize(qs.filter(status='rejected')),
-        'modification': serialize(qs.filter(status='modification')),
-    }
+    # One GROUP BY for the counts, then a bounded keyset page per status
+    # (served by idx_shops_status), so cost tracks page size, not shop count.
+    counts = dict.fromkeys(MODERATION_STATUSES, 0)
+    rows = Shops.objects.values('status').annotate(n=Count('shop_id')).order_by()
+    counts.update({r['status']: r['n'] for r in rows if r['status'] in counts})
+
+    only = request.query_params.get('status')
+    if only is not None and only not in counts:
+        return Response({'detail': 'unknown status'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = parse_limit(request)
+    # A cursor only makes sense when paging through a single status.
+    cursor = request.query_params.get('cursor') if only else None
+
+    groups = {'counts': counts}
+    for s in ([only] if only else MODERATION_STATUSES):
+        qs = Shops.objects.filter(status=s).values(*MODERATION_FIELDS)
+        page, next_cursor = keyset_page(qs, MODERATION_ORDER, cursor, limit)
+        groups[s] = {'results': page, 'next': next_cursor}
     return Response(groups)
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def shop_list_public(request):
-    qs = Shops.objects.all()
-    data = ShopSerializer(qs, many=True).data
-    return Response({'shops': data})
+    # Approved shops only. Pages are cached per directory version (bumped by the
+    # shop signals), and clients revalidate with ETag / If-Modified-Since for a 304.
+    qp = request.query_params
+    params = {key: qp.get(key) or None for key in directory.LOCATION_FILTERS}
+    params.update(cursor=qp.get('cursor'), limit=parse_limit(request))
+    try:
+        params['category'] = int(qp['category']) if qp.get('category') else None
+    except ValueError:
+        return Response({'detail': 'invalid category'}, status=status.HTTP_400_BAD_REQUEST)
 
+    def build():
+        page, next_cursor = directory.directory_page(params)
+        return {'shops': page, 'next': next_cursor}
 
-@api_view(['POST'])
-@permission_classes([IsAdminUser])
-def approve_shop(request, pk: int):
+    data, etag, last_modified = cached_page(directory.DIRECTORY_NAMESPACE, params, build)
+    return conditional_response(request, data, etag, last_modified)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search_shops(request):
+    qp = request.query_params
+    q = (qp.get('q') or '').strip()
+    if not q:
+        return Response({'detail': 'q required'}, status=status.HTTP_400_BAD_REQUEST)
+    filters = {key: qp.get(key) or None for key in directory.LOCATION_FILTERS}
+    try:
+        filters['category'] = int(qp['category']) if qp.get('category') else None
+    except ValueError:
+        return Response({'detail': 'invalid category'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = parse_limit(request)
+    try:
+        offset = max(0, int(qp.get('offset', 0)))
+    except ValueError:
+        offset = 0
+    rows, total = search.search_shops(q, filters, directory.DIRECTORY_FIELDS, limit, offset)
+    return Response({'results': rows, 'count': total})
+
+
+def _set_shop_status(pk, new_status):
     try:
         s = Shops.objects.get(pk=pk)
-        s.status = 'approved'
-        s.save(update_fields=['status']) # Note: updated_at is likely auto-updating
-        return Response({'ok': True})
     except Shops.DoesNotExist:
         return Response({'ok': False, 'error': 'not_found'}, status=404)
+    if s.status != new_status:
+        s.status = new_status
+        # post_save invalidates the public directory.
+        s.save(update_fields=['status']) # Note: updated_at is likely auto-updating
+    return Response({'ok': True})
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def approve_shop(request, pk: int):
+    return _set_shop_status(pk, 'approved')
 
 
 @api_view(['POST'])
 @permission_classes([IsAdminUser])
 def reject_shop(request, pk: int):
-    try:
-        s = Shops.objects.get(pk=pk)
-        s.status = 'rejected'
-        s.save(update_fields=['status'])
-        return Response({'ok': True})
-    except Shops.DoesNotExist:
-        return Response({'ok': False, 'error': 'not_found'}, status=404)
+    return _set_shop_status(pk, 'rejected')
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def my_shops(request):
-    # The decorator already ensures request.user is authenticated
-    qs = Shops.objects.filter(owner__keycloak_user_id=request.user.username) # Assuming keycloak_user_id matches username
+    # Shops the user owns or works in, from the cached permission set.
+    qs = Shops.objects.filter(pk__in=permissions.shop_ids(request.user.username))
     return Response(ShopSerializer(qs, many=True).data)
 
 
 @api_view(['GET'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, HasShopCapability])
 def my_shop_detail(request, pk: int):
-    # The decorator ensures user is authenticated
-    shop = get_object_or_404(Shops, pk=pk, owner__keycloak_user_id=request.user.username)
+    # HasShopCapability has already checked ownership / staff membership for pk.
+    shop = get_object_or_404(Shops, pk=pk)
     # CORRECTED: This now uses the ShopDetailSerializer which you must create
     serializer = ShopDetailSerializer(shop, context={'request': request})
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, HasShopCapability])
+def my_shop_dashboard(request, pk: int):
+    # One cached payload per shop (short TTL) instead of one call per dashboard widget.
+    data = dashboard.get_dashboard(pk, request)
+    if data is None:
+        return Response({'detail': 'not found'}, status=404)
+    return Response(data)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def submit_shop(request):
@@ -92,8 +159,56 @@ def submit_shop(request):
 # --- Views for Legacy Shop Models ---
 # NOTE: These views now correctly interact with the legacy ShopShop models.
 
+# Multipart files are hashed straight into content-addressed storage as they stream in.
+UPLOAD_PARSERS = [uploads.ContentAddressedMultiPartParser, FormParser, JSONParser]
+
+
+def _shop_content(shop, digest):
+    """Stored path of ``digest`` if this shop already references that content, else None.
+
+    Content is only reused by hash for its own shop, so a shop cannot attach
+    (or probe for) another shop's files by knowing their sha256.
+    """
+    prefix = uploads.content_prefix(digest)
+    if prefix is None:
+        return None
+    for model in (ShopShopdocument, ShopShopattachment):
+        path = model.objects.filter(shop=shop, file__startswith=prefix).values_list('file', flat=True).first()
+        if path:
+            return path
+    return None
+
+
+def _stored_upload(request, shop):
+    """(path, filename) for the request's file: multipart ``file``, a finished ``upload_id``, or known ``sha256``.
+
+    Raises UploadError for an unusable reference; returns (None, None) when nothing was sent.
+    """
+    file = request.FILES.get('file')
+    if isinstance(file, uploads.StoredUpload):
+        return file.path, file.name
+    if file:
+        path, _, _ = uploads.store_file(file)
+        return path, file.name
+    upload_id = request.data.get('upload_id')
+    if upload_id:
+        session = uploads.UploadSession.load(upload_id, shop.pk, request.user.pk)
+        if session is None:
+            raise uploads.UploadError('unknown upload_id')
+        path, _, _ = session.complete()
+        return path, session.meta['filename']
+    digest = request.data.get('sha256')
+    if digest:
+        path = _shop_content(shop, digest)
+        if path is None:
+            raise uploads.UploadError('no stored content with that sha256')
+        return path, request.data.get('filename') or ''
+    return None, None
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@parser_classes(UPLOAD_PARSERS)
 def upload_document(request, pk: int):
     user = request.user
     # CORRECTED: Fetches the legacy ShopShop model, not the new Shops model
@@ -101,36 +216,88 @@ def upload_document(request, pk: int):
     
     doc_type = request.data.get('doc_type') or request.data.get('type')
     number = request.data.get('number', '')
-    file = request.FILES.get('file')
-    
-    if not file or not doc_type:
+    if not doc_type:
+        return Response({'detail': 'file and doc_type are required'}, status=400)
+    try:
+        path, _ = _stored_upload(request, shop)
+    except uploads.UploadError as exc:
+        return Response({'detail': str(exc)}, status=400)
+    if not path:
         return Response({'detail': 'file and doc_type are required'}, status=400)
     
     # CORRECTED: Creates the correct legacy document model
-    doc = ShopShopdocument.objects.create(shop=shop, doc_type=doc_type, number=number, file=file)
+    doc = ShopShopdocument.objects.create(shop=shop, doc_type=doc_type, number=number, file=path,
+                                          uploaded_at=timezone.now())
     serializer = ShopDocumentSerializer(doc, context={'request': request})
     return Response(serializer.data, status=201)
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@parser_classes(UPLOAD_PARSERS)
 def upload_attachment(request, pk: int):
     user = request.user
     # CORRECTED: Fetches the legacy ShopShop model
     shop = get_object_or_404(ShopShop, pk=pk, owner=user)
     
-    file = request.FILES.get('file')
     name = request.data.get('name', '')
-    
-    if not file:
+    try:
+        path, filename = _stored_upload(request, shop)
+    except uploads.UploadError as exc:
+        return Response({'detail': str(exc)}, status=400)
+    if not path:
         return Response({'detail': 'file is required'}, status=400)
         
     # CORRECTED: Creates the correct legacy attachment model
-    att = ShopShopattachment.objects.create(shop=shop, file=file, name=name or getattr(file, 'name', ''))
+    att = ShopShopattachment.objects.create(shop=shop, file=path, name=name or filename,
+                                            uploaded_at=timezone.now())
     serializer = ShopAttachmentSerializer(att, context={'request': request})
     return Response(serializer.data, status=201)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def start_upload(request, pk: int):
+    # Step 1 of a resumable upload. If this shop already stores content with the
+    # client's sha256, it can skip straight to upload-document/attachment.
+    shop = get_object_or_404(ShopShop, pk=pk, owner=request.user)
+    filename = request.data.get('filename')
+    if not filename:
+        return Response({'detail': 'filename required'}, status=400)
+    if _shop_content(shop, request.data.get('sha256')):
+        return Response({'exists': True, 'sha256': request.data['sha256']})
+    try:
+        size = int(request.data['size']) if request.data.get('size') not in (None, '') else None
+        session = uploads.UploadSession.start(shop.pk, request.user.pk, filename, size)
+    except (TypeError, ValueError):
+        return Response({'detail': 'invalid size'}, status=400)
+    except uploads.UploadError as exc:
+        return Response({'detail': str(exc)}, status=400)
+    return Response({'upload_id': session.upload_id, 'offset': 0}, status=201)
+
+
+@api_view(['GET', 'PUT'])
+@permission_classes([IsAuthenticated])
+def upload_chunk(request, pk: int, upload_id: str):
+    # GET reports how many bytes the server has (to resume after a drop);
+    # PUT appends the raw request body at the Upload-Offset header's position.
+    shop = get_object_or_404(ShopShop, pk=pk, owner=request.user)
+    session = uploads.UploadSession.load(upload_id, shop.pk, request.user.pk)
+    if session is None:
+        return Response({'detail': 'not found'}, status=404)
+    if request.method == 'GET':
+        return Response({'upload_id': upload_id, 'offset': session.offset, 'size': session.meta['size']})
+    try:
+        offset = int(request.META.get('HTTP_UPLOAD_OFFSET', ''))
+    except ValueError:
+        return Response({'detail': 'Upload-Offset header required'}, status=400)
+    try:
+        new_offset = session.append(request.stream, offset)
+    except uploads.UploadError as exc:
+        return Response({'detail': str(exc), 'offset': session.offset}, status=409)
+    return Response({'upload_id': upload_id, 'offset': new_offset})
+
+
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def shop_detail_admin(request, pk: int):